@@ -8,9 +8,22 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 """
 
 import os
+import time
 
 from django.core.asgi import get_asgi_application
 
+_started_at = time.perf_counter()
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_asgi_application()
+
+# live stock updates are streamed by the ASGI worker itself
+from shop.stream import with_stock_stream  # noqa: E402
+
+application = with_stock_stream(application)
+
+# optional warm-up before the worker accepts traffic
+from app.startup import boot  # noqa: E402
+
+boot(_started_at)
@@ -0,0 +1,44 @@
+"""Shared helpers for the benchmark management commands of every app."""
+
+import time
+from contextlib import contextmanager
+
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+
+
+@contextmanager
+def benchmark_database():
+    """Run the benchmark against a throwaway test database."""
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def simulated_db_latency(seconds):
+    """Delay every query by `seconds`, on every thread's connection."""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install)
+    install(connection)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(install)
+        if delay in connection.execute_wrappers:
+            connection.execute_wrappers.remove(delay)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
@@ -0,0 +1,85 @@
+"""Middleware that only runs for some URL paths.
+
+The API authenticates with JWT and never reads the session, the CSRF token
+or messages; only the admin needs them. ``SessionStackMiddleware`` runs that
+stack for ``SESSION_MIDDLEWARE_PATHS`` and hands every other request straight
+to the next middleware.
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+
+class PathScopedMiddleware(MiddlewareMixin):
+    """Run ``middleware`` for requests under one of ``prefixes`` only.
+
+    The wrapped middleware must work in both sync and async mode, like
+    Django's own, and may only use ``process_view`` out of the view hooks.
+    """
+
+    middleware = ()
+    prefixes = ()
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        handler = get_response
+        self.instances = []
+        for path in reversed(self.middleware):
+            instance = import_string(path)(handler)
+            for hook in ('process_exception', 'process_template_response'):
+                if hasattr(instance, hook):
+                    raise ImproperlyConfigured(
+                        f"{path} can't be path scoped, it has {hook}().")
+            self.instances.insert(0, instance)
+            handler = instance
+        self.scoped = handler
+        self.view_hooks = [instance.process_view for instance in self.instances
+                           if hasattr(instance, 'process_view')]
+        if asyncio.iscoroutinefunction(get_response):
+            # skipped requests don't pay a thread switch for the hook
+            self.process_view = self._aprocess_view
+
+    def applies(self, request):
+        return request.path_info.startswith(tuple(self.prefixes))
+
+    def __call__(self, request):
+        # in async mode both handlers return a coroutine for the caller
+        if self.applies(request):
+            return self.scoped(request)
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.applies(request):
+            return None
+        for hook in self.view_hooks:
+            response = hook(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    async def _aprocess_view(self, request, *args):
+        if not self.applies(request):
+            return None
+        return await sync_to_async(
+            PathScopedMiddleware.process_view, thread_sensitive=True)(
+                self, request, *args)
+
+
+class SessionStackMiddleware(PathScopedMiddleware):
+    """Sessions, CSRF, authentication and messages for the admin only."""
+
+    middleware = (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    )
+
+    @property
+    def prefixes(self):
+        return settings.SESSION_MIDDLEWARE_PATHS
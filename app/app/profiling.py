@@ -0,0 +1,232 @@
+"""On-demand sampling profiler for API requests.
+
+A request is profiled when a staff user sends the ``X-Profile`` header, or at
+random for ``PROFILING_SAMPLE_RATE`` of the requests. A background thread
+then samples the stack of the request thread every ``PROFILING_INTERVAL``
+seconds, from the view's ``dispatch`` up, and counts the collapsed stacks
+(``caller;callee`` frames, the format flame graph tools read). The request
+itself runs untouched, so the overhead stays low enough for production.
+
+Profiles are JSON files in ``PROFILING_DIR``, shared by the workers of a
+host; only the newest ``PROFILING_MAX_PROFILES`` are kept. Staff download
+them and an aggregated flame graph per view action from ``/profile/``.
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from html import escape
+
+from django.conf import settings
+from rest_framework.views import APIView
+
+HEADER = 'HTTP_X_PROFILE'
+ROOT_CODE = APIView.dispatch.__code__
+PROFILE_ID = re.compile(r'^\d+-[0-9a-f]{8}$')
+
+
+class Sampler:
+    """Count the stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, interval, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+
+def collapse(frame):
+    """The stack of `frame` as `outer;...;inner`, from the view dispatch up."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        if code is ROOT_CODE:
+            break
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class ProfileStore:
+    """Profiles as JSON files in `directory`, the `max_profiles` newest."""
+
+    def __init__(self, directory, max_profiles):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, profile_id):
+        if not PROFILE_ID.match(profile_id):
+            raise KeyError(profile_id)
+        return os.path.join(self.directory, f'{profile_id}.json')
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # ids start with the time they were taken
+        return sorted((name[:-5] for name in names if name.endswith('.json')),
+                      key=lambda profile_id: int(profile_id.split('-')[0]))
+
+    def save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+        path = self._path(profile_id)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'id': profile_id, **profile}, file)
+        # readers never see a partly written profile
+        os.replace(f'{path}.tmp', path)
+        for old in self._ids()[:-self.max_profiles]:
+            try:
+                os.remove(self._path(old))
+            except FileNotFoundError:
+                # pruned by another worker
+                pass
+        return profile_id
+
+    def get(self, profile_id):
+        try:
+            with open(self._path(profile_id)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise KeyError(profile_id)
+
+    def profiles(self, view=None):
+        """The stored profiles, newest first, of `view` only if given."""
+        found = []
+        for profile_id in reversed(self._ids()):
+            try:
+                profile = self.get(profile_id)
+            except KeyError:
+                continue
+            if view is None or profile['view'] == view:
+                found.append(profile)
+        return found
+
+    def aggregate(self, view):
+        stacks = Counter()
+        for profile in self.profiles(view):
+            stacks.update(profile['stacks'])
+        return stacks
+
+
+def profile_store():
+    return ProfileStore(
+        settings.PROFILING_DIR, settings.PROFILING_MAX_PROFILES)
+
+
+def collapsed_text(stacks):
+    return ''.join(f'{stack} {count}\n'
+                   for stack, count in sorted(stacks.items()))
+
+
+def flamegraph_svg(stacks, title, width=1200, row_height=16):
+    """Render collapsed `stacks` as a flame graph, callers at the bottom."""
+    root = {'children': {}, 'count': 0}
+    for stack, count in stacks.items():
+        node = root
+        node['count'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(
+                name, {'children': {}, 'count': 0})
+            node['count'] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node['children'].values()),
+                       default=0)
+
+    height = (depth(root) + 1) * row_height
+    total = root['count'] or 1
+    rects = []
+
+    def draw(node, name, x, level):
+        w = width * node['count'] / total
+        y = height - (level + 1) * row_height
+        label = f'{name} ({node["count"]} samples, ' \
+                f'{100 * node["count"] / total:.1f}%)'
+        hue = 20 + zlib.crc32(name.encode()) % 40
+        rects.append(
+            f'<g><title>{escape(label)}</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" '
+            f'height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">'
+               f'{escape(name[:int(w / 7)])}</text>' if w > 35 else '')
+            + '</g>')
+        for child_name, child in sorted(node['children'].items()):
+            draw(child, child_name, x, level + 1)
+            x += width * child['count'] / total
+
+    x = 0
+    for name, child in sorted(root['children'].items()):
+        draw(child, name, x, 0)
+        x += width * child['count'] / total
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+        f'height="{height}" font-family="monospace" font-size="11">'
+        f'<text x="3" y="12">{escape(title)} ({root["count"]} samples)</text>'
+        + ''.join(rects) + '</svg>')
+
+
+class ProfilingMixin:
+    """Profile viewset requests asked for or sampled, see the module."""
+
+    sampler = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        requested = HEADER in request.META and request.user.is_staff
+        if requested or random.random() < settings.PROFILING_SAMPLE_RATE:
+            self.sampler = Sampler(settings.PROFILING_INTERVAL).start()
+            self.profile_requested = requested
+
+    def dispatch(self, request, *args, **kwargs):
+        response = None
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            return response
+        finally:
+            # stopped when the view raises too, the thread outlives it else
+            if self.sampler is not None:
+                self._save_profile(self.request, response)
+
+    def _save_profile(self, request, response):
+        sampler, self.sampler = self.sampler.stop(), None
+        profile_id = profile_store().save({
+            'view': request.resolver_match.url_name,
+            'method': request.method,
+            'path': request.get_full_path(),
+            # an exception left unhandled is a server error
+            'status': 500 if response is None else response.status_code,
+            'duration': sampler.duration,
+            'interval': sampler.interval,
+            'samples': sum(sampler.stacks.values()),
+            'taken_at': time.time(),
+            'stacks': sampler.stacks,
+        })
+        if self.profile_requested and response is not None:
+            response['X-Profile-Id'] = profile_id
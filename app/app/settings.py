@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import environ
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -81,7 +82,11 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # refuses revoked tokens and revokes rotated ones, see core.revocation
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.TokenRefreshSerializer',
 }
+# shop settings: a SHOP dict overrides the defaults in shop/conf.py
+
 # swagger settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -98,16 +103,43 @@ SWAGGER_SETTINGS = {
     'SECURITY_REQUIREMENTS': [{'Bearer': []}],
 }
 
+# worker boot settings
+# warm URL patterns, serializer fields and caches before serving traffic
+STARTUP_WARMUP = env.bool("DJANGO_STARTUP_WARMUP", default=False)
+# seconds a worker may take from import to ready before a warning is logged
+STARTUP_BUDGET = env.float("DJANGO_STARTUP_BUDGET", default=2.0)
+
+# request profiling, see app.profiling
+# fraction of API requests profiled without an X-Profile header
+PROFILING_SAMPLE_RATE = env.float("DJANGO_PROFILING_SAMPLE_RATE", default=0.0)
+# seconds between two stack samples
+PROFILING_INTERVAL = 0.005
+PROFILING_DIR = env.str("DJANGO_PROFILING_DIR",
+                        default=str(Path(tempfile.gettempdir()) / "app-profiles"))
+PROFILING_MAX_PROFILES = 200
+
+# per-process Bloom filter of revoked refresh tokens, see core.revocation
+TOKEN_REVOCATION_CAPACITY = 100000
+TOKEN_REVOCATION_ERROR_RATE = 0.001
+# seconds before a revocation made by another process is seen
+TOKEN_REVOCATION_SYNC_INTERVAL = 5
+# seconds between rebuilds dropping expired tokens from the filter
+TOKEN_REVOCATION_REBUILD_INTERVAL = 60 * 60
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    # sessions, CSRF, auth and messages, under SESSION_MIDDLEWARE_PATHS only
+    'app.middleware.SessionStackMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# the API authenticates with JWT, only the admin uses sessions
+SESSION_MIDDLEWARE_PATHS = ['/admin/']
+
+# the admin's middleware is in SessionStackMiddleware
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'app.urls'
 
 TEMPLATES = [
@@ -141,6 +173,13 @@ DATABASES = {
 }
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
 
+# Cache
+# per worker by default, idempotency keys are claimed in the database too;
+# point CACHE_URL at redis/memcached to share what they cache
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
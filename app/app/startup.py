@@ -0,0 +1,112 @@
+"""Helpers that keep worker boot cheap and optionally warm it up.
+
+Rarely used parts of the stack (the API docs for instance) are wrapped in
+``lazy_view`` so they are only imported on their first request. ``warm_up``
+pre-resolves everything a worker would otherwise build on its first request
+and checks the measured boot time against ``STARTUP_BUDGET``.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+
+logger = logging.getLogger(__name__)
+
+
+def lazy_view(factory):
+    """Return a view building the real view with ``factory`` on first use."""
+    view = None
+
+    @csrf_exempt
+    def wrapper(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = factory()
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _resolve_urls():
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    # populating the reverse dict walks and compiles every pattern
+    return len(resolver.reverse_dict)
+
+
+def _serializer_fields():
+    from rest_framework import serializers
+    from shop.views import router
+
+    count = 0
+    for _, viewset, _ in router.registry:
+        serializer_class = getattr(viewset, 'serializer_class', None)
+        if serializer_class is None:
+            continue
+        serializer = serializer_class(context={'request': None})
+        if isinstance(serializer, serializers.Serializer):
+            count += len(serializer.fields)
+    return count
+
+
+def _caches():
+    from django.core.cache import caches
+
+    for alias in settings.CACHES:
+        caches[alias].get('startup:warm-up')
+    return len(settings.CACHES)
+
+
+def _autocomplete():
+    from shop.autocomplete import autocomplete
+
+    return len(autocomplete.build())
+
+
+WARM_UP_STEPS = (
+    ('urls', _resolve_urls),
+    ('serializer_fields', _serializer_fields),
+    ('caches', _caches),
+    ('autocomplete', _autocomplete),
+)
+
+
+def warm_up(started_at=None, budget=None):
+    """Run every warm-up step and report how long the boot took.
+
+    ``started_at`` is a ``time.perf_counter()`` value taken when the worker
+    started importing; when omitted only the warm-up itself is measured.
+    """
+    if budget is None:
+        budget = settings.STARTUP_BUDGET
+    begin = time.perf_counter()
+    if started_at is None:
+        started_at = begin
+
+    timings = {}
+    for name, step in WARM_UP_STEPS:
+        step_start = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - step_start
+
+    report = {
+        'steps': timings,
+        'warm_up': time.perf_counter() - begin,
+        'boot': time.perf_counter() - started_at,
+        'budget': budget,
+    }
+    report['within_budget'] = report['boot'] <= budget
+    if not report['within_budget']:
+        logger.warning("Worker boot took %.3fs, over the %.3fs budget",
+                       report['boot'], budget)
+    return report
+
+
+def boot(started_at):
+    """Warm the worker up if ``STARTUP_WARMUP`` is enabled."""
+    if settings.STARTUP_WARMUP:
+        return warm_up(started_at)
+    return None
@@ -13,6 +13,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from functools import lru_cache
+
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import (
@@ -20,29 +22,39 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Swagger E-commerce API",
-        default_version='v1',
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
+
+from app.startup import lazy_view
+from core.views import TokenRevokeView
+
+
+@lru_cache(maxsize=None)
+def get_schema_view():
+    # drf_yasg is heavy to import, build the docs only when first requested
+    from drf_yasg.views import get_schema_view
+    from drf_yasg import openapi
+
+    return get_schema_view(
+        openapi.Info(
+            title="Swagger E-commerce API",
+            default_version='v1',
+        ),
+        public=True,
+        permission_classes=[permissions.AllowAny],
+    )
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
 
-    path('', schema_view.with_ui('swagger', cache_timeout=0),
-         name='schema-swagger-ui'),
-    path('api/api.json', schema_view.without_ui(cache_timeout=0),
-         name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc',
-         cache_timeout=0), name='schema-redoc'),
+    path('', lazy_view(lambda: get_schema_view().with_ui(
+        'swagger', cache_timeout=0)), name='schema-swagger-ui'),
+    path('api/api.json', lazy_view(lambda: get_schema_view().without_ui(
+        cache_timeout=0)), name='schema-swagger-ui'),
+    path('redoc/', lazy_view(lambda: get_schema_view().with_ui(
+        'redoc', cache_timeout=0)), name='schema-redoc'),
 ]
 
 # app urls
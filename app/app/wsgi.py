@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
+_started_at = time.perf_counter()
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
 application = get_wsgi_application()
+
+# optional warm-up before the worker accepts traffic
+from app.startup import boot  # noqa: E402
+
+boot(_started_at)
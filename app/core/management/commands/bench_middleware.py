@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from app.benchmark import benchmark_database, percentile
+
+# MIDDLEWARE before the session stack was scoped to the admin
+FULL_STACK = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+
+class Command(BaseCommand):
+    help = ("Measure the per-request overhead of the full middleware stack "
+            "and of MIDDLEWARE on an API request that runs no query.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000,
+                            help="Requests per stack.")
+        parser.add_argument('--path', default='/product/bulk/?ids=',
+                            help="API path requested.")
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        # a browser that also has an admin session
+        cookies = ('sessionid=abcdefghijklmnopqrstuvwxyz012345; '
+                   'csrftoken=ABCDEFGHIJKLMNOPQRSTUVWXYZ012345')
+        with benchmark_database():
+            handlers = {}
+            for label, stack in (('full', FULL_STACK),
+                                 ('scoped', settings.MIDDLEWARE)):
+                with override_settings(MIDDLEWARE=stack):
+                    handlers[label] = BaseHandler()
+                    handlers[label].load_middleware()
+            timings = {label: [] for label in handlers}
+            for i in range(options['requests'] + 100):
+                # alternate the stacks so both run in the same conditions,
+                # the first requests only warm up
+                for label, handler in handlers.items():
+                    request = factory.get(options['path'], HTTP_COOKIE=cookies)
+                    started = time.perf_counter()
+                    response = handler.get_response(request)
+                    elapsed = time.perf_counter() - started
+                    assert response.status_code == 200, response.status_code
+                    if i >= 100:
+                        timings[label].append(elapsed)
+
+        for label, values in timings.items():
+            self.stdout.write(
+                f"{label:>6}: mean={sum(values) / len(values) * 1e6:7.1f} us  "
+                f"p50={percentile(values, 0.5) * 1e6:7.1f} us  "
+                f"p99={percentile(values, 0.99) * 1e6:7.1f} us")
+        saved = percentile(timings['full'], 0.5) - \
+            percentile(timings['scoped'], 0.5)
+        self.stdout.write(f"saved: {saved * 1e6:.1f} us per request (p50)")
@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app.benchmark import (
+    benchmark_database, percentile, simulated_db_latency,
+)
+from core import revocation
+from core.models import RevokedToken, User
+
+
+class DatabaseCheck:
+    """Stands in for the filter: every refresh checks the database."""
+
+    def might_contain(self, jti):
+        return True
+
+    def add(self, jti):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Compare /api/token/refresh/ throughput when revoked tokens are "
+            "checked through the in-memory filter and in the database on "
+            "every refresh, with simulated database latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help="Refreshes per run.")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Concurrent sync workers.")
+        parser.add_argument('--revoked', type=int, default=20000,
+                            help="Revoked tokens in the table.")
+        parser.add_argument('--db-latency', type=float, default=2,
+                            help="Milliseconds added to every query.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = User.objects.create_user(
+                email='bench@example.com', password='bench-password')
+            expires_at = timezone.now() + timedelta(days=1)
+            RevokedToken.objects.bulk_create(
+                (RevokedToken(jti=f'revoked-{i}', expires_at=expires_at)
+                 for i in range(options['revoked'])), batch_size=5000)
+
+            filter_ = revocation.token_filter
+            with simulated_db_latency(options['db_latency'] / 1000):
+                for label, token_filter in (('database', DatabaseCheck()),
+                                            ('filter', filter_)):
+                    revocation.token_filter = token_filter
+                    tokens = [str(RefreshToken.for_user(user))
+                              for _ in range(options['requests'])]
+                    # the filter is built on the first refresh of a process
+                    self.worker([tokens.pop()])
+                    workers = options['workers']
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(workers) as pool:
+                        latencies = [latency for run in pool.map(
+                            self.worker, [tokens[i::workers]
+                                          for i in range(workers)])
+                                     for latency in run]
+                    self.report(label, latencies,
+                                time.perf_counter() - started)
+            revocation.token_filter = filter_
+
+    def refresh(self, token):
+        started = time.perf_counter()
+        response = Client().post('/api/token/refresh/', {'refresh': token})
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - started
+
+    def worker(self, tokens):
+        # one persistent connection per worker, like CONN_MAX_AGE
+        try:
+            return [self.refresh(token) for token in tokens]
+        finally:
+            connection.close()
+
+    def report(self, label, latencies, elapsed):
+        self.stdout.write(
+            f"{label:>8}: {len(latencies) / elapsed:8.1f} refreshes/s  "
+            f"p50={percentile(latencies, 0.5) * 1000:6.1f} ms  "
+            f"p99={percentile(latencies, 0.99) * 1000:6.1f} ms")
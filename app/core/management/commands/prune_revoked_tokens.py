@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.revocation import prune
+
+
+class Command(BaseCommand):
+    help = ("Delete revoked refresh tokens that have expired anyway. Run it "
+            "periodically, e.g. daily from cron.")
+
+    def handle(self, *args, **options):
+        deleted = prune()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} expired revoked tokens."))
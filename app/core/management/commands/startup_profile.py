@@ -0,0 +1,86 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_LINE = re.compile(
+    r'^import time:\s+(?P<self>\d+)\s+\|\s+(?P<cumulative>\d+)\s+\|'
+    r'(?P<depth>\s+)(?P<module>\S+)$')
+
+BOOT_SCRIPT = """
+import time
+started_at = time.perf_counter()
+import django
+django.setup()
+import {urlconf}
+if {warm_up}:
+    from app.startup import warm_up
+    warm_up(started_at)
+print('boot %f' % (time.perf_counter() - started_at))
+"""
+
+
+def parse_importtime(output):
+    """Parse ``python -X importtime`` output into a list of module rows."""
+    rows = []
+    for line in output.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            rows.append({
+                'module': match['module'],
+                'self': int(match['self']),
+                'cumulative': int(match['cumulative']),
+                # importtime indents nested imports by two spaces per level
+                'depth': (len(match['depth']) - 1) // 2,
+            })
+    return rows
+
+
+class Command(BaseCommand):
+    help = ("Profile worker boot with python -X importtime and report the "
+            "slowest imports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25,
+                            help="Number of modules to show.")
+        parser.add_argument('--sort', choices=['cumulative', 'self'],
+                            default='cumulative')
+        parser.add_argument(
+            '--top-level', action='store_true',
+            help="Only show packages imported directly by the boot.")
+        parser.add_argument('--warm-up', action='store_true',
+                            help="Run the warm-up hook as part of the boot.")
+
+    def handle(self, *args, **options):
+        script = BOOT_SCRIPT.format(urlconf=settings.ROOT_URLCONF,
+                                    warm_up=options['warm_up'])
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            capture_output=True, text=True, env=env, cwd=settings.BASE_DIR)
+        if result.returncode:
+            # the traceback, without the import times written before it
+            error = '\n'.join(line for line in result.stderr.splitlines()
+                              if not line.startswith('import time:'))
+            raise CommandError(f"The boot failed:\n{error}")
+
+        rows = parse_importtime(result.stderr)
+        if options['top_level']:
+            rows = [row for row in rows if row['depth'] == 0]
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        self.stdout.write(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+        for row in rows[:options['limit']]:
+            self.stdout.write(
+                f"{row['self'] / 1000:>10.1f} "
+                f"{row['cumulative'] / 1000:>16.1f}  {row['module']}")
+
+        boot = float(result.stdout.split()[-1])
+        budget = settings.STARTUP_BUDGET
+        style = self.style.SUCCESS if boot <= budget else self.style.WARNING
+        self.stdout.write(style(
+            f"Boot took {boot:.3f}s (budget {budget:.3f}s)"))
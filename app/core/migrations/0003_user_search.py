@@ -0,0 +1,89 @@
+# Generated by Django 4.0.1 on 2026-10-19 16:31
+
+from django.db import DatabaseError, migrations, models, transaction
+import django.utils.timezone
+
+# lookups the indexes serve, see core.filters.UserSearchFilter
+POSTGRES_INDEXES = [
+    # email__istartswith compiles to UPPER(email::text) LIKE 'X%'
+    'CREATE INDEX core_user_email_prefix ON core_user '
+    '(UPPER(email::text) text_pattern_ops)',
+]
+POSTGRES_TRIGRAM_INDEXES = [
+    # and name__icontains to UPPER(name::text) LIKE '%X%'
+    'CREATE INDEX core_user_name_trigram ON core_user '
+    'USING gin (UPPER(name::text) gin_trgm_ops)',
+]
+SQLITE_INDEXES = [
+    # LIKE is case-insensitive and can use a NOCASE index for prefixes
+    'CREATE INDEX core_user_email_prefix ON core_user (email COLLATE NOCASE)',
+]
+
+
+def create_trigram_extension(schema_editor):
+    # creating an extension may need privileges the migrating role lacks,
+    # names are then searched without the trigram index
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        return False
+    return True
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_INDEXES
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_available_extensions "
+                           "WHERE name = 'pg_trgm'")
+            available = cursor.fetchone() is not None
+        if available and create_trigram_extension(schema_editor):
+            statements = statements + POSTGRES_TRIGRAM_INDEXES
+    elif vendor == 'sqlite':
+        statements = SQLITE_INDEXES
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    for name in ('core_user_email_prefix', 'core_user_name_trigram'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_revoked_tokens'),
+    ]
+
+    operations = [
+        # existing users are left without a join date, the default only
+        # applies to the users created from now on
+        migrations.AddField(
+            model_name='user',
+            name='date_joined',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='date_joined',
+            field=models.DateTimeField(default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='core_user_joined'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_staff', True)), fields=['email'], name='core_user_staff'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', False)), fields=['email'], name='core_user_inactive'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
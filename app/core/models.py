@@ -1,11 +1,11 @@
 """Create and manage app models and methods."""
 
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 
-from shop.models import Order
+from shop.models import ArchivedOrder, Order
 # Create your models here.
 
 
@@ -39,20 +39,56 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # unknown for the users created before it was recorded
+    date_joined = models.DateTimeField(default=timezone.now, null=True)
 
     objects = UserManager()
 
     USERNAME_FIELD = 'email'
 
+    class Meta:
+        # the search indexes are created by migration 0003, their SQL
+        # depends on the database
+        indexes = [
+            models.Index(fields=['date_joined', 'id'],
+                         name='core_user_joined'),
+            # staff and deactivated users are few, index just them
+            models.Index(fields=['email'], condition=models.Q(is_staff=True),
+                         name='core_user_staff'),
+            models.Index(fields=['email'], condition=models.Q(is_active=False),
+                         name='core_user_inactive'),
+        ]
+
     def get_user_order_history(self):
 
         return Order.objects.filter(
             user=self).prefetch_related(
                 "products").order_by("created_at", "updated_at")
 
+    def get_archived_order_history(self):
+        # a separate table, items are stored with each order
+        return ArchivedOrder.objects.filter(
+            user=self).order_by("created_at", "updated_at")
+
     def tokens(self):
+        # imported lazily, only login and token views need simplejwt
+        from rest_framework_simplejwt.tokens import RefreshToken
+
         refresh = RefreshToken.for_user(self)
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token)
         }
+
+
+class RevokedToken(models.Model):
+    """A refresh token id revoked before it expires, see core.revocation."""
+
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # spent by a refresh, its reuse is caught by the unique jti
+    rotated = models.BooleanField(default=False)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,160 @@
+"""Revocation of refresh tokens.
+
+Revoked token ids (JTIs) are stored in `RevokedToken` until the token would
+have expired. Each process answers "is this token revoked?" from an in-memory
+Bloom filter of those ids, so refreshing a token that was never revoked costs
+no query besides the periodic sync below; only a hit, revoked or a false
+positive, is confirmed in the database.
+
+Tokens spent by a rotating refresh are stored too but stay out of the
+filters: the refresh inserts their id, and the unique constraint on it
+refuses a second refresh with the same token, concurrent or not. Only
+explicit revocations, rare, go through the filters.
+
+A revocation is added to the filter of the process that made it at once.
+The others learn of it from the database: every
+`TOKEN_REVOCATION_SYNC_INTERVAL` seconds a refresh reads the rows revoked
+since the previous sync, one indexed query whatever the cache backend, and
+every `TOKEN_REVOCATION_REBUILD_INTERVAL` seconds the filter is rebuilt from
+the unexpired rows only, which drops expired tokens and resizes it.
+`manage.py prune_revoked_tokens` deletes the expired rows.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone as django_timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+# rows revoked this long before a sync are read again by the next one, in
+# case their transaction committed after it
+SYNC_OVERLAP = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """A fixed size Bloom filter of strings."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        # double hashing, k positions out of two 64 bit hashes
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+
+class RevocationFilter:
+    """The per-process filter of revoked token ids."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._synced_at = None
+        self._sync_at = 0
+        self._rebuild_at = 0
+
+    def _rebuild(self, now):
+        rows = list(RevokedToken.objects.filter(
+            expires_at__gt=now, rotated=False).values_list('jti', flat=True))
+        bloom = BloomFilter(
+            max(settings.TOKEN_REVOCATION_CAPACITY, 2 * len(rows)),
+            settings.TOKEN_REVOCATION_ERROR_RATE)
+        for jti in rows:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._rebuild_at = time.monotonic() + \
+            settings.TOKEN_REVOCATION_REBUILD_INTERVAL
+
+    def _add_since(self, since):
+        for jti in (RevokedToken.objects.filter(
+                revoked_at__gte=since, rotated=False)
+                .values_list('jti', flat=True)):
+            self._bloom.add(jti)
+
+    def sync(self):
+        if time.monotonic() < self._sync_at:
+            return
+        with self._lock:
+            if time.monotonic() < self._sync_at:
+                # synced by another thread meanwhile
+                return
+            now = django_timezone.now()
+            if self._bloom is None or time.monotonic() >= self._rebuild_at \
+                    or self._bloom.count > self._bloom.capacity:
+                self._rebuild(now)
+            else:
+                self._add_since(self._synced_at - SYNC_OVERLAP)
+            self._synced_at = now
+            self._sync_at = time.monotonic() + \
+                settings.TOKEN_REVOCATION_SYNC_INTERVAL
+
+    def might_contain(self, jti):
+        self.sync()
+        return jti in self._bloom
+
+    def add(self, jti):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def reset(self):
+        with self._lock:
+            self.__init__()
+
+
+token_filter = RevocationFilter()
+
+
+def is_revoked(jti):
+    if not token_filter.might_contain(jti):
+        return False
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def revoke(token, rotated=False):
+    """
+    Revoke the refresh `token`, `rotated` when a refresh spent it. Returns
+    False if it was already revoked, so concurrent refreshes of the same
+    token can't both succeed.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    expires_at = datetime.fromtimestamp(token['exp'], tz=timezone.utc)
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(
+                jti=jti, expires_at=expires_at, rotated=rotated)
+    except IntegrityError:
+        return False
+    if not rotated:
+        token_filter.add(jti)
+    return True
+
+
+def prune(now=None):
+    """Delete the revoked tokens that have expired anyway."""
+    deleted, _ = RevokedToken.objects.filter(
+        expires_at__lte=now or django_timezone.now()).delete()
+    return deleted
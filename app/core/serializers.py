@@ -1,6 +1,12 @@
 from rest_framework import serializers
 from django.contrib import auth
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import is_revoked, revoke
 
 User = auth.get_user_model()
 
@@ -10,8 +16,8 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = User
         fields = ['url', 'id', 'email', 'name',
-                  'is_active', 'is_staff', 'password']
-        read_only_fields = ['is_staff', 'is_superuser']
+                  'is_active', 'is_staff', 'date_joined', 'password']
+        read_only_fields = ['is_staff', 'is_superuser', 'date_joined']
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
@@ -47,3 +53,35 @@ class LoginSerializer(serializers.ModelSerializer):
                 raise AuthenticationFailed('Invalid credentials, try again')
             attrs['user'] = user
             return attrs
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """Refresh serializer refusing revoked tokens and revoking rotated ones."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_revoked(refresh[api_settings.JTI_CLAIM]):
+            raise InvalidToken('Token is revoked')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # a rotated token is spent, a concurrent refresh with it loses
+            if not revoke(refresh, rotated=True):
+                raise InvalidToken('Token is revoked')
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data['refresh'] = str(refresh)
+
+        return data
+
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField(write_only=True)
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        revoke(refresh)
+        return {}
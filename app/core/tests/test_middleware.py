@@ -0,0 +1,64 @@
+"""Tests for the path scoped session middleware."""
+
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase
+
+from app.middleware import SessionStackMiddleware
+
+
+class SessionStackMiddlewareTests(TestCase):
+    """Test the session stack only runs for the admin."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.seen = []
+
+    def view(self, request):
+        self.seen.append(request)
+        return HttpResponse()
+
+    def test_api_requests_skip_the_stack(self):
+        middleware = SessionStackMiddleware(self.view)
+        request = self.factory.get('/product/', HTTP_COOKIE='sessionid=abc')
+        self.assertIsNone(middleware.process_view(request, self.view, (), {}))
+        middleware(request)
+        self.assertFalse(hasattr(self.seen[0], 'session'))
+        self.assertFalse(hasattr(self.seen[0], 'user'))
+
+    def test_admin_requests_run_the_stack(self):
+        middleware = SessionStackMiddleware(self.view)
+        middleware(self.factory.get('/admin/'))
+        self.assertTrue(hasattr(self.seen[0], 'session'))
+        self.assertTrue(hasattr(self.seen[0], '_messages'))
+
+    def test_admin_keeps_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        response = client.post('/admin/login/', {
+            'username': 'admin@test.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_login(self):
+        user = get_user_model().objects.create_superuser(
+            'admin@test.com', 'password123')
+        user.save()
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/admin/').status_code, 200)
+
+    def test_async_mode(self):
+        async def view(request):
+            self.seen.append(request)
+            return HttpResponse()
+
+        middleware = SessionStackMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware.process_view))
+        for path in ('/product/', '/admin/'):
+            request = self.factory.get(path)
+            self.assertIsNone(async_to_sync(middleware.process_view)(
+                request, view, (), {}))
+            async_to_sync(middleware)(request)
+        self.assertEqual([hasattr(r, 'session') for r in self.seen],
+                         [False, True])
@@ -0,0 +1,137 @@
+"""Tests for the request sampling profiler and its endpoints."""
+
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from app.profiling import (
+    ProfileStore, Sampler, collapsed_text, flamegraph_svg, profile_store,
+)
+
+User = get_user_model()
+
+
+def busy(seconds):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+class SamplerTests(TestCase):
+    """Test stacks are sampled and rendered."""
+
+    def test_samples_the_thread(self):
+        sampler = Sampler(0.001).start()
+        busy(0.05)
+        sampler.stop()
+        self.assertGreater(sum(sampler.stacks.values()), 5)
+        stack = sampler.stacks.most_common(1)[0][0]
+        self.assertTrue(stack.endswith(f'{__name__}:busy'))
+        self.assertIn(f'{__name__}:test_samples_the_thread;', stack)
+
+    def test_collapsed_text_and_flamegraph(self):
+        stacks = {'a;b': 3, 'a;c<d>': 1}
+        self.assertEqual(collapsed_text(stacks), 'a;b 3\na;c<d> 1\n')
+        svg = flamegraph_svg(stacks, 'product-list', width=400)
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertIn('product-list (4 samples)', svg)
+        self.assertIn('<title>a (4 samples, 100.0%)</title>', svg)
+        self.assertIn('<title>c&lt;d&gt; (1 samples, 25.0%)</title>', svg)
+
+
+class ProfileStoreTests(TestCase):
+    """Test the store keeps the newest profiles only."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(self.directory.name, max_profiles=2)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_keeps_the_newest(self):
+        ids = [self.store.save({'view': view, 'stacks': {'a;b': 1}})
+               for view in ('first', 'second', 'second')]
+        self.assertEqual([p['id'] for p in self.store.profiles()],
+                         ids[:0:-1])
+        with self.assertRaises(KeyError):
+            self.store.get(ids[0])
+        self.assertEqual(self.store.aggregate('second'), {'a;b': 2})
+
+    def test_rejects_other_paths(self):
+        with self.assertRaises(KeyError):
+            self.store.get('../settings')
+
+
+class ProfiledRequestTests(TestCase):
+    """Test which requests are profiled and how staff read the profiles."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            PROFILING_DIR=self.directory.name, PROFILING_INTERVAL=0.001)
+        self.settings.enable()
+        self.user = User.objects.create_user(
+            email='user@email.com', password='testpass')
+        self.staff = User.objects.create_superuser(
+            email='admin@email.com', password='testpass')
+        self.staff.is_staff = True
+        self.staff.save()
+        self.client = APIClient()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def test_staff_asks_with_the_header(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/user/order-history/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        profile = profile_store().get(response['X-Profile-Id'])
+        self.assertEqual((profile['view'], profile['status']),
+                         ('user-user-order-history', 200))
+
+        response = self.client.get('/profile/')
+        self.assertEqual([p['id'] for p in response.data], [profile['id']])
+        self.assertNotIn('stacks', response.data[0])
+        response = self.client.get(f"/profile/{profile['id']}/")
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.content.decode(),
+                         collapsed_text(profile['stacks']))
+        response = self.client.get(
+            '/profile/flamegraph/', {'view': 'user-user-order-history'})
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertEqual(self.client.get('/profile/flamegraph/').status_code,
+                         400)
+        self.assertEqual(self.client.get('/profile/1-0/').status_code, 404)
+
+    def test_header_is_ignored_for_other_users(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/user/order-history/', HTTP_X_PROFILE='1')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(profile_store().profiles(), [])
+        self.assertEqual(self.client.get('/profile/').status_code, 403)
+
+    def test_sampled_requests(self):
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            response = self.client.get('/product/')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual([p['view'] for p in profile_store().profiles()],
+                         ['product-list'])
+
+    def test_requests_raising_are_profiled(self):
+        self.client.force_authenticate(self.staff)
+        threads = threading.active_count()
+        with mock.patch('core.views.UserViewSet.user_order_history',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.get('/user/order-history/', HTTP_X_PROFILE='1')
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(
+            [(p['view'], p['status']) for p in profile_store().profiles()],
+            [('user-user-order-history', 500)])
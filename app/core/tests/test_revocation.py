@@ -0,0 +1,109 @@
+"""Tests for refresh token revocation."""
+
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.models import RevokedToken
+from core.revocation import BloomFilter, token_filter
+
+
+class BloomFilterTests(TestCase):
+    """Test the filter behind revocation checks."""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'key-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'key-{i}')
+        hits = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(hits, 300)
+
+
+class TokenRevocationTests(TestCase):
+    """Test revoked refresh tokens are refused."""
+
+    def setUp(self):
+        token_filter.reset()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com', 'testpassword123')
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': str(token)})
+
+    def revoked_queries(self, context):
+        return [q['sql'] for q in context.captured_queries
+                if q['sql'].startswith('SELECT')
+                and 'core_revokedtoken' in q['sql']]
+
+    def test_rotated_token_is_refused(self):
+        token = RefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertEqual(
+            self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_refresh_checks_the_filter_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.refresh(RefreshToken.for_user(self.user))
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as context:
+            for _ in range(3):
+                self.assertEqual(self.refresh(
+                    RefreshToken.for_user(self.user)).status_code, 200)
+        # rotations don't make the other processes resync
+        self.assertEqual(self.revoked_queries(context), [])
+
+    def test_revoke_endpoint(self):
+        token = RefreshToken.for_user(self.user)
+        response = self.client.post(
+            '/api/token/revoke/', {'refresh': str(token)})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_revocations_of_other_processes_are_seen(self):
+        token = RefreshToken.for_user(self.user)
+        self.refresh(RefreshToken.for_user(self.user))
+        # revoked by another process, only in the database
+        RevokedToken.objects.create(
+            jti=token['jti'], expires_at=timezone.now() + timedelta(days=1))
+        with override_settings(TOKEN_REVOCATION_SYNC_INTERVAL=0):
+            self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_synced_once_per_interval(self):
+        self.refresh(RefreshToken.for_user(self.user))
+        with CaptureQueriesContext(connection) as context:
+            self.refresh(RefreshToken.for_user(self.user))
+        self.assertEqual(self.revoked_queries(context), [])
+        token_filter._sync_at = 0
+        with CaptureQueriesContext(connection) as context:
+            self.refresh(RefreshToken.for_user(self.user))
+        self.assertEqual(len(self.revoked_queries(context)), 1)
+
+    def test_rebuild_drops_expired_tokens(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='expired', expires_at=now)
+        RevokedToken.objects.create(
+            jti='active', expires_at=now + timedelta(days=1))
+        token_filter.sync()
+        self.assertTrue(token_filter.might_contain('active'))
+        self.assertFalse(token_filter.might_contain('expired'))
+
+        call_command('prune_revoked_tokens', stdout=StringIO())
+        self.assertEqual(
+            list(RevokedToken.objects.values_list('jti', flat=True)),
+            ['active'])
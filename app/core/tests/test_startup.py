@@ -0,0 +1,81 @@
+"""Tests for worker boot helpers and the startup profile command."""
+
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+
+from app.startup import lazy_view, warm_up
+from core.management.commands.startup_profile import parse_importtime
+from shop.autocomplete import autocomplete
+
+
+class LazyViewTests(TestCase):
+    """Test views are built on first request only."""
+
+    def test_factory_called_once(self):
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return lambda request: 'response'
+
+        view = lazy_view(factory)
+        self.assertEqual(calls, [])
+        self.assertEqual(view(None), 'response')
+        self.assertEqual(view(None), 'response')
+        self.assertEqual(len(calls), 1)
+
+    def test_schema_view_still_served(self):
+        response = self.client.get('/api/api.json')
+        self.assertEqual(response.status_code, 200)
+
+
+class WarmUpTests(TestCase):
+    """Test the warm-up hook measures boot against the budget."""
+
+    def tearDown(self):
+        # built from this test's rolled back catalog
+        autocomplete.reset()
+
+    def test_warm_up_reports_steps(self):
+        report = warm_up()
+        self.assertEqual(
+            set(report['steps']),
+            {'urls', 'serializer_fields', 'caches', 'autocomplete'})
+        self.assertTrue(report['within_budget'])
+
+    @override_settings(STARTUP_BUDGET=0)
+    def test_warm_up_over_budget(self):
+        with self.assertLogs('app.startup', level='WARNING'):
+            report = warm_up()
+        self.assertFalse(report['within_budget'])
+
+
+class StartupProfileTests(TestCase):
+    """Test the import time report."""
+
+    def test_parse_importtime(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   encodings.aliases\n"
+            "import time:      2497 |       2617 | shop.views\n"
+        )
+        rows = parse_importtime(output)
+        self.assertEqual(rows[0]['depth'], 1)
+        self.assertEqual(rows[1], {'module': 'shop.views', 'self': 2497,
+                                   'cumulative': 2617, 'depth': 0})
+
+    def test_command_does_not_import_docs(self):
+        out = StringIO()
+        call_command('startup_profile', limit=1000, stdout=out)
+        self.assertIn('Boot took', out.getvalue())
+        self.assertNotIn('drf_yasg.views', out.getvalue())
+
+    @override_settings(ROOT_URLCONF='missing_urls')
+    def test_command_fails_with_the_boot(self):
+        with self.assertRaises(CommandError) as context:
+            call_command('startup_profile', stdout=StringIO())
+        self.assertIn("No module named 'missing_urls'",
+                      str(context.exception))
+        self.assertNotIn('import time:', str(context.exception))
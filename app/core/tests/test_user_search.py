@@ -0,0 +1,121 @@
+"""Tests for the indexed user search and directory filters."""
+
+from datetime import datetime, timezone
+from importlib import import_module
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import ProgrammingError, connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.filters import UserSearchFilter
+
+User = get_user_model()
+
+
+def joined(day):
+    return datetime(2026, 1, day, 12, tzinfo=timezone.utc)
+
+
+class UserSearchTests(TestCase):
+    """Test the user list search, filters and ordering."""
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser(
+            email='zoe.admin@shop.com', password='testpass')
+        self.staff.name = 'Zoe Admin'
+        self.staff.is_staff = True
+        self.staff.date_joined = joined(1)
+        self.staff.save()
+        self.ada = User.objects.create_user(
+            email='Ada@example.com', password='testpass',
+            name='Ada Lovelace', date_joined=joined(5))
+        self.alan = User.objects.create_user(
+            email='alan@example.com', password='testpass',
+            name='Alan Turing', date_joined=joined(10), is_active=False)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def emails(self, **params):
+        response = self.client.get('/user/', params)
+        self.assertEqual(response.status_code, 200)
+        return [user['email'] for user in response.data['results']]
+
+    def test_directory_is_ordered_by_email(self):
+        self.assertEqual(self.emails(), [
+            'Ada@example.com', 'alan@example.com', 'zoe.admin@shop.com'])
+
+    def test_search(self):
+        self.assertEqual(self.emails(search='ADA@'), ['Ada@example.com'])
+        self.assertEqual(self.emails(search='a'),
+                         ['Ada@example.com', 'alan@example.com'])
+        # names contain it, emails start with it
+        self.assertEqual(self.emails(search='turing'), ['alan@example.com'])
+        self.assertEqual(self.emails(search='example'), [])
+        self.assertEqual(self.emails(search='ad'), ['Ada@example.com'])
+
+    def test_filters(self):
+        self.assertEqual(self.emails(is_active='false'), ['alan@example.com'])
+        self.assertEqual(self.emails(is_staff='true'), ['zoe.admin@shop.com'])
+        self.assertEqual(self.emails(joined_after='2026-01-05',
+                                     joined_before='2026-01-10'),
+                         ['Ada@example.com', 'alan@example.com'])
+        self.assertEqual(self.emails(joined_before='2026-01-04'),
+                         ['zoe.admin@shop.com'])
+        for params in ({'is_staff': 'maybe'}, {'joined_after': 'monday'}):
+            self.assertEqual(self.client.get('/user/', params).status_code,
+                             400)
+
+    def test_users_without_a_join_date(self):
+        """Test users created before join dates were recorded."""
+        User.objects.filter(pk=self.ada.pk).update(date_joined=None)
+        self.assertEqual(self.emails(joined_after='2026-01-01'),
+                         ['alan@example.com', 'zoe.admin@shop.com'])
+        response = self.client.get(f'/user/{self.ada.pk}/')
+        self.assertIsNone(response.data['date_joined'])
+
+    def test_other_users_only_find_themselves(self):
+        self.client.force_authenticate(self.ada)
+        self.assertEqual(self.emails(search='a'), ['Ada@example.com'])
+
+
+class UserSearchIndexTests(TestCase):
+    """Test every filter can be answered from an index."""
+
+    def plan(self, **params):
+        request = type('Request', (), {'query_params': params})
+        queryset = UserSearchFilter().filter_queryset(
+            request, User.objects.all(), None)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # the planner would scan a table this small
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_indexes(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest('no search indexes on this database')
+        self.assertIn('core_user_email_prefix', self.plan(search='ada@'))
+        self.assertIn('core_user_staff', self.plan(is_staff='true'))
+        self.assertIn('core_user_inactive', self.plan(is_active='false'))
+        self.assertIn('core_user_joined', self.plan(joined_after='2026-01-01'))
+
+    def test_name_trigram_index(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT 1 FROM pg_indexes "
+                               "WHERE indexname = 'core_user_name_trigram'")
+            if connection.vendor != 'postgresql' or not cursor.fetchone():
+                self.skipTest('pg_trgm is not available')
+        self.assertIn('core_user_name_trigram', self.plan(search='love'))
+
+    def test_trigram_extension_may_be_refused(self):
+        """Test the migration skips the trigram index without privileges."""
+        migration = import_module('core.migrations.0003_user_search')
+        schema_editor = mock.Mock(connection=connection)
+        schema_editor.execute.side_effect = ProgrammingError(
+            'permission denied to create extension "pg_trgm"')
+        self.assertFalse(migration.create_trigram_extension(schema_editor))
+        schema_editor.execute.side_effect = None
+        self.assertTrue(migration.create_trigram_extension(schema_editor))
@@ -1,9 +1,10 @@
 from django.urls import path
-from .views import LoginAPIView, UserViewSet
+from .views import LoginAPIView, ProfileViewSet, UserViewSet
 from rest_framework import routers
 
 router = routers.SimpleRouter()
 router.register(r'user', UserViewSet, "user")
+router.register(r'profile', ProfileViewSet, "profile")
 
 urlpatterns = router.urls
 urlpatterns += [
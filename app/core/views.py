@@ -1,21 +1,36 @@
+from django.http import HttpResponse
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-from rest_framework import viewsets, permissions, decorators, response, filters, generics, status
-from shop.permissions import IsOwnerOrAdmin
-from shop.serializers import OrderSerializer
-from .serializers import LoginSerializer, UserSerializer
+from rest_framework import (
+    viewsets, permissions, decorators, response, generics, status,
+)
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+from app.profiling import (
+    ProfilingMixin, collapsed_text, flamegraph_svg, profile_store,
+)
+from shop.permissions import IsOwnerOrAdmin, OwnedQuerysetMixin
+from shop.export import export_response, requested_format
+from shop.serializers import ArchivedOrderSerializer, OrderSerializer
+from shop.summaries import order_summary
+from .filters import UserSearchFilter
+from .serializers import LoginSerializer, TokenRevokeSerializer, UserSerializer
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.views import TokenViewBase
 
 User = get_user_model()
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ProfilingMixin, OwnedQuerysetMixin, viewsets.ModelViewSet):
     """
-    API endpoint that allows users to be viewed or edited.
+    API endpoint that allows users to be viewed or edited. Users only see
+    themselves, staff see everyone.
     """
-    queryset = User.objects.all()
+    # unique, pages stay stable
+    queryset = User.objects.order_by('email')
+    owner_field = 'pk'
     serializer_class = UserSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'email']
+    filter_backends = [UserSearchFilter]
 
     def get_permissions(self):
         if self.action == 'create':
@@ -27,22 +42,111 @@ class UserViewSet(viewsets.ModelViewSet):
             self.permission_classes = [permissions.IsAuthenticated]
         return super().get_permissions()
 
+    def _first_history_page(self, request):
+        """
+        The first page of the order history from the cached order summary,
+        None for other pages or paginators.
+        """
+        paginator = self.paginator
+        if not isinstance(paginator, PageNumberPagination):
+            return None
+        if request.query_params.get(paginator.page_query_param, '1') != '1':
+            return None
+        page_size = paginator.get_page_size(request)
+        if not page_size:
+            return None
+        history = order_summary(request.user, page_size)['history']
+        next_url = None
+        if history['count'] > page_size:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), paginator.page_query_param, 2)
+        return Response({
+            'count': history['count'],
+            'next': next_url,
+            'previous': None,
+            'results': history['results'],
+        })
+
+    @decorators.action(detail=False, methods=["GET"], url_path='order-summary')
+    def user_order_summary(self, request):
+        """Order count, lifetime spend and the newest orders, cached."""
+        summary = order_summary(
+            request.user, self.paginator.get_page_size(request))
+        return Response({key: value for key, value in summary.items()
+                         if key != 'history'})
+
     @decorators.action(detail=False, methods=["GET"], url_path='order-history')
     def user_order_history(self, request):
         user = request.user
 
-        histories = user.get_user_order_history()
+        if request.query_params.get('archived') in ('1', 'true'):
+            # orders moved to the archive, see shop.archive
+            histories = user.get_archived_order_history()
+            serializer_class = ArchivedOrderSerializer
+        else:
+            # the profile page mostly asks for the first page
+            first_page = self._first_history_page(request)
+            if first_page is not None:
+                return first_page
+            histories = user.get_user_order_history()
+            serializer_class = OrderSerializer
         page = self.paginate_queryset(histories)
 
         if page is not None:
-            serializer = OrderSerializer(
+            serializer = serializer_class(
                 page, many=True, context={'request': request})
             return self.get_paginated_response(serializer.data)
 
-        serializer = OrderSerializer(
+        serializer = serializer_class(
             histories, many=True, context={'request': request})
         return response.Response(serializer.data)
 
+    @decorators.action(detail=False, methods=["GET"],
+                       url_path='order-history/export')
+    def user_order_history_export(self, request):
+        """Stream the order history, `?type=csv` or `?type=jsonl`."""
+        user = request.user
+        if request.query_params.get('archived') in ('1', 'true'):
+            histories = user.get_archived_order_history()
+        else:
+            histories = user.get_user_order_history()
+        return export_response(
+            histories, requested_format(request), 'order-history')
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """Request profiles taken by app.profiling, for staff."""
+    permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+
+    def list(self, request):
+        """The stored profiles without their stacks, `?view=` filters."""
+        profiles = profile_store().profiles(request.query_params.get('view'))
+        return Response([
+            {key: value for key, value in profile.items() if key != 'stacks'}
+            for profile in profiles
+        ])
+
+    def retrieve(self, request, pk=None):
+        """Download the collapsed stacks of a profile."""
+        try:
+            profile = profile_store().get(pk)
+        except KeyError:
+            raise NotFound
+        response = HttpResponse(collapsed_text(profile['stacks']),
+                                content_type='text/plain')
+        response['Content-Disposition'] = f'attachment; filename="{pk}.folded"'
+        return response
+
+    @decorators.action(detail=False, methods=["GET"])
+    def flamegraph(self, request):
+        """Flame graph of every stored profile of the `?view=` action."""
+        view = request.query_params.get('view')
+        if not view:
+            raise ValidationError({'view': 'A view name is required.'})
+        return HttpResponse(
+            flamegraph_svg(profile_store().aggregate(view), view),
+            content_type='image/svg+xml')
+
 
 class LoginAPIView(generics.GenericAPIView):
     serializer_class = LoginSerializer
@@ -53,3 +157,12 @@ class LoginAPIView(generics.GenericAPIView):
         serializer.is_valid(raise_exception=True)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class TokenRevokeView(TokenViewBase):
+    """Revoke a refresh token, e.g. on logout."""
+    serializer_class = TokenRevokeSerializer
+
+    def post(self, request, *args, **kwargs):
+        super().post(request, *args, **kwargs)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,34 @@
+"""Gunicorn serving profiles.
+
+    gunicorn app.wsgi:application             # sync workers (default)
+    GUNICORN_PROFILE=asgi gunicorn app.asgi:application
+
+The ASGI profile runs uvicorn workers, which keep many requests in flight per
+process: use it for the async catalog views (/async/product/, /async/category/)
+and the live stock streams, both of which mostly wait on I/O.
+"""
+
+import multiprocessing
+import os
+
+profile = os.environ.get('GUNICORN_PROFILE', 'wsgi')
+cpus = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+if profile == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # one event loop per core, concurrency comes from the loop
+    workers = int(os.environ.get('GUNICORN_WORKERS', cpus))
+    # streams are long lived, don't let the arbiter kill them
+    timeout = 0
+    graceful_timeout = 30
+else:
+    worker_class = 'sync'
+    workers = int(os.environ.get('GUNICORN_WORKERS', cpus * 2 + 1))
+    timeout = 30
+
+keepalive = 5
+# recycle workers now and then to bound memory growth
+max_requests = 10000
+max_requests_jitter = 1000
@@ -1,8 +1,79 @@
 from django.contrib import admin
-from .models import Category, Product
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from .models import ArchivedOrder, Category, Order, OrderItem, Product
 # Register your models here.
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids an exact COUNT(*) on large unfiltered tables.
+    On Postgres the planner estimate from pg_class.reltuples is used once the
+    table holds more than `estimate_threshold` rows.
+    """
+
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self._estimated_count()
+        if estimate is not None and estimate > self.estimate_threshold:
+            return estimate
+        return super().count
+
+    def _estimated_count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where:
+            # only the whole table has a planner estimate
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            # only the partitions of a partitioned table are kept analyzed,
+            # add up theirs
+            cursor.execute(
+                "SELECT sum(greatest(reltuples, 0))::bigint FROM pg_class "
+                "WHERE relkind <> 'p' AND (relname = %s OR oid IN ("
+                "SELECT inhrelid FROM pg_inherits i JOIN pg_class p "
+                "ON p.oid = i.inhparent WHERE p.relname = %s))",
+                [queryset.model._meta.db_table] * 2)
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+
+class LimitedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """
+    Related filter that lists at most `choices_limit` choices instead of
+    loading the whole related table. Any value can still be filtered on
+    through the querystring.
+    """
+
+    choices_limit = 50
+
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        queryset = field.remote_field.model._default_manager.order_by(
+            *ordering or ('pk',))
+        choices = [(obj.pk, str(obj)) for obj in queryset[:self.choices_limit]]
+        if self.lookup_val and not any(
+                str(pk) == self.lookup_val for pk, _ in choices):
+            selected = queryset.filter(pk=self.lookup_val).first()
+            if selected is not None:
+                choices.append((selected.pk, str(selected)))
+        return choices
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Shared changelist settings for tables with millions of rows."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
 class CategoryAdmin(admin.ModelAdmin):
 
     list_display = ('name',)
@@ -15,17 +86,93 @@ class CategoryAdmin(admin.ModelAdmin):
 admin.site.register(Category, CategoryAdmin)
 
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
 
-    list_display = ('name', 'price', 'stock', 'is_available', 'category')
+    list_display = ('name', 'price', 'stock', 'stock_shards', 'is_available',
+                    'category')
 
-    list_filter = ('is_available', 'category')
+    list_select_related = ('category',)
+
+    list_filter = ('is_available', ('category', LimitedRelatedFieldListFilter))
 
     search_fields = ('name', 'description', 'category__name')
 
+    autocomplete_fields = ('category',)
+
     ordering = ('name',)
 
     readonly_fields = ('is_available',)
 
 
 admin.site.register(Product, ProductAdmin)
+
+
+class OrderItemInline(admin.TabularInline):
+
+    model = OrderItem
+
+    autocomplete_fields = ('product',)
+
+    extra = 0
+
+
+class OrderAdmin(LargeTableAdmin):
+
+    list_display = ('id', 'user', 'is_checked_out', 'created_at')
+
+    list_select_related = ('user',)
+
+    list_filter = ('is_checked_out',)
+
+    search_fields = ('user__email',)
+
+    raw_id_fields = ('user',)
+
+    readonly_fields = ('is_checked_out',)
+
+    ordering = ('-created_at',)
+
+    inlines = (OrderItemInline,)
+
+
+admin.site.register(Order, OrderAdmin)
+
+
+class OrderItemAdmin(LargeTableAdmin):
+
+    list_display = ('id', 'order', 'product', 'quantity')
+
+    list_select_related = ('order__user', 'product')
+
+    search_fields = ('product__name',)
+
+    raw_id_fields = ('order',)
+
+    autocomplete_fields = ('product',)
+
+    ordering = ('-id',)
+
+
+admin.site.register(OrderItem, OrderItemAdmin)
+
+
+class ArchivedOrderAdmin(LargeTableAdmin):
+
+    list_display = ('id', 'user', 'total_amount', 'created_at', 'archived_at')
+
+    list_select_related = ('user',)
+
+    search_fields = ('user__email',)
+
+    raw_id_fields = ('user',)
+
+    ordering = ('-created_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(ArchivedOrder, ArchivedOrderAdmin)
@@ -0,0 +1,57 @@
+"""Archive of old checked-out orders.
+
+`archive_orders` copies checked-out orders created before a cutoff, with
+their items, into `ArchivedOrder` rows and removes them from the order
+tables, a batch per transaction. Their stock stays sold and the daily sales
+rollups keep their sales, `rollups.rebuild` counts archived orders too. On
+PostgreSQL the emptied month partitions can then be detached with the
+`order_partitions` command.
+"""
+
+from django.db import transaction
+
+from .models import ArchivedOrder, Order, OrderItem
+from .summaries import forget_order_summary
+
+
+def _archive(orders, items):
+    by_order = {}
+    for item in items:
+        by_order.setdefault(item['order_id'], []).append({
+            'id': item['id'], 'product': item['product_id'],
+            'quantity': item['quantity'], 'unit_price': item['unit_price']})
+    ArchivedOrder.objects.bulk_create([
+        ArchivedOrder(
+            id=order.pk, user_id=order.user_id, created_at=order.created_at,
+            updated_at=order.updated_at, checked_out_at=order.checked_out_at,
+            total_amount=order.total_amount, item_count=order.item_count,
+            items=by_order.get(order.pk, []))
+        for order in orders
+    ])
+
+
+def archive_orders(before, batch_size=1000):
+    """Archive the checked-out orders created before `before`."""
+    orders = Order.objects.filter(
+        is_checked_out=True, created_at__lt=before).order_by('pk')
+    archived = after = 0
+    while True:
+        with transaction.atomic():
+            batch = list(orders.filter(pk__gt=after)
+                         .select_for_update()[:batch_size])
+            if not batch:
+                return archived
+            ids = [order.pk for order in batch]
+            # the partition keys let PostgreSQL skip the recent partitions
+            items = OrderItem.objects.filter(
+                order_id__in=ids, order_created_at__lt=before)
+            _archive(batch, items.order_by('pk').values(
+                'id', 'order_id', 'product_id', 'quantity', 'unit_price'))
+            # deleted without the OrderItem signals, archived orders keep
+            # their stock taken and their totals
+            items._raw_delete(items.db)
+            Order.objects.filter(
+                pk__in=ids, created_at__lt=before)._raw_delete(orders.db)
+            forget_order_summary(*(order.user_id for order in batch))
+        archived += len(batch)
+        after = ids[-1]
@@ -0,0 +1,180 @@
+"""Async implementations of the catalog read path.
+
+These mirror `ProductViewSet`/`CategoryViewSet` list and retrieve (search,
+filters, pagination and the staff/available split) as native async views,
+so an ASGI worker can keep many slow requests in flight at once.
+
+Django only gained async queryset methods in 4.1; on older versions the
+helpers below run the same queries through `sync_to_async`, which is what the
+async ORM interface does internally.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import JsonResponse
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed, InvalidToken,
+)
+
+from .filters import ProductFilter
+from .inventory import load_stock
+from .models import Category, Product
+from .serializers import CategorySerializer, ProductSerializer
+from .views import StandardResultsSetPagination
+
+NATIVE_ASYNC_ORM = hasattr(QuerySet, 'acount')
+
+
+async def afetch(queryset):
+    if NATIVE_ASYNC_ORM:
+        return [obj async for obj in queryset]
+    return await sync_to_async(list)(queryset)
+
+
+async def acount(queryset):
+    if NATIVE_ASYNC_ORM:
+        return await queryset.acount()
+    return await sync_to_async(queryset.count)()
+
+
+async def afirst(queryset):
+    if NATIVE_ASYNC_ORM:
+        return await queryset.afirst()
+    return await sync_to_async(queryset.first)()
+
+
+async def authenticate(request):
+    """Resolve the JWT user, or None for anonymous and invalid tokens."""
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+def error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+class AsyncCatalogView:
+    """Async list (pk=None) and retrieve for one catalog model."""
+
+    model = None
+    serializer_class = None
+    search_fields = []
+    filter_backends = [filters.SearchFilter]
+    pagination = StandardResultsSetPagination
+
+    def get_queryset(self, user):
+        return self.model.objects.all()
+
+    def filter_queryset(self, request, queryset):
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        return queryset
+
+    async def dispatch(self, request, pk=None):
+        if request.method != 'GET':
+            return error('Method not allowed.', 405)
+        request = Request(request)
+        user = await authenticate(request)
+        queryset = self.get_queryset(user)
+        context = {'request': request}
+
+        if pk is not None:
+            obj = await afirst(queryset.filter(pk=pk))
+            if obj is None:
+                return error('Not found.', 404)
+            await self.prepare([obj])
+            return JsonResponse(
+                self.serializer_class(obj, context=context).data)
+
+        try:
+            queryset = self.filter_queryset(request, queryset)
+        except ValidationError as exc:
+            return JsonResponse(exc.detail, status=400, safe=False)
+
+        page_size = self.get_page_size(request)
+        try:
+            page_number = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            return error('Invalid page.', 404)
+        count = await acount(queryset)
+        offset = (page_number - 1) * page_size
+        if offset and offset >= count:
+            return error('Invalid page.', 404)
+        objects = await afetch(queryset[offset:offset + page_size])
+        await self.prepare(objects)
+
+        url = request.build_absolute_uri()
+        next_url = (replace_query_param(url, 'page', page_number + 1)
+                    if offset + page_size < count else None)
+        if page_number <= 1:
+            previous_url = None
+        elif page_number == 2:
+            previous_url = remove_query_param(url, 'page')
+        else:
+            previous_url = replace_query_param(url, 'page', page_number - 1)
+        return JsonResponse({
+            'count': count,
+            'next': next_url,
+            'previous': previous_url,
+            'results': self.serializer_class(
+                objects, many=True, context=context).data,
+        })
+
+    async def prepare(self, objects):
+        """Load whatever serializing `objects` would otherwise query."""
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[
+                self.pagination.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.pagination.page_size
+        if page_size <= 0:
+            return self.pagination.page_size
+        return min(page_size, self.pagination.max_page_size)
+
+
+class AsyncProductView(AsyncCatalogView):
+    model = Product
+    serializer_class = ProductSerializer
+    search_fields = ["name", "category__name"]
+    filter_backends = [filters.SearchFilter, ProductFilter]
+
+    def get_queryset(self, user):
+        if user is not None and (user.is_staff or user.is_superuser):
+            return Product.objects.all()
+        return Product.available.all()
+
+    async def prepare(self, objects):
+        # the live stock adds up the stock ledger, never in the event loop
+        await sync_to_async(load_stock)(objects)
+
+
+class AsyncCategoryView(AsyncCatalogView):
+    model = Category
+    serializer_class = CategorySerializer
+    search_fields = ["name"]
+
+    def get_queryset(self, user):
+        # the serializer lists product links, fetch them with the page
+        return Category.objects.prefetch_related('products')
+
+
+# read only, and Django refuses ATOMIC_REQUESTS for async views
+@transaction.non_atomic_requests
+async def product_view(request, pk=None):
+    return await AsyncProductView().dispatch(request, pk)
+
+
+@transaction.non_atomic_requests
+async def category_view(request, pk=None):
+    return await AsyncCategoryView().dispatch(request, pk)
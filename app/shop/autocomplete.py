@@ -0,0 +1,217 @@
+"""In-process prefix index for product and category name autocomplete.
+
+Names are normalized (case folded, whitespace collapsed) and indexed under
+every word they contain, so "pro" finds "MacBook Pro". The keys live in one
+sorted list searched with `bisect`, next to a parallel list of the objects
+they belong to. Only available products are indexed.
+
+Each process builds its index on first use, or at boot through the startup
+warm-up. Product and category saves and deletes update it in the process
+that made them once they commit; every `AUTOCOMPLETE_SYNC_INTERVAL` seconds
+a lookup also replays the catalog change feed, which carries changes made
+by other processes and stock driven availability flips. Once the index would
+exceed `AUTOCOMPLETE_MAX_ENTRIES` keys it stops growing and lookups fall back
+to the database.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models import Q
+
+from .changes import TOMBSTONE_KINDS, changes_since, current_position
+from .conf import shop_settings
+from .models import CatalogTombstone, Category, Product
+
+PRODUCT = CatalogTombstone.PRODUCT
+CATEGORY = CatalogTombstone.CATEGORY
+# changes replayed per query when catching up
+SYNC_PAGE_SIZE = 500
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+class PrefixIndex:
+    """Sorted keys of names, looked up by prefix."""
+
+    def __init__(self, max_entries, key_length):
+        self.max_entries = max_entries
+        self.key_length = key_length
+        self.complete = True
+        self._keys = []
+        # (kind, pk) of each key
+        self._refs = []
+        self._names = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _keys_for(self, name):
+        words = normalize(name).split(' ')
+        return sorted({' '.join(words[i:])[:self.key_length]
+                       for i in range(len(words)) if words[i]})
+
+    def load(self, entries):
+        """Replace the contents with `(kind, pk, name)` entries."""
+        pairs = []
+        names = {}
+        for kind, pk, name in entries:
+            keys = self._keys_for(name)
+            if len(pairs) + len(keys) > self.max_entries:
+                self.complete = False
+                break
+            names[(kind, pk)] = name
+            pairs.extend((key, (kind, pk)) for key in keys)
+        pairs.sort()
+        with self._lock:
+            self._keys = [key for key, _ in pairs]
+            self._refs = [ref for _, ref in pairs]
+            self._names = names
+
+    def add(self, kind, pk, name):
+        with self._lock:
+            self.remove(kind, pk)
+            keys = self._keys_for(name)
+            if len(self._keys) + len(keys) > self.max_entries:
+                self.complete = False
+                return
+            self._names[(kind, pk)] = name
+            for key in keys:
+                i = bisect_left(self._keys, key)
+                self._keys.insert(i, key)
+                self._refs.insert(i, (kind, pk))
+
+    def remove(self, kind, pk):
+        with self._lock:
+            name = self._names.pop((kind, pk), None)
+            if name is None:
+                return
+            for key in self._keys_for(name):
+                i = bisect_left(self._keys, key)
+                # other objects can share the key
+                while self._refs[i] != (kind, pk):
+                    i += 1
+                del self._keys[i]
+                del self._refs[i]
+
+    def lookup(self, prefix, limit):
+        """Up to `limit` `(kind, pk, name)` whose name has a word starting
+        with `prefix`, in key order."""
+        prefix = normalize(prefix)[:self.key_length]
+        if not prefix:
+            return []
+        results = {}
+        with self._lock:
+            i = bisect_left(self._keys, prefix)
+            while (i < len(self._keys) and len(results) < limit
+                   and self._keys[i].startswith(prefix)):
+                ref = self._refs[i]
+                if ref not in results:
+                    results[ref] = self._names[ref]
+                i += 1
+        return [(kind, pk, name) for (kind, pk), name in results.items()]
+
+
+class CatalogAutocomplete:
+    """The catalog's prefix index of this process, kept in sync."""
+
+    def __init__(self):
+        self.index = None
+        self._seq = 0
+        self._next_sync = 0
+        self._lock = threading.Lock()
+
+    def build(self):
+        seq = current_position()
+        index = PrefixIndex(shop_settings.AUTOCOMPLETE_MAX_ENTRIES,
+                            shop_settings.AUTOCOMPLETE_KEY_LENGTH)
+        products = Product.available.order_by().values_list('pk', 'name')
+        categories = Category.objects.order_by().values_list('pk', 'name')
+        index.load([
+            *((PRODUCT, pk, name) for pk, name in products.iterator()),
+            *((CATEGORY, pk, name) for pk, name in categories.iterator()),
+        ])
+        with self._lock:
+            self.index, self._seq = index, seq
+            self._next_sync = time.monotonic() + \
+                shop_settings.AUTOCOMPLETE_SYNC_INTERVAL
+        return index
+
+    def reset(self):
+        """Drop the index, the next lookup builds it again."""
+        with self._lock:
+            self.index = None
+
+    def apply(self, kind, obj):
+        index = self.index
+        if index is None:
+            return
+        if isinstance(obj, CatalogTombstone):
+            index.remove(obj.kind, obj.object_id)
+        elif kind == PRODUCT and not obj.is_available:
+            index.remove(PRODUCT, obj.pk)
+        else:
+            index.add(kind, obj.pk, obj.name)
+
+    def sync(self):
+        if self.index is None:
+            self.build()
+            return
+        if time.monotonic() < self._next_sync:
+            return
+        with self._lock:
+            self._next_sync = time.monotonic() + \
+                shop_settings.AUTOCOMPLETE_SYNC_INTERVAL
+            has_more = True
+            while has_more:
+                changes, has_more = changes_since(
+                    self._seq, SYNC_PAGE_SIZE,
+                    Product.objects.only('name', 'is_available', 'change_seq'),
+                    Category.objects.all())
+                for seq, kind, obj in changes:
+                    self.apply(kind, obj)
+                    self._seq = seq
+
+    def lookup(self, prefix, limit):
+        self.sync()
+        if not self.index.complete:
+            return lookup_database(prefix, limit)
+        return self.index.lookup(prefix, limit)
+
+
+def lookup_database(prefix, limit):
+    """The index lookup as queries, for an index over its size bound."""
+    prefix = ' '.join(prefix.split())
+    if not prefix:
+        return []
+    # a word of the name starts with the prefix
+    matches = Q(name__istartswith=prefix) | Q(name__icontains=f' {prefix}')
+    categories = Category.objects.filter(matches).order_by('name')
+    products = Product.available.filter(matches).order_by('name')
+    return [
+        *((CATEGORY, pk, name) for pk, name
+          in categories.values_list('pk', 'name')[:limit]),
+        *((PRODUCT, pk, name) for pk, name
+          in products.values_list('pk', 'name')[:limit]),
+    ][:limit]
+
+
+autocomplete = CatalogAutocomplete()
+
+
+def index_saved(instance):
+    """Index a saved product or category once its transaction commits."""
+    if autocomplete.index is not None:
+        kind = TOMBSTONE_KINDS[type(instance)]
+        transaction.on_commit(lambda: autocomplete.apply(kind, instance))
+
+
+def index_deleted(instance):
+    if autocomplete.index is not None:
+        kind, pk = TOMBSTONE_KINDS[type(instance)], instance.pk
+        transaction.on_commit(lambda: autocomplete.index.remove(kind, pk))
@@ -0,0 +1,24 @@
+"""Cache helpers for catalog data.
+
+Cached catalog results are keyed on the catalog version, the position of the
+catalog change feed: every product and category write stamps a higher
+change number in its transaction, so stale entries are never read again and
+simply expire. The version is read from the database, every worker sees a
+change as soon as it commits, whatever cache each one uses. On PostgreSQL the
+position waits for older write transactions to end, entries cached meanwhile
+are replaced once they have.
+"""
+
+import hashlib
+
+from .changes import current_position
+
+
+def catalog_version():
+    return current_position()
+
+
+def catalog_key(prefix, *parts):
+    """Build a versioned cache key from arbitrary key parts."""
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'shop:{prefix}:{catalog_version()}:{digest}'
@@ -0,0 +1,150 @@
+"""Catalog change feed.
+
+Every product and category write is stamped with a change sequence number
+in the writing transaction, and deletions leave a ``CatalogTombstone``, so a
+committed change always carries its number. Orders taking stock from the
+shards of a sharded product stamp the shard they took from instead of the
+product row, the product is reported at the latest stamp of either.
+
+Clients page through the feed with the last number they have seen, which
+only works if no change can commit later with a lower number. On SQLite
+writers are serialized by the database lock and the numbers come from the
+``catalog`` `ChangeSequence` row. On PostgreSQL a number is the id of the
+writing transaction followed by a counter local to that transaction, so
+writers never wait on each other, and the feed only reports changes below
+the oldest transaction still running: every transaction that can commit
+later has a higher id. A long running write transaction holds the feed back
+until it ends.
+"""
+
+import heapq
+
+from django.db import connection
+from django.db.models import Max
+from django.db.models.expressions import RawSQL
+
+from .models import (
+    CatalogTombstone, Category, ChangeSequence, Product, StockShard,
+)
+
+SEQUENCE_NAME = 'catalog'
+# bits of a PostgreSQL change number taken by the in-transaction counter,
+# a transaction can stamp up to 2 ** 20 changes
+COUNTER_BITS = 20
+NEXT_SEQUENCE_SQL = (
+    "(txid_current() << {bits}) + set_config("
+    "'shop.catalog_changes', (COALESCE(NULLIF(current_setting("
+    "'shop.catalog_changes', true), ''), '0')::integer + 1)::text, true"
+    ")::integer"
+).format(bits=COUNTER_BITS)
+
+TOMBSTONE_KINDS = {
+    Product: CatalogTombstone.PRODUCT,
+    Category: CatalogTombstone.CATEGORY,
+}
+
+
+def _next_sequence():
+    if connection.vendor == 'postgresql':
+        return RawSQL(NEXT_SEQUENCE_SQL, [])
+    return ChangeSequence.next_value(SEQUENCE_NAME)
+
+
+def _horizon():
+    """
+    The change numbers below which every change is committed or ours, None
+    when all of them are.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        # the snapshot lists the other running transactions only
+        cursor.execute(
+            'SELECT COALESCE((SELECT min(xid) FROM txid_snapshot_xip(s) xid), '
+            'txid_snapshot_xmax(s)) FROM txid_current_snapshot() s')
+        return cursor.fetchone()[0] << COUNTER_BITS
+
+
+def record_change(instance):
+    """Stamp a saved product or category, in the current transaction."""
+    type(instance).objects.filter(pk=instance.pk).update(
+        change_seq=_next_sequence())
+
+
+def record_shard_change(shard_id):
+    """
+    Stamp a stock shard an order took from, reporting its product changed
+    without writing the product row sharding keeps orders off.
+    """
+    StockShard.objects.filter(pk=shard_id).update(
+        change_seq=_next_sequence())
+
+
+def record_deletion(instance):
+    CatalogTombstone.objects.create(
+        kind=TOMBSTONE_KINDS[type(instance)], object_id=instance.pk,
+        change_seq=_next_sequence())
+
+
+def current_position():
+    """A `since` for following the feed from the catalog as it is now."""
+    # taken first, transactions past it may commit while the rows are read
+    horizon = _horizon()
+    seq = max(
+        Product.objects.aggregate(seq=Max('change_seq'))['seq'] or 0,
+        Category.objects.aggregate(seq=Max('change_seq'))['seq'] or 0,
+        CatalogTombstone.objects.aggregate(seq=Max('change_seq'))['seq'] or 0,
+        StockShard.objects.aggregate(seq=Max('change_seq'))['seq'] or 0)
+    if horizon is not None:
+        # replays changes below it that commit later, applying twice is fine
+        seq = min(seq, horizon - 1)
+    return seq
+
+
+def _identity(change):
+    _, kind, obj = change
+    return kind, getattr(obj, 'object_id', obj.pk)
+
+
+def changes_since(since, limit, products, categories):
+    """
+    Return up to `limit` changes after sequence `since` and whether more
+    follow. Each change is a `(seq, kind, obj)` tuple where `obj` is the
+    changed row or the tombstone of a deleted one.
+    """
+    horizon = _horizon()
+
+    def changed(queryset):
+        queryset = queryset.filter(change_seq__gt=since)
+        if horizon is not None:
+            queryset = queryset.filter(change_seq__lt=horizon)
+        return queryset
+
+    def after(queryset):
+        return changed(queryset).order_by('change_seq')[:limit + 1]
+
+    # products whose shards were taken from, at their latest stamp
+    stamped = dict(
+        changed(StockShard.objects.all()).order_by().values('product_id')
+        .annotate(seq=Max('change_seq')).order_by('seq')
+        .values_list('product_id', 'seq')[:limit + 1])
+
+    streams = [
+        ((obj.change_seq, CatalogTombstone.PRODUCT, obj)
+         for obj in after(products)),
+        sorted(((stamped[obj.pk], CatalogTombstone.PRODUCT, obj)
+                for obj in products.filter(pk__in=stamped)),
+               key=lambda change: change[0]),
+        ((obj.change_seq, CatalogTombstone.CATEGORY, obj)
+         for obj in after(categories)),
+        ((obj.change_seq, obj.kind, obj)
+         for obj in after(CatalogTombstone.objects.all())),
+    ]
+    changes = list(heapq.merge(*streams, key=lambda change: change[0]))
+    page = changes[:limit]
+    # a product stamped on both its row and its shards is reported once,
+    # at its latest change
+    latest = {_identity(change): change[0] for change in page}
+    page = [change for change in page
+            if latest[_identity(change)] == change[0]]
+    return page, len(changes) > limit
@@ -0,0 +1,85 @@
+"""Order check-out as one locked, batched operation.
+
+The order row is locked first, then every product on it in a single query
+ordered by primary key, so concurrent check-outs sharing products always
+take their locks in the same order and cannot deadlock. Items are then
+verified against the locked products in memory and the totals are computed
+with one aggregate. Everything commits in the same transaction.
+"""
+
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+from django.utils import timezone
+
+from .exceptions import EmptyOrderException, OrderCheckedOutException
+from .models import Order, OrderItem, Product
+from .recommendations import queue_checkout
+from .rollups import record_checkout
+from .summaries import forget_order_summary
+
+
+@dataclass
+class CheckoutResult:
+    checked_out: bool
+    # items whose price changed since they were added, as
+    # {"id", "product", "old_price", "new_price"} dicts
+    changed_prices: list = field(default_factory=list)
+
+
+def _refresh_totals(order_id):
+    totals = OrderItem.objects.filter(order_id=order_id).aggregate(
+        amount=Sum(F('quantity') * F('unit_price')), units=Sum('quantity'))
+    return {'total_amount': totals['amount'] or 0,
+            'item_count': totals['units'] or 0}
+
+
+def check_out(order):
+    """
+    Check `order` out. Items priced differently from the current product
+    price are repriced and reported instead, the client has to confirm the
+    new total by checking out again.
+    """
+    with transaction.atomic():
+        locked = Order.objects.select_for_update().get(pk=order.pk)
+        if locked.is_checked_out:
+            raise OrderCheckedOutException
+
+        items = list(
+            OrderItem.objects.filter(order_id=order.pk).order_by().values(
+                'id', 'product_id', 'quantity', 'unit_price'))
+        if not items:
+            raise EmptyOrderException
+
+        prices = dict(
+            Product.objects.select_for_update()
+            .filter(pk__in={item['product_id'] for item in items})
+            .order_by('pk')
+            .values_list('pk', 'price'))
+
+        changed = [
+            {'id': item['id'], 'product': item['product_id'],
+             'old_price': item['unit_price'],
+             'new_price': prices[item['product_id']]}
+            for item in items
+            if item['unit_price'] != prices[item['product_id']]
+        ]
+        if changed:
+            OrderItem.objects.filter(pk__in=[c['id'] for c in changed]).update(
+                unit_price=Case(*(When(pk=c['id'], then=c['new_price'])
+                                  for c in changed)))
+
+        values = _refresh_totals(order.pk)
+        if not changed:
+            values.update(is_checked_out=True, checked_out_at=timezone.now())
+        Order.objects.filter(pk=order.pk).update(**values)
+        forget_order_summary(order.user_id)
+        for name, value in values.items():
+            setattr(order, name, value)
+
+        if changed:
+            return CheckoutResult(checked_out=False, changed_prices=changed)
+        record_checkout.enqueue(order.pk)
+        queue_checkout(order)
+        return CheckoutResult(checked_out=True)
@@ -0,0 +1,72 @@
+"""Shop settings, read from the ``SHOP`` dict in the project settings."""
+
+from django.conf import settings
+
+DEFAULTS = {
+    # seconds facet results stay cached, a catalog change invalidates them
+    # earlier
+    'FACETS_CACHE_TIMEOUT': 300,
+    # number of equal-width buckets in the facet price histogram
+    'FACETS_PRICE_BUCKETS': 10,
+    # default and maximum number of entries per change feed page
+    'CHANGES_PAGE_SIZE': 100,
+    'CHANGES_MAX_PAGE_SIZE': 1000,
+    # seconds a stored response is replayed for a repeated Idempotency-Key
+    'IDEMPOTENCY_TTL': 60 * 60 * 24,
+    # seconds a key stays claimed by an attempt that never completed
+    'IDEMPOTENCY_LOCK_TIMEOUT': 30,
+    # seconds the summed stock of a sharded product stays cached
+    'STOCK_SHARD_CACHE_TIMEOUT': 2,
+    # checked-out orders older than this many days go to the order archive
+    'ORDER_ARCHIVE_AFTER_DAYS': 365,
+    # monthly order partitions kept created ahead of the current month
+    'ORDER_PARTITIONS_AHEAD': 3,
+    # orders read per query by the streaming order exports
+    'EXPORT_CHUNK_SIZE': 500,
+    'PRODUCT_BULK_MAX_IDS': 100,
+    # in-process prefix index of catalog names, see shop.autocomplete;
+    # past this many keys lookups fall back to the database
+    'AUTOCOMPLETE_MAX_ENTRIES': 200000,
+    # characters of a name indexed, longer prefixes match on these only
+    'AUTOCOMPLETE_KEY_LENGTH': 64,
+    'AUTOCOMPLETE_LIMIT': 10,
+    'AUTOCOMPLETE_MAX_LIMIT': 50,
+    # seconds between catch-ups with the change feed
+    'AUTOCOMPLETE_SYNC_INTERVAL': 5,
+    # products kept per product by shop.recommendations
+    'RELATED_PRODUCTS_TOP_K': 10,
+    # queued orders counted per transaction
+    'RELATED_PRODUCTS_BATCH_SIZE': 1000,
+    # seconds each endpoint may take by URL name, DEFAULT for the others,
+    # None for no limit; see shop.deadlines
+    'DEADLINES': {
+        'DEFAULT': 10,
+        'product-list': 3,
+        'product-facets': 3,
+        'product-bulk': 1,
+        'product-autocomplete': 0.5,
+        # streamed, the body is written after the view returns
+        'order-export': None,
+    },
+    # background task queue, see shop.tasks
+    'TASK_BATCH_SIZE': 100,
+    'TASK_MAX_ATTEMPTS': 5,
+    # seconds before the first retry of a failed task, doubling after
+    'TASK_RETRY_DELAY': 10,
+    # seconds an idle worker waits before looking for tasks again
+    'TASK_POLL_INTERVAL': 1,
+    # newest orders kept in the per-user order summary, see shop.summaries
+    'ORDER_SUMMARY_RECENT': 5,
+}
+
+
+class ShopSettings:
+    """Attribute access to ``settings.SHOP`` falling back to ``DEFAULTS``."""
+
+    def __getattr__(self, name):
+        if name not in DEFAULTS:
+            raise AttributeError(f"Invalid shop setting: '{name}'")
+        return getattr(settings, 'SHOP', {}).get(name, DEFAULTS[name])
+
+
+shop_settings = ShopSettings()
@@ -0,0 +1,122 @@
+"""Time budgets of the shop endpoints.
+
+Every request to a viewset using `DeadlineMixin` gets the budget configured
+for its URL name in the `DEADLINES` shop setting, `DEFAULT` otherwise, in
+seconds; None means no budget. The budget is enforced on the database
+connection: PostgreSQL gets it as the `statement_timeout` of the request,
+SQLite aborts a running statement from a progress handler, and on every
+database no query starts once the budget is spent. A request over its budget
+gets a 504 with the budget and the time spent, and is logged.
+
+On PostgreSQL the timeout applies to each statement, a request can overrun
+its budget by the statement running when it expires, at most once more.
+Streamed response bodies are written after the view returns and are not
+covered, give those endpoints no budget.
+"""
+
+import logging
+import time
+
+from django.db import OperationalError, connection
+
+from .conf import shop_settings
+from .exceptions import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# SQLite virtual machine instructions between two deadline checks
+PROGRESS_INTERVAL = 1000
+
+
+def endpoint_budget(name):
+    deadlines = shop_settings.DEADLINES
+    return deadlines.get(name, deadlines.get('DEFAULT'))
+
+
+class Deadline:
+    """Enforce `budget` seconds on the queries run inside the block."""
+
+    def __init__(self, budget, using=connection):
+        self.budget = budget
+        self.connection = using
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        self.expires = self.started + self.budget
+        vendor = self.connection.vendor
+        if vendor == 'postgresql':
+            scope = 'LOCAL ' if self.connection.in_atomic_block else ''
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'SET {scope}statement_timeout = '
+                               f'{max(1, int(self.budget * 1000))}')
+        elif vendor == 'sqlite':
+            self.connection.ensure_connection()
+            self.connection.connection.set_progress_handler(
+                lambda: self.expired, PROGRESS_INTERVAL)
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.expired:
+            raise DeadlineExceeded
+        return execute(sql, params, many, context)
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+        vendor = self.connection.vendor
+        if vendor == 'postgresql':
+            from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+
+            # a transaction that is rolled back resets it anyway
+            status = self.connection.connection.get_transaction_status()
+            if not (self.connection.needs_rollback
+                    or status == TRANSACTION_STATUS_INERROR):
+                with self.connection.cursor() as cursor:
+                    cursor.execute('RESET statement_timeout')
+        elif vendor == 'sqlite' and self.connection.connection is not None:
+            self.connection.connection.set_progress_handler(None, 0)
+
+
+class DeadlineMixin:
+    """Run viewset requests within the budget of their endpoint."""
+
+    deadline = None
+
+    def dispatch(self, request, *args, **kwargs):
+        name = getattr(request.resolver_match, 'url_name', None)
+        budget = endpoint_budget(name)
+        if budget is None:
+            return super().dispatch(request, *args, **kwargs)
+        self.deadline = Deadline(budget)
+        with self.deadline:
+            response = super().dispatch(request, *args, **kwargs)
+        response['Server-Timing'] = (
+            f'app;dur={self.deadline.elapsed * 1000:.1f}, '
+            f'budget;dur={budget * 1000:.0f}')
+        return response
+
+    def handle_exception(self, exc):
+        deadline = self.deadline
+        if deadline is None or not (
+                isinstance(exc, DeadlineExceeded) or (
+                    isinstance(exc, OperationalError) and deadline.expired)):
+            return super().handle_exception(exc)
+        name = self.request.resolver_match.url_name
+        elapsed = deadline.elapsed
+        logger.warning("%s over its %.3fs budget after %.3fs",
+                       name, deadline.budget, elapsed)
+        # rolls the request transaction back, like any API exception
+        response = super().handle_exception(DeadlineExceeded())
+        response.data.update(
+            endpoint=name, budget_ms=round(deadline.budget * 1000),
+            elapsed_ms=round(elapsed * 1000))
+        return response
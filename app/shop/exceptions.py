@@ -5,3 +5,21 @@ class OutOfStocksException(APIException):
     status_code = 404
     default_code = 404
     default_detail = "The requested product is not available at this time."
+
+
+class OrderCheckedOutException(APIException):
+    status_code = 400
+    default_code = 400
+    default_detail = "Order is already checked out."
+
+
+class EmptyOrderException(APIException):
+    status_code = 400
+    default_code = 400
+    default_detail = "An order without items cannot be checked out."
+
+
+class DeadlineExceeded(APIException):
+    status_code = 504
+    default_code = 504
+    default_detail = "The request took longer than its time budget."
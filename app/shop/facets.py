@@ -0,0 +1,68 @@
+"""Grouped aggregate queries backing the product facets endpoint."""
+
+from django.db.models import Count, F, IntegerField, Max, Min, Q, Value
+from django.db.models.functions import Least
+
+
+def category_facets(queryset):
+    rows = (
+        queryset.order_by()
+        .values('category_id', 'category__name')
+        .annotate(count=Count('id'),
+                  in_stock=Count('id', filter=Q(is_available=True)))
+        .order_by('category__name')
+    )
+    return [
+        {
+            'id': row['category_id'],
+            'name': row['category__name'],
+            'count': row['count'],
+            'in_stock': row['in_stock'],
+        }
+        for row in rows
+    ]
+
+
+def price_histogram(queryset, min_price, max_price, buckets):
+    """Count products in `buckets` equal-width price ranges."""
+    if min_price is None:
+        return []
+    width = max(-(-(max_price - min_price + 1) // buckets), 1)
+    bucket = Least(
+        (F('price') - Value(min_price)) / Value(width),
+        Value(buckets - 1),
+        output_field=IntegerField(),
+    )
+    counts = dict(
+        queryset.order_by()
+        .annotate(bucket=bucket)
+        .values('bucket')
+        .annotate(count=Count('id'))
+        .values_list('bucket', 'count')
+    )
+    return [
+        {
+            'min': min_price + index * width,
+            'max': min(min_price + (index + 1) * width - 1, max_price),
+            'count': counts.get(index, 0),
+        }
+        for index in range(buckets)
+        if min_price + index * width <= max_price
+    ]
+
+
+def compute_facets(queryset, buckets):
+    totals = queryset.order_by().aggregate(
+        count=Count('id'),
+        in_stock=Count('id', filter=Q(is_available=True)),
+        min_price=Min('price'),
+        max_price=Max('price'),
+    )
+    return {
+        'count': totals['count'],
+        'in_stock': totals['in_stock'],
+        'price': {'min': totals['min_price'], 'max': totals['max_price']},
+        'categories': category_facets(queryset),
+        'price_buckets': price_histogram(
+            queryset, totals['min_price'], totals['max_price'], buckets),
+    }
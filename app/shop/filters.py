@@ -0,0 +1,39 @@
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+
+class ProductFilter(filters.BaseFilterBackend):
+    """
+    Filter products by `?category=<id>[,<id>...]`, `?min_price=` and
+    `?max_price=`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        categories = params.get('category')
+        if categories:
+            queryset = queryset.filter(
+                category_id__in=self._parse_ids('category', categories))
+
+        min_price = params.get('min_price')
+        if min_price not in (None, ''):
+            queryset = queryset.filter(
+                price__gte=self._parse_int('min_price', min_price))
+
+        max_price = params.get('max_price')
+        if max_price not in (None, ''):
+            queryset = queryset.filter(
+                price__lte=self._parse_int('max_price', max_price))
+
+        return queryset
+
+    def _parse_int(self, name, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({name: "A valid integer is required."})
+
+    def _parse_ids(self, name, value):
+        return [self._parse_int(name, part)
+                for part in value.split(',') if part.strip()]
@@ -0,0 +1,168 @@
+"""Idempotency keys for retried write requests.
+
+A client sends the same `Idempotency-Key` header on every retry of a write.
+The first attempt claims the key in the cache, and once its transaction has
+committed the response is stored there for `IDEMPOTENCY_TTL` seconds; retries
+replay it instead of writing again.
+
+The default cache is per worker, so the key is claimed in the database too:
+an `IdempotencyKey` row inserted in the request transaction, holding the
+response once the request has run. A retry reaching another worker waits on
+the row until the first attempt commits, then replays its response, or runs
+again if it rolled back. Expired rows are deleted by `prune` and replaced
+when claimed again.
+"""
+
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conf import shop_settings
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IN_PROGRESS = 'in-progress'
+# response headers worth replaying
+REPLAYED_HEADERS = ('Location',)
+
+
+def _cache_key(request, key):
+    user = request.user.pk if request.user.is_authenticated else 'anonymous'
+    # client keys are arbitrary strings, keep cache keys short and safe
+    digest = hashlib.sha256(f'{request.path}:{key}'.encode()).hexdigest()
+    return f'shop:idempotency:{user}:{request.method}:{digest}'
+
+
+def _fingerprint(request):
+    try:
+        body = request.body
+    except RawPostDataException:
+        # the body stream was already parsed into request.data
+        body = repr(sorted(request.data.items())).encode()
+    return hashlib.sha256(body).hexdigest()
+
+
+def _replay(stored):
+    response = Response(stored['data'], status=stored['status'])
+    for header, value in stored['headers'].items():
+        response[header] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _respond(stored, fingerprint):
+    """The response to a repeated key, `stored` by the attempt holding it."""
+    if stored['fingerprint'] != fingerprint:
+        return Response(
+            {'detail': 'Idempotency-Key was used with a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    if stored.get('state') == IN_PROGRESS:
+        return Response(
+            {'detail': 'A request with this Idempotency-Key is in '
+                       'progress.'},
+            status=status.HTTP_409_CONFLICT)
+    return _replay(stored)
+
+
+def _expired():
+    ttl = timedelta(seconds=shop_settings.IDEMPOTENCY_TTL)
+    return IdempotencyKey.objects.filter(created_at__lt=timezone.now() - ttl)
+
+
+def _claim(cache_key, fingerprint):
+    """Claim `cache_key` in the database, None if claimed, else the row of
+    the committed attempt that claimed it first."""
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                key=cache_key, fingerprint=fingerprint)
+        return None
+    except IntegrityError:
+        # the insert waited for the attempt holding the key to commit
+        claimed = IdempotencyKey.objects.filter(key=cache_key).first()
+    if claimed is None or _expired().filter(key=cache_key).delete()[0]:
+        # pruned meanwhile, or outlived the TTL
+        return _claim(cache_key, fingerprint)
+    return claimed
+
+
+def _record(cache_key, fingerprint, response):
+    """Store `response` with the claim of `cache_key`, in its transaction.
+    None if retries should run again instead."""
+    if response.status_code >= 500:
+        IdempotencyKey.objects.filter(key=cache_key).delete()
+        return None
+    stored = {
+        'status': response.status_code,
+        'data': response.data,
+        'headers': {header: response[header] for header in REPLAYED_HEADERS
+                    if response.has_header(header)},
+    }
+    IdempotencyKey.objects.filter(key=cache_key).update(response=stored)
+    return {'fingerprint': fingerprint, **stored}
+
+
+def prune():
+    """Delete the keys older than `IDEMPOTENCY_TTL`, returns how many."""
+    return _expired().delete()[0]
+
+
+def idempotent(method):
+    """Make a viewset write action replayable with an `Idempotency-Key`."""
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.META.get(HEADER)
+        if not key:
+            return method(self, request, *args, **kwargs)
+
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+        claim = {'state': IN_PROGRESS, 'fingerprint': fingerprint}
+        if not cache.add(cache_key, claim,
+                         shop_settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = cache.get(cache_key)
+            if stored is None:
+                # expired between the two calls, treat as a first attempt
+                return wrapper(self, request, *args, **kwargs)
+            return _respond(stored, fingerprint)
+
+        try:
+            with transaction.atomic():
+                claimed = _claim(cache_key, fingerprint)
+                if claimed is None:
+                    response = method(self, request, *args, **kwargs)
+                    stored = _record(cache_key, fingerprint, response)
+        except Exception:
+            cache.delete(cache_key)
+            raise
+
+        if claimed is not None:
+            # claimed by an attempt another worker served
+            cache.delete(cache_key)
+            stored = {'fingerprint': claimed.fingerprint, **claimed.response}
+            return _respond(stored, fingerprint)
+        if stored is None:
+            cache.delete(cache_key)
+            return response
+        # only remember the response once the write it describes is durable;
+        # a rolled back attempt lets the claim expire and retries run again
+        transaction.on_commit(lambda: cache.set(
+            cache_key, stored, shop_settings.IDEMPOTENCY_TTL))
+        return response
+
+    return wrapper
+
+
+class IdempotentCreateMixin:
+    """Accept an `Idempotency-Key` header on `create`."""
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
@@ -0,0 +1,363 @@
+"""Product stock: an append-only ledger over a compacted snapshot.
+
+Every stock change is a `StockMovement` row. Orders only append to the
+ledger under the product row lock, `Product.stock` is a snapshot that
+`compact` refreshes in batches, and `current_stock` adds the movements not
+applied yet. Appending a movement stamps the product for the change feed,
+a narrow update of the row already locked; its stock is only written when
+the product sells out, comes back in stock or is edited.
+
+A product with `stock_shards` set keeps its stock in that many `StockShard`
+rows instead: an order takes its units from one random shard that has
+enough, skipping shards locked by other orders, so concurrent orders of a
+flash-sale product mostly lock different rows. Their movements are recorded
+already applied and the change feed stamp goes on the shard, the live stock
+is the sum of the shards, cached for `STOCK_SHARD_CACHE_TIMEOUT` seconds.
+"""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+
+from .autocomplete import index_saved
+from .changes import record_change, record_shard_change
+from .conf import shop_settings
+from .exceptions import OutOfStocksException
+from .models import Product, StockMovement, StockShard
+from .stream import hub, stock_event
+
+
+def _cache_key(product_id):
+    return f'shop:stock:{product_id}'
+
+
+def _out_of_stock(product):
+    return OutOfStocksException(f"The item {product.name} is out of stock")
+
+
+def _forget(product):
+    cache.delete(_cache_key(product.pk))
+    product.__dict__.pop('_live_stock', None)
+
+
+def _shard_totals(product_ids):
+    return dict(
+        StockShard.objects.filter(product_id__in=product_ids).order_by()
+        .values('product_id').annotate(total=Sum('stock'))
+        .values_list('product_id', 'total'))
+
+
+def _pending(product_ids):
+    return dict(
+        StockMovement.objects.filter(product_id__in=product_ids, applied=False)
+        .order_by().values('product_id').annotate(total=Sum('delta'))
+        .values_list('product_id', 'total'))
+
+
+def load_stock(products):
+    """Fetch the live stock of `products`, one query for the whole batch."""
+    products = [product for product in products
+                if not hasattr(product, '_live_stock')]
+    sharded = {product.pk: product for product in products
+               if product.stock_shards}
+    snapshots = {product.pk: product for product in products
+                 if not product.stock_shards}
+    if snapshots:
+        pending = _pending(snapshots)
+        for pk, product in snapshots.items():
+            product._live_stock = product.stock + pending.get(pk, 0)
+    if sharded:
+        cached = cache.get_many([_cache_key(pk) for pk in sharded])
+        missing = [pk for pk in sharded if _cache_key(pk) not in cached]
+        totals = _shard_totals(missing)
+        cache.set_many({_cache_key(pk): totals.get(pk, 0) for pk in missing},
+                       shop_settings.STOCK_SHARD_CACHE_TIMEOUT)
+        for pk, product in sharded.items():
+            product._live_stock = cached.get(_cache_key(pk), totals.get(pk, 0))
+
+
+def with_live_stock(queryset):
+    """
+    `queryset` with the live stock of its products read in the same query,
+    the snapshot plus the pending movements or the sum of the shards.
+    """
+    pending = Subquery(
+        StockMovement.objects.filter(product=OuterRef('pk'), applied=False)
+        .order_by().values('product').annotate(total=Sum('delta'))
+        .values('total'))
+    shards = Subquery(
+        StockShard.objects.filter(product=OuterRef('pk')).order_by()
+        .values('product').annotate(total=Sum('stock')).values('total'))
+    return queryset.annotate(_live_stock=Case(
+        When(stock_shards=0, then=F('stock') + Coalesce(pending, 0)),
+        default=Coalesce(shards, 0)))
+
+
+def current_stock(product):
+    if not hasattr(product, '_live_stock'):
+        load_stock([product])
+    return product._live_stock
+
+
+def _record(product, delta, reason, order_item=None, applied=False):
+    StockMovement.objects.create(
+        product_id=product.pk, order_item=order_item, delta=delta,
+        reason=reason, applied=applied)
+
+
+def record_adjustment(product, delta):
+    """Record an edit of the stock, already written to the snapshot."""
+    _record(product, delta, StockMovement.ADJUSTMENT, applied=True)
+
+
+def _compact(product_ids):
+    """Apply the pending movements of `product_ids`, return their stock."""
+    with transaction.atomic():
+        # writers append under the product row lock, holding it means
+        # every movement of these products is committed and visible
+        stock = dict(
+            Product.objects.select_for_update().filter(pk__in=product_ids)
+            .order_by('pk').values_list('pk', 'stock'))
+        pending = {pk: delta for pk, delta in _pending(stock).items() if delta}
+        if pending:
+            Product.objects.filter(pk__in=pending).update(stock=Case(
+                *(When(pk=pk, then=F('stock') + delta)
+                  for pk, delta in pending.items())))
+        # movements of deleted products are marked applied too
+        StockMovement.objects.filter(
+            product_id__in=product_ids, applied=False).update(applied=True)
+        # the live stock is unchanged, the movements stamped the feed
+        for pk, delta in pending.items():
+            stock[pk] += delta
+        return stock
+
+
+def compact(batch_size=500):
+    """
+    Apply the pending ledger movements to `Product.stock`, one transaction
+    per batch of products. Returns the number of products compacted.
+    """
+    last = StockMovement.objects.filter(applied=False).order_by('-pk').first()
+    if last is None:
+        return 0
+    compacted = after = 0
+    while True:
+        # movements appended meanwhile wait for the next run
+        batch = list(
+            StockMovement.objects.filter(
+                applied=False, pk__lte=last.pk, product_id__gt=after)
+            .order_by('product_id').values_list('product_id', flat=True)
+            .distinct()[:batch_size])
+        if not batch:
+            return compacted
+        _compact(batch)
+        compacted += len(batch)
+        after = batch[-1]
+
+
+def lock_stock(product, sharded):
+    """
+    Lock the stock of a saved `product`, returning what is left of it and
+    the locked shards of a sharded product.
+    """
+    if sharded:
+        shards = lock_shards(product.pk)
+        return sum(shard.stock for shard in shards), shards
+    return _compact([product.pk])[product.pk], []
+
+
+def reconcile():
+    """
+    Return `(product, problem)` pairs for every product whose snapshot,
+    shards or availability disagree with its ledger.
+    """
+    def ledger(**filters):
+        return Coalesce(Subquery(
+            StockMovement.objects.filter(product=OuterRef('pk'), **filters)
+            .order_by().values('product').annotate(total=Sum('delta'))
+            .values('total')), 0)
+
+    products = Product.objects.order_by('pk').annotate(
+        applied_total=ledger(applied=True),
+        ledger_total=ledger(),
+        shard_total=Coalesce(Subquery(
+            StockShard.objects.filter(product=OuterRef('pk')).order_by()
+            .values('product').annotate(total=Sum('stock'))
+            .values('total')), 0),
+    )
+    problems = []
+    for product in products.iterator():
+        if product.stock_shards:
+            live = product.shard_total
+            if live != product.ledger_total:
+                problems.append((product, (
+                    f"shards hold {live}, the ledger adds up to "
+                    f"{product.ledger_total}")))
+        else:
+            live = product.stock + product.ledger_total - product.applied_total
+            if product.stock != product.applied_total:
+                problems.append((product, (
+                    f"snapshot is {product.stock}, the applied movements "
+                    f"add up to {product.applied_total}")))
+        if product.is_available != (live > 0):
+            problems.append((product, (
+                f"is_available is {product.is_available} "
+                f"with {live} in stock")))
+    return problems
+
+
+def lock_shards(product_id):
+    return list(StockShard.objects.select_for_update()
+                .filter(product_id=product_id).order_by('index'))
+
+
+def distribute_stock(product, shards):
+    """Spread `product.stock` evenly over `product.stock_shards` rows."""
+    count = product.stock_shards
+    existing = {shard.index: shard for shard in shards}
+    base, extra = divmod(product.stock, count) if count else (0, 0)
+    changed, created = [], []
+    for index in range(count):
+        stock = base + (index < extra)
+        shard = existing.pop(index, None)
+        if shard is None:
+            created.append(
+                StockShard(product=product, index=index, stock=stock))
+        elif shard.stock != stock:
+            shard.stock = stock
+            changed.append(shard)
+    StockShard.objects.bulk_create(created)
+    StockShard.objects.bulk_update(changed, ['stock'])
+    if existing:
+        StockShard.objects.filter(
+            pk__in=[s.pk for s in existing.values()]).delete()
+    _forget(product)
+
+
+def _set_available(product, is_available):
+    updated = Product.objects.filter(
+        pk=product.pk, is_available=not is_available,
+    ).update(is_available=is_available)
+    product.is_available = is_available
+    if updated:
+        # what a product save would have triggered
+        record_change(product)
+        index_saved(product)
+
+
+def _publish(product):
+    if hub.has_subscribers(product.pk):
+        _forget(product)
+        event = stock_event(product)
+        transaction.on_commit(lambda: hub.publish(product.pk, event))
+
+
+def _take_from_row(product, quantity, order_item):
+    with transaction.atomic():
+        # lock the row so concurrent orders can't both take the last units
+        stock, stock_shards = (
+            Product.objects.select_for_update()
+            .values_list("stock", "stock_shards").get(pk=product.pk))
+        if stock_shards:
+            # sharded since the product was loaded
+            return _take_from_shards(product, quantity, order_item)
+        stock += _pending([product.pk]).get(product.pk, 0)
+        if stock < quantity:
+            raise _out_of_stock(product)
+        _record(product, -quantity, StockMovement.ORDER, order_item)
+        # the row is locked already, stamping it adds no contention
+        record_change(product)
+        if stock == quantity:
+            _set_available(product, False)
+        product._live_stock = stock - quantity
+
+
+def _pick_shard(product, quantity, **lock):
+    return (StockShard.objects.select_for_update(**lock)
+            .filter(product_id=product.pk, stock__gte=quantity)
+            .order_by('?').values_list('pk', 'stock').first())
+
+
+def _take_from_shards(product, quantity, order_item):
+    with transaction.atomic():
+        # prefer a shard no other order holds, else queue on a random one
+        shard = (_pick_shard(product, quantity, skip_locked=True)
+                 or _pick_shard(product, quantity))
+        if shard is not None:
+            StockShard.objects.filter(pk=shard[0]).update(
+                stock=F('stock') - quantity)
+            record_shard_change(shard[0])
+            emptied = shard[1] == quantity
+        else:
+            # no shard holds enough on its own, wait for all of them and
+            # take the units from several
+            shards = lock_shards(product.pk)
+            if sum(shard.stock for shard in shards) < quantity:
+                raise _out_of_stock(product)
+            remaining = quantity
+            for shard in shards:
+                taken = min(shard.stock, remaining)
+                if taken:
+                    StockShard.objects.filter(pk=shard.pk).update(
+                        stock=F('stock') - taken)
+                    remaining -= taken
+                if not remaining:
+                    break
+            record_shard_change(shards[0].pk)
+            emptied = True
+        _record(product, -quantity, StockMovement.ORDER, order_item,
+                applied=True)
+        # an order emptying a shard checks whether it sold the last units;
+        # two orders emptying the last two shards at once can both miss it,
+        # the next rebalance corrects the flag then
+        if emptied and not _shard_totals([product.pk]).get(product.pk):
+            _forget(product)
+            _set_available(product, False)
+
+
+def take_stock(product, quantity, order_item=None):
+    """Remove `quantity` units of `product` or raise `OutOfStocksException`."""
+    if product.stock_shards:
+        _take_from_shards(product, quantity, order_item)
+    else:
+        _take_from_row(product, quantity, order_item)
+    _publish(product)
+
+
+def return_stock(product, quantity, order_item=None):
+    """Put `quantity` units of `product` back."""
+    with transaction.atomic():
+        stock_shards = Product.objects.select_for_update().values_list(
+            "stock_shards", flat=True).get(pk=product.pk)
+        if stock_shards:
+            updated = (StockShard.objects.filter(
+                pk__in=StockShard.objects.filter(product_id=product.pk)
+                .order_by('?').values('pk')[:1])
+                .update(stock=F('stock') + quantity))
+            if not updated:
+                StockShard.objects.create(
+                    product=product, index=0, stock=quantity)
+        _record(product, quantity, StockMovement.RETURN, order_item,
+                applied=bool(stock_shards))
+        record_change(product)
+        _forget(product)
+        _set_available(product, True)
+    _publish(product)
+
+
+def move_order_item_stock(item, previous):
+    """
+    Take the stock an order item was created or changed with, `previous`
+    being its values before the save (None for a new item). Only the
+    difference is moved when the quantity changes.
+    """
+    if previous is not None and previous["product_id"] != item.product_id:
+        return_stock(Product.objects.get(pk=previous["product_id"]),
+                     previous["quantity"], item)
+        previous = None
+    delta = item.quantity - (previous["quantity"] if previous else 0)
+    if delta > 0:
+        take_stock(item.product, delta, item)
+    elif delta < 0:
+        return_stock(item.product, -delta, item)
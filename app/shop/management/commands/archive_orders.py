@@ -0,0 +1,33 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.archive import archive_orders
+from shop.conf import shop_settings
+
+from .rebuild_sales_rollups import date_argument
+
+
+class Command(BaseCommand):
+    help = ("Move checked-out orders older than a cutoff, with their items, "
+            "from the order tables to the order archive.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', type=date_argument,
+            help="Archive orders created before this day (default: "
+                 "SHOP['ORDER_ARCHIVE_AFTER_DAYS'] days ago).")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Orders archived per transaction.")
+
+    def handle(self, *args, **options):
+        if options['before'] is not None:
+            before = timezone.make_aware(
+                datetime.combine(options['before'], time.min))
+        else:
+            before = timezone.now() - timedelta(
+                days=shop_settings.ORDER_ARCHIVE_AFTER_DAYS)
+        archived = archive_orders(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} orders created before {before:%Y-%m-%d}."))
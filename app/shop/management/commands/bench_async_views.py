@@ -0,0 +1,100 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from app.benchmark import (
+    benchmark_database, percentile, simulated_db_latency,
+)
+from shop.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = ("Compare sync (/product/ on a fixed pool of sync workers) and "
+            "async (/async/product/ on one ASGI event loop) throughput with "
+            "simulated database latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50,
+                            help="Concurrent clients.")
+        parser.add_argument('--requests', type=int, default=4,
+                            help="Requests per client.")
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Sync workers, like gunicorn --workers.")
+        parser.add_argument('--db-latency', type=float, default=20,
+                            help="Milliseconds added to every query.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            category = Category.objects.create(name='Benchmark')
+            Product.objects.bulk_create(
+                Product(name=f'Product {i}', category=category, price=i,
+                        stock=10, is_available=True)
+                for i in range(100))
+
+            with simulated_db_latency(options['db_latency'] / 1000):
+                for label, run in (('sync', self.run_sync),
+                                   ('async', self.run_async)):
+                    started = time.perf_counter()
+                    latencies = run(options)
+                    elapsed = time.perf_counter() - started
+                    self.report(label, latencies, elapsed)
+
+    def report(self, label, latencies, elapsed):
+        self.stdout.write(
+            f"{label:>5}: {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50={percentile(latencies, 0.5) * 1000:7.1f} ms  "
+            f"p99={percentile(latencies, 0.99) * 1000:7.1f} ms  "
+            f"({len(latencies)} requests in {elapsed:.2f}s)")
+
+    def run_sync(self, options):
+        def request(_):
+            started = time.perf_counter()
+            response = Client().get('/product/')
+            assert response.status_code == 200, response.status_code
+            connection.close()
+            return time.perf_counter() - started
+
+        total = options['clients'] * options['requests']
+        # each sync worker serves one request at a time, whatever the
+        # number of clients waiting
+        with ThreadPoolExecutor(options['workers']) as pool:
+            return list(pool.map(request, range(total)))
+
+    def run_async(self, options):
+        application = get_asgi_application()
+
+        async def request():
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': '/async/product/',
+                'query_string': b'', 'headers': [(b'host', b'testserver')],
+                'server': ('testserver', 80), 'scheme': 'http',
+                'asgi': {'version': '3.0'},
+            }
+            status = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            assert status == [200], status
+            return time.perf_counter() - started
+
+        async def client():
+            return [await request() for _ in range(options['requests'])]
+
+        async def run():
+            results = await asyncio.gather(
+                *(client() for _ in range(options['clients'])))
+            return [latency for result in results for latency in result]
+
+        return asyncio.run(run())
@@ -0,0 +1,67 @@
+import random
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from app.benchmark import benchmark_database, percentile
+from shop.autocomplete import autocomplete, lookup_database
+from shop.models import Category, Product
+
+WORDS = (
+    'acoustic', 'adapter', 'air', 'amplifier', 'battery', 'black', 'cable',
+    'camera', 'charger', 'compact', 'console', 'controller', 'desk', 'drive',
+    'gaming', 'glass', 'headphones', 'keyboard', 'lamp', 'laptop', 'lens',
+    'max', 'micro', 'mini', 'monitor', 'mouse', 'pro', 'portable', 'router',
+    'speaker', 'stand', 'tablet', 'ultra', 'watch', 'white', 'wireless',
+)
+
+
+class Command(BaseCommand):
+    help = ("Compare autocomplete lookups served by the in-process prefix "
+            "index with the database prefix query, and report the index size.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--lookups', type=int, default=2000)
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with benchmark_database():
+            categories = Category.objects.bulk_create(
+                Category(name=f'{word.title()} {i}')
+                for i, word in enumerate(WORDS))
+            Product.objects.bulk_create((
+                Product(name=' '.join(rng.sample(WORDS, 3)).title(),
+                        category=rng.choice(categories), price=1, stock=1,
+                        is_available=True)
+                for _ in range(options['products'])), batch_size=1000)
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            index = autocomplete.build()
+            built = time.perf_counter() - started
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            self.stdout.write(
+                f"index: {len(index)} keys, {size / 2 ** 20:.1f} MiB, "
+                f"built in {built * 1000:.0f} ms")
+
+            # what a user types, one keystroke at a time
+            prefixes = [word[:rng.randint(1, 5)]
+                        for word in rng.choices(WORDS, k=options['lookups'])]
+            for label, lookup in (('index', autocomplete.lookup),
+                                  ('database', lookup_database)):
+                latencies = []
+                started = time.perf_counter()
+                for prefix in prefixes:
+                    lookup_started = time.perf_counter()
+                    lookup(prefix, options['limit'])
+                    latencies.append(time.perf_counter() - lookup_started)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{label:>8}: {len(prefixes) / elapsed:10.1f} lookups/s  "
+                    f"p50={percentile(latencies, 0.5) * 1e6:8.1f} µs  "
+                    f"p99={percentile(latencies, 0.99) * 1e6:8.1f} µs")
+            autocomplete.reset()
@@ -0,0 +1,85 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from app.benchmark import benchmark_database, percentile
+from shop.inventory import current_stock, take_stock
+from shop.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = ("Compare order throughput on one hot product keeping its stock "
+            "on the product row and split across stock shards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=32,
+                            help="Concurrent ordering threads.")
+        parser.add_argument('--shards', type=int, default=16)
+        parser.add_argument('--hold', type=float, default=5,
+                            help="Milliseconds each order transaction keeps "
+                                 "running after taking the stock.")
+
+    def handle(self, *args, **options):
+        if not connection.features.has_select_for_update_skip_locked:
+            raise CommandError(
+                "Row lock contention needs a database with SELECT ... FOR "
+                "UPDATE SKIP LOCKED, run this against PostgreSQL.")
+
+        with benchmark_database():
+            category = Category.objects.create(name='Benchmark')
+            stock = options['orders'] * 2
+            products = (
+                ('single row', Product.objects.create(
+                    name='Single row', category=category, price=1,
+                    stock=stock)),
+                (f"{options['shards']} shards", Product.objects.create(
+                    name='Sharded', category=category, price=1, stock=stock,
+                    stock_shards=options['shards'])),
+            )
+            for label, product in products:
+                started = time.perf_counter()
+                latencies = self.run(product.pk, options)
+                elapsed = time.perf_counter() - started
+                self.report(label, latencies, elapsed)
+
+                # every order took exactly one unit, none were lost
+                product.refresh_from_db()
+                left = (product.shards.aggregate(total=Sum('stock'))['total']
+                        if product.stock_shards else current_stock(product))
+                if left != stock - options['orders']:
+                    raise CommandError(
+                        f"{label}: {left} left, expected "
+                        f"{stock - options['orders']}.")
+
+    def report(self, label, latencies, elapsed):
+        self.stdout.write(
+            f"{label:>10}: {len(latencies) / elapsed:8.1f} orders/s  "
+            f"p50={percentile(latencies, 0.5) * 1000:7.1f} ms  "
+            f"p99={percentile(latencies, 0.99) * 1000:7.1f} ms  "
+            f"({len(latencies)} orders in {elapsed:.2f}s)")
+
+    def run(self, product_id, options):
+        hold = options['hold'] / 1000
+        workers = options['workers']
+
+        def worker(number):
+            latencies = []
+            for _ in range(number, options['orders'], workers):
+                product = Product.objects.get(pk=product_id)
+                started = time.perf_counter()
+                with transaction.atomic():
+                    take_stock(product, 1)
+                    # the rest of the request transaction runs with the
+                    # stock locks held, as under ATOMIC_REQUESTS
+                    time.sleep(hold)
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+            return latencies
+
+        with ThreadPoolExecutor(workers) as pool:
+            results = list(pool.map(worker, range(workers)))
+        return [latency for result in results for latency in result]
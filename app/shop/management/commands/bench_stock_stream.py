@@ -0,0 +1,88 @@
+import asyncio
+import statistics
+import threading
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from shop.stream import StockHub
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the stock stream hub: memory per held connection and "
+            "fan-out latency from a publishing thread to every subscriber.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=10000)
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument(
+            '--memory-budget', type=int, default=512,
+            help="Worker memory in MB used to project capacity.")
+
+    def handle(self, *args, **options):
+        result = asyncio.run(self.run(options))
+        per_connection = result['memory'] / options['connections']
+        latencies = sorted(result['latencies'])
+
+        self.stdout.write(f"connections held:      {result['held']}")
+        self.stdout.write(
+            f"memory per connection: {per_connection / 1024:.2f} KiB")
+        self.stdout.write(
+            f"projected connections per {options['memory_budget']} MB worker: "
+            f"{int(options['memory_budget'] * 1024 * 1024 / per_connection)}")
+        self.stdout.write(f"events delivered:      {len(latencies)}")
+        self.stdout.write(f"events conflated:      {result['dropped']}")
+        p50 = statistics.median(latencies)
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        self.stdout.write(
+            f"fan-out latency ms:    p50={p50 * 1000:.2f} "
+            f"p99={p99 * 1000:.2f} max={latencies[-1] * 1000:.2f}")
+
+    async def run(self, options):
+        hub = StockHub()
+        products = options['products']
+        latencies = []
+
+        async def consume(subscription):
+            while True:
+                event = await subscription.queue.get()
+                latencies.append(time.perf_counter() - event['sent_at'])
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        subscriptions = [hub.subscribe(i % products)
+                         for i in range(options['connections'])]
+        consumers = [asyncio.ensure_future(consume(subscription))
+                     for subscription in subscriptions]
+        await asyncio.sleep(0)
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        held = hub.connection_count()
+
+        def publisher():
+            # publish from a worker thread, the way request threads do
+            for _ in range(options['events']):
+                for product_id in range(products):
+                    hub.publish(product_id, {'id': product_id,
+                                             'sent_at': time.perf_counter()})
+                time.sleep(0.01)
+
+        thread = threading.Thread(target=publisher)
+        thread.start()
+        while thread.is_alive():
+            await asyncio.sleep(0.01)
+        thread.join()
+
+        # every published event is either delivered or conflated away
+        expected = options['events'] * options['connections']
+        while (len(latencies) + sum(s.dropped for s in subscriptions)
+               < expected):
+            await asyncio.sleep(0.01)
+        dropped = sum(s.dropped for s in subscriptions)
+
+        for consumer in consumers:
+            consumer.cancel()
+        return {'held': held, 'memory': memory, 'latencies': latencies,
+                'dropped': dropped}
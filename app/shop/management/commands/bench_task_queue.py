@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from app.benchmark import benchmark_database
+from shop.models import Task
+from shop.tasks import run_pending, task
+
+
+@task
+def noop(value):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Measure how fast the background task queue takes tasks in, "
+            "one transaction per task as a request would, and drains them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Concurrent threads, 1 on databases "
+                                 "without SKIP LOCKED.")
+        parser.add_argument('--batch-size', type=int, action='append',
+                            help="Tasks claimed per transaction, may be "
+                                 "repeated (default: 1, 10, 100).")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if not connection.features.has_select_for_update_skip_locked:
+            workers = 1
+        with benchmark_database():
+            for batch_size in options['batch_size'] or (1, 10, 100):
+                elapsed = self.run(workers, self.enqueue, options['tasks'])
+                self.stdout.write(
+                    f"enqueue:              {options['tasks'] / elapsed:8.1f} "
+                    f"tasks/s ({workers} workers)")
+                elapsed = self.run(workers, self.drain, batch_size)
+                left = Task.objects.count()
+                self.stdout.write(
+                    f"drain, batches of {batch_size:>3}: "
+                    f"{options['tasks'] / elapsed:8.1f} tasks/s"
+                    + (f", {left} left" if left else ""))
+
+    def enqueue(self, number, workers, count):
+        for value in range(number, count, workers):
+            with transaction.atomic():
+                noop.enqueue(value)
+
+    def drain(self, number, workers, batch_size):
+        while run_pending(batch_size):
+            pass
+
+    def run(self, workers, function, argument):
+        def worker(number):
+            try:
+                function(number, workers, argument)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(worker, range(workers)))
+        return time.perf_counter() - started
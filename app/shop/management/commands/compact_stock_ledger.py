@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from shop.inventory import compact
+
+
+class Command(BaseCommand):
+    help = ("Apply pending stock ledger movements to the product stock "
+            "snapshots. Run it periodically, e.g. every minute from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Products compacted per transaction.")
+
+    def handle(self, *args, **options):
+        compacted = compact(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted the stock of {compacted} products."))
@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import partitions
+from shop.conf import shop_settings
+
+
+def month_argument(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise CommandError(f"Invalid month: {value}, expected YYYY-MM.")
+
+
+class Command(BaseCommand):
+    help = ("Manage the monthly PostgreSQL partitions of the order tables: "
+            "create the coming months, list them, or detach old ones.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['create', 'list', 'detach'])
+        parser.add_argument(
+            '--ahead', type=int,
+            help="create: months to create after the current one "
+                 "(default: SHOP['ORDER_PARTITIONS_AHEAD']).")
+        parser.add_argument('--before', type=month_argument,
+                            help="detach: partitions of months before "
+                                 "this one, as YYYY-MM.")
+        parser.add_argument('--drop', action='store_true',
+                            help="detach: drop the detached tables.")
+        parser.add_argument('--force', action='store_true',
+                            help="detach: also detach partitions that still "
+                                 "hold orders, e.g. never checked out.")
+
+    def handle(self, *args, **options):
+        if not partitions.supported():
+            raise CommandError("Order partitions need PostgreSQL.")
+        getattr(self, options['action'])(options)
+
+    def create(self, options):
+        ahead = options['ahead']
+        if ahead is None:
+            ahead = shop_settings.ORDER_PARTITIONS_AHEAD
+        created = partitions.create_partitions(ahead)
+        for name in created:
+            self.stdout.write(f"Created {name}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(created)} partitions."))
+
+    def list(self, options):
+        for table in partitions.PARTITIONED:
+            for month, name in sorted(partitions.partitions(table).items()):
+                self.stdout.write(
+                    f"{name}: {partitions.row_count(name)} rows")
+            default = partitions.default_partition(table)
+            self.stdout.write(
+                f"{default}: {partitions.row_count(default)} rows")
+
+    def detach(self, options):
+        if options['before'] is None:
+            raise CommandError("detach needs --before YYYY-MM.")
+        tables = list(partitions.PARTITIONED)
+        months = sorted(
+            {month for table in tables
+             for month in partitions.partitions(table)
+             if month < options['before']})
+        detached = 0
+        for month in months:
+            names = {table: partitions.partitions(table).get(month)
+                     for table in tables}
+            rows = sum(partitions.row_count(name)
+                       for name in names.values() if name)
+            if rows and not options['force']:
+                self.stderr.write(
+                    f"Skipped {month:%Y-%m}: {rows} rows not archived.")
+                continue
+            for table, name in names.items():
+                if name:
+                    partitions.detach_partition(
+                        table, month, drop=options['drop'])
+                    action = 'Dropped' if options['drop'] else 'Detached'
+                    self.stdout.write(f"{action} {name}")
+                    detached += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Detached {detached} partitions."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from shop.idempotency import prune
+
+
+class Command(BaseCommand):
+    help = ("Delete the Idempotency-Key claims older than IDEMPOTENCY_TTL. "
+            "Run it periodically, e.g. hourly from cron.")
+
+    def handle(self, *args, **options):
+        pruned = prune()
+        self.stdout.write(self.style.SUCCESS(
+            f"Pruned {pruned} idempotency keys."))
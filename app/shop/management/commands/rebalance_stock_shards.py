@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = ("Spread the stock of sharded products evenly over their shards "
+            "again, optionally changing the number of shards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append',
+                            dest='products', metavar='ID',
+                            help="Product to rebalance, repeatable "
+                                 "(default: every sharded product).")
+        parser.add_argument('--shards', type=int,
+                            help="New number of shards, 0 moves the stock "
+                                 "back onto the product row.")
+
+    def handle(self, *args, **options):
+        shards = options['shards']
+        if shards is not None and shards < 0:
+            raise CommandError("--shards can't be negative.")
+        if options['products']:
+            products = Product.objects.filter(pk__in=options['products'])
+            missing = set(options['products']) - set(
+                products.values_list('pk', flat=True))
+            if missing:
+                names = ', '.join(map(str, sorted(missing)))
+                raise CommandError(f"Unknown products: {names}.")
+        elif shards is None:
+            products = Product.objects.filter(stock_shards__gt=0)
+        else:
+            raise CommandError("--shards needs at least one --product.")
+
+        count = 0
+        for product in products.order_by('pk').iterator():
+            if shards is not None:
+                product.stock_shards = shards
+            # saving a sharded product locks its shards, totals them and
+            # spreads the total evenly over `stock_shards` rows
+            product.save()
+            count += 1
+            self.stdout.write(
+                f"{product.name}: {product.stock} in stock over "
+                f"{product.stock_shards} shards")
+        self.stdout.write(self.style.SUCCESS(f"Rebalanced {count} products."))
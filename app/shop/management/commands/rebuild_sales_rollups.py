@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from shop.models import DailyCategorySales, DailyProductSales
+from shop.rollups import rebuild
+
+
+def date_argument(value):
+    date = parse_date(value)
+    if date is None:
+        raise CommandError(f"Invalid date: {value}, expected YYYY-MM-DD.")
+    return date
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the daily product and category sales rollups from "
+            "checked-out orders.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start', type=date_argument,
+            help="First day to rebuild (default: all history).")
+        parser.add_argument(
+            '--end', type=date_argument,
+            help="Last day to rebuild (default: the latest check-out).")
+
+    def handle(self, *args, **options):
+        rebuild(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {DailyProductSales.objects.count()} product and "
+            f"{DailyCategorySales.objects.count()} category rollup rows."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.inventory import reconcile
+
+
+class Command(BaseCommand):
+    help = ("Verify every product stock snapshot, stock shard total and "
+            "availability flag against the stock ledger.")
+
+    def handle(self, *args, **options):
+        problems = reconcile()
+        for product, problem in problems:
+            self.stderr.write(f"{product.name} (#{product.pk}): {problem}")
+        if problems:
+            raise CommandError(
+                f"{len(problems)} stock problems found.")
+        self.stdout.write(self.style.SUCCESS(
+            "Every product stock matches the ledger."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.conf import shop_settings
+from shop.tasks import drain, run_pending
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks, see shop.tasks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once no task is due.")
+        parser.add_argument('--batch-size', type=int,
+                            help="Tasks claimed per transaction.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            ran = drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} tasks."))
+            return
+        try:
+            while True:
+                if not run_pending(options['batch_size']):
+                    time.sleep(shop_settings.TASK_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from shop.models import RelatedProduct
+from shop.recommendations import rebuild, update
+
+
+class Command(BaseCommand):
+    help = ("Count the orders checked out since the last run into the "
+            "\"frequently bought together\" recommendations.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Recompute them from every checked-out order.")
+        parser.add_argument('--batch-size', type=int,
+                            help="Orders counted per transaction.")
+
+    def handle(self, *args, **options):
+        run = rebuild if options['rebuild'] else update
+        counted = run(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {counted} orders, "
+            f"{RelatedProduct.objects.count()} related products."))
@@ -0,0 +1,55 @@
+# Generated by Django 4.0.1 on 2026-10-19 14:57
+
+from django.db import migrations, models
+
+
+def stamp_existing_rows(apps, schema_editor):
+    ChangeSequence = apps.get_model('shop', 'ChangeSequence')
+    seq = 0
+    for model_name in ('Category', 'Product'):
+        model = apps.get_model('shop', model_name)
+        for pk in model._base_manager.order_by('pk').values_list('pk', flat=True):
+            seq += 1
+            model._base_manager.filter(pk=pk).update(change_seq=seq)
+    ChangeSequence.objects.create(name='catalog', value=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_alter_category_options_alter_order_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('product', 'Product'), ('category', 'Category')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField(db_index=True)),
+            ],
+            options={
+                'ordering': ('change_seq',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(stamp_existing_rows, migrations.RunPython.noop),
+    ]
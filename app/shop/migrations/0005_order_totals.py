@@ -0,0 +1,51 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+
+
+def snapshot_prices_and_totals(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    Product = apps.get_model('shop', 'Product')
+
+    OrderItem.objects.update(unit_price=Subquery(
+        Product._base_manager.filter(pk=OuterRef('product_id'))
+        .values('price')[:1]))
+
+    items = OrderItem.objects.filter(order_id=OuterRef('pk')).order_by()
+    Order.objects.filter(orderitem__isnull=False).update(
+        total_amount=Subquery(
+            items.values('order_id')
+            .annotate(amount=Sum(F('quantity') * F('unit_price')))
+            .values('amount')),
+        item_count=Subquery(
+            items.values('order_id')
+            .annotate(count=Sum('quantity'))
+            .values('count')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_catalog_change_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Units across all items.'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Total (NGN)'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Unit price (NGN)'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(snapshot_prices_and_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.0.1 on 2026-10-19 15:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_checked_out_at(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    # the check-out time was not recorded, the last update is the best guess
+    Order.objects.filter(is_checked_out=True).update(
+        checked_out_at=models.F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='checked_out_at',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.PositiveBigIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.product')),
+            ],
+            options={
+                'ordering': ('-date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.PositiveBigIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.category')),
+            ],
+            options={
+                'ordering': ('-date',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailyproductsales',
+            index=models.Index(fields=['product', 'date'], name='shop_dailyp_product_77dfc9_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('date', 'product'), name='unique_daily_product_sales'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycategorysales',
+            index=models.Index(fields=['category', 'date'], name='shop_dailyc_categor_26647f_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorysales',
+            constraint=models.UniqueConstraint(fields=('date', 'category'), name='unique_daily_category_sales'),
+        ),
+        migrations.RunPython(backfill_checked_out_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.1 on 2026-10-19 15:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def open_ledger(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    StockMovement = apps.get_model('shop', 'StockMovement')
+    # one applied opening movement per product, so the snapshot (or the
+    # shards of a sharded product) adds up to the ledger from the start
+    products = Product._base_manager.annotate(
+        shard_total=models.Sum('shards__stock')).values_list(
+        'pk', 'stock', 'stock_shards', 'shard_total')
+    StockMovement.objects.bulk_create((
+        StockMovement(product_id=pk, reason='adjustment', applied=True,
+                      delta=(shard_total or 0) if stock_shards else stock)
+        for pk, stock, stock_shards, shard_total in products.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_stock_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('order', 'Ordered'), ('return', 'Returned from an order'), ('adjustment', 'Stock edited')], max_length=16)),
+                ('applied', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order_item', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shop.orderitem')),
+                ('product', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='stock_movements', to='shop.product')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(condition=models.Q(('applied', False)), fields=['product'], name='shop_stock_movement_pending'),
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.0.1 on 2026-10-19 15:36
+
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# months of partitions created ahead of the current one
+PARTITIONS_AHEAD = 3
+
+
+def backfill_order_created_at(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    OrderItem.objects.update(order_created_at=models.Subquery(
+        Order.objects.filter(pk=models.OuterRef('order_id'))
+        .values('created_at')[:1]))
+
+
+def partition_orders(apps, schema_editor):
+    from shop import partitions
+
+    if not partitions.supported(schema_editor.connection):
+        return
+    Order = apps.get_model('shop', 'Order')
+    current = partitions.month_start(django.utils.timezone.now())
+    months = set(Order.objects.datetimes(
+        'created_at', 'month', tzinfo=datetime.timezone.utc))
+    months.update(partitions.add_months(current, offset)
+                  for offset in range(PARTITIONS_AHEAD + 1))
+    for table in partitions.PARTITIONED:
+        partitions.partition_table(schema_editor, table, sorted(months))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shop', '0008_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='order_created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_order_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='shop.order'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('checked_out_at', models.DateTimeField(null=True)),
+                ('total_amount', models.PositiveBigIntegerField(verbose_name='Total (NGN)')),
+                ('item_count', models.PositiveIntegerField()),
+                ('items', models.JSONField(default=list)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('created_at', 'updated_at'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', 'created_at'], name='shop_archiv_user_id_81b572_idx'),
+        ),
+        migrations.RunPython(partition_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-19 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_order_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockshard',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, editable=False, null=True),
+        ),
+    ]
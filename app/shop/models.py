@@ -1,7 +1,9 @@
 import logging
-from django.db import IntegrityError, models
+from django.db import IntegrityError, models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from django.conf import settings
+from django.utils import timezone
 
 from shop.exceptions import OutOfStocksException
 # Create your models here.
@@ -15,8 +17,49 @@ class DateTimeStampedModel(models.Model):
         abstract = True
 
 
+class ChangeSequence(models.Model):
+    """Named counter handing out monotonic change sequence numbers."""
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+    @classmethod
+    def next_value(cls, name):
+        # the row lock taken by the update is held until the caller commits,
+        # so sequence numbers become visible in the order they were issued;
+        # the catalog change feed uses it on SQLite only, see shop.changes
+        with transaction.atomic():
+            updated = cls.objects.filter(name=name).update(
+                value=models.F('value') + 1)
+            if not updated:
+                cls.objects.get_or_create(name=name)
+                return cls.next_value(name)
+            return cls.objects.values_list('value', flat=True).get(name=name)
+
+
+class CatalogTombstone(models.Model):
+    """Marks a catalog row deleted at a point of the change sequence."""
+    PRODUCT = 'product'
+    CATEGORY = 'category'
+    KIND_CHOICES = ((PRODUCT, 'Product'), (CATEGORY, 'Category'))
+
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField(db_index=True)
+
+    class Meta:
+        ordering = ('change_seq',)
+
+    def __str__(self):
+        return f'Deleted {self.kind} {self.object_id}'
+
+
 class Category(models.Model):
     name = models.CharField(max_length=255)
+    change_seq = models.BigIntegerField(
+        default=0, db_index=True, editable=False)
 
     class Meta:
         verbose_name = 'Category'
@@ -26,6 +69,11 @@ class Category(models.Model):
     def __str__(self):
         return f'Category: {self.name}'
 
+    def save(self, *args, **kwargs):
+        # the change feed stamps the row in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 
 class AvailableProductManager(models.Manager):
     def get_queryset(self) -> models.QuerySet:
@@ -40,30 +88,97 @@ class Product(models.Model):
     price = models.PositiveIntegerField(verbose_name="Price (NGN)")
     stock = models.PositiveIntegerField()
     is_available = models.BooleanField(editable=False)
+    stock_shards = models.PositiveSmallIntegerField(
+        default=0, help_text=(
+            "Split the stock over this many counter rows so concurrent "
+            "orders don't queue on one row lock. 0 keeps it on the product."))
+    change_seq = models.BigIntegerField(
+        default=0, db_index=True, editable=False)
 
     available = AvailableProductManager()
     objects = models.Manager()
 
+    TRACKED_FIELDS = ("stock", "stock_shards")
+
     class Meta:
         ordering = ('name', 'description', 'price')
 
     def __str__(self):
         return f"Product: {self.name} (NGN {self.price})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.TRACKED_FIELDS}
+        return instance
+
     def save(self, *args, **kwargs):
-        # a signal could be better for enterprise level implementations
-        self.check_product_inventory()
-        super().save(*args, **kwargs)
+        from shop.inventory import (
+            distribute_stock, lock_stock, record_adjustment,
+        )
+
+        loaded = getattr(self, "_loaded", {})
+        was_sharded = bool(loaded.get("stock_shards"))
+        with transaction.atomic():
+            stock, shards = (0, []) if self._state.adding else lock_stock(
+                self, was_sharded)
+            if not self._state.adding and self.stock == loaded.get("stock"):
+                # the stock wasn't edited, keep what is left of it now
+                self.stock = stock
+            # a signal could be better for enterprise level implementations
+            self.check_product_inventory()
+            # nothing is pending right after a save
+            self._live_stock = self.stock
+            super().save(*args, **kwargs)
+            if self.stock != stock:
+                record_adjustment(self, self.stock - stock)
+            if self.stock_shards or was_sharded:
+                distribute_stock(self, shards)
+        self._loaded = {name: getattr(self, name)
+                        for name in self.TRACKED_FIELDS}
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop("_live_stock", None)
 
     def check_product_inventory(self):
         self.is_available = self.stock > 0
 
 
+class StockShard(models.Model):
+    """One of the counter rows holding the stock of a sharded product."""
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="shards")
+    index = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+    # stamped by the orders taking from it, the change feed reports the
+    # product without its row being locked, see shop.changes
+    change_seq = models.BigIntegerField(
+        null=True, db_index=True, editable=False)
+
+    class Meta:
+        ordering = ("product", "index")
+        constraints = [models.UniqueConstraint(
+            fields=["product", "index"], name="unique_stock_shard")]
+
+    def __str__(self):
+        return f"Shard {self.index} of product {self.product_id}: {self.stock}"
+
+
 class Order(DateTimeStampedModel):
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE)
     products = models.ManyToManyField(Product, through="OrderItem")
     is_checked_out = models.BooleanField(default=False, editable=False)
+    # maintained by OrderItem writes, in the same transaction
+    total_amount = models.PositiveBigIntegerField(
+        default=0, editable=False, verbose_name="Total (NGN)")
+    item_count = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Units across all items.")
+    checked_out_at = models.DateTimeField(
+        null=True, editable=False, db_index=True)
 
     class Meta:
         ordering = ("created_at", "updated_at")
@@ -72,15 +187,26 @@ class Order(DateTimeStampedModel):
         return f"Order by {self.user.name}"
 
     def check_out_order(self):
-        self.is_checked_out = True
-        self.save(update_fields=["is_checked_out"])
+        from shop.checkout import check_out
+
+        return check_out(self)
 
 
 class OrderItem(models.Model):
-    order = models.ForeignKey(Order, on_delete=models.CASCADE)
+    # orders are partitioned on PostgreSQL and their primary key includes
+    # created_at, so the database can't enforce this reference
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     # the smallest possible value to order is 1
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    # product price when the item was ordered
+    unit_price = models.PositiveIntegerField(
+        editable=False, verbose_name="Unit price (NGN)")
+    # created_at of the order, items are partitioned with their order
+    order_created_at = models.DateTimeField(editable=False)
+
+    TRACKED_FIELDS = ("order_id", "product_id", "quantity", "unit_price")
 
     class Meta:
         ordering = ("order",)
@@ -88,16 +214,64 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"Ordered {self.quantity} of {self.product}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.TRACKED_FIELDS}
+        return instance
+
     def save(self, *args, **kwargs):
         self._validate_product_inventory()
+        previous = None if self._state.adding else self._previous_values()
+        if previous is None or previous.get("product_id") != self.product_id:
+            self.unit_price = self.product.price
+        if previous is None or previous.get("order_id") != self.order_id:
+            self.order_created_at = self.order.created_at
         try:
-            super().save(*args, **kwargs)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                self._update_order_totals(previous)
         except IntegrityError:
             logging.exception("Product is not available")
             raise OutOfStocksException
+        except OutOfStocksException:
+            raise
         except Exception as e:
-            logging.exception("An exception occurred while saving ", e)
+            logging.exception("An exception occurred while saving %s", e)
             raise e
+        self._loaded = {name: getattr(self, name)
+                        for name in self.TRACKED_FIELDS}
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+    def _previous_values(self):
+        # `_loaded` keeps these until save() returns, so the post_save
+        # stock signal sees the values from before the save as well
+        previous = getattr(self, "_loaded", None)
+        if previous is None or len(previous) < len(self.TRACKED_FIELDS):
+            previous = self._loaded = OrderItem.objects.filter(
+                pk=self.pk).values(*self.TRACKED_FIELDS).first()
+        return previous
+
+    def _update_order_totals(self, previous):
+        amount, count = self.line_total, self.quantity
+        if previous is not None:
+            old_amount = previous["quantity"] * previous["unit_price"]
+            if previous["order_id"] == self.order_id:
+                amount -= old_amount
+                count -= previous["quantity"]
+            else:
+                Order.objects.filter(pk=previous["order_id"]).update(
+                    total_amount=models.F("total_amount") - old_amount,
+                    item_count=models.F("item_count") - previous["quantity"])
+        if amount or count:
+            Order.objects.filter(pk=self.order_id).update(
+                total_amount=models.F("total_amount") + amount,
+                item_count=models.F("item_count") + count)
 
     def _validate_product_inventory(self):
 
@@ -106,3 +280,211 @@ class OrderItem(models.Model):
                 f"The item {self.product.name} is out of stock")
             raise OutOfStocksException(
                 f"The item {self.product.name} is out of stock")
+
+
+class StockMovement(models.Model):
+    """
+    Append-only record of one change to the stock of a product. Movements
+    are applied to `Product.stock` in batches by the ledger compaction.
+    """
+    ORDER = "order"
+    RETURN = "return"
+    ADJUSTMENT = "adjustment"
+    REASON_CHOICES = (
+        (ORDER, "Ordered"),
+        (RETURN, "Returned from an order"),
+        (ADJUSTMENT, "Stock edited"),
+    )
+
+    # movements are kept after the product or item is deleted, for audit
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name="stock_movements")
+    order_item = models.ForeignKey(
+        OrderItem, null=True, blank=True, on_delete=models.DO_NOTHING,
+        db_constraint=False, related_name="+")
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=16, choices=REASON_CHOICES)
+    applied = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("id",)
+        indexes = [models.Index(
+            fields=["product"], condition=models.Q(applied=False),
+            name="shop_stock_movement_pending")]
+
+    def __str__(self):
+        return f"{self.delta:+} of product {self.product_id} ({self.reason})"
+
+
+class ArchivedOrder(models.Model):
+    """
+    A checked-out order moved out of the order tables with its items, see
+    `shop.archive`. Keeps the order id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name="archived_orders")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    checked_out_at = models.DateTimeField(null=True)
+    total_amount = models.PositiveBigIntegerField(verbose_name="Total (NGN)")
+    item_count = models.PositiveIntegerField()
+    # [{"id", "product", "quantity", "unit_price"}, ...]
+    items = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    # only checked-out orders are archived
+    is_checked_out = True
+
+    class Meta:
+        ordering = ("created_at", "updated_at")
+        indexes = [models.Index(fields=["user", "created_at"])]
+
+    def __str__(self):
+        return f"Archived order {self.pk} of user {self.user_id}"
+
+
+class DailyProductSales(models.Model):
+    """Units sold and revenue per product per day, from checked-out orders."""
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="daily_sales")
+    quantity = models.PositiveBigIntegerField(default=0)
+    revenue = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-date",)
+        constraints = [models.UniqueConstraint(
+            fields=["date", "product"], name="unique_daily_product_sales")]
+        indexes = [models.Index(fields=["product", "date"])]
+
+    def __str__(self):
+        return f"{self.date}: {self.quantity} of product {self.product_id}"
+
+
+class DailyCategorySales(models.Model):
+    """Units sold and revenue per category per day, from checked-out orders."""
+    date = models.DateField()
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="daily_sales")
+    quantity = models.PositiveBigIntegerField(default=0)
+    revenue = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ("-date",)
+        constraints = [models.UniqueConstraint(
+            fields=["date", "category"], name="unique_daily_category_sales")]
+        indexes = [models.Index(fields=["category", "date"])]
+
+    def __str__(self):
+        return f"{self.date}: {self.quantity} in category {self.category_id}"
+
+
+class PendingCoPurchase(models.Model):
+    """A checked-out order not counted into `ProductPair` yet."""
+    # orders are partitioned, see OrderItem.order
+    order = models.ForeignKey(
+        Order, on_delete=models.DO_NOTHING, db_constraint=False)
+
+    class Meta:
+        ordering = ("id",)
+
+    def __str__(self):
+        return f"Co-purchases of order {self.order_id}"
+
+
+class ProductPair(models.Model):
+    """
+    Number of checked-out orders containing both products. Every pair is
+    stored in both directions.
+    """
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="+")
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ("product", "-orders", "other")
+        constraints = [models.UniqueConstraint(
+            fields=["product", "other"], name="unique_product_pair")]
+
+    def __str__(self):
+        return (f"Products {self.product_id} and {self.other_id} "
+                f"bought together {self.orders} times")
+
+
+class RelatedProduct(models.Model):
+    """The products most often bought with a product, ranked from 0."""
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="neighbors")
+    related = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="neighbor_of")
+    orders = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ("product", "rank")
+        constraints = [models.UniqueConstraint(
+            fields=["product", "rank"], name="unique_related_product_rank")]
+
+    def __str__(self):
+        return (f"Product {self.related_id} is #{self.rank} "
+                f"for {self.product_id}")
+
+
+class Task(models.Model):
+    """A queued call of a function decorated with `shop.tasks.task`."""
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # set once the task has failed TASK_MAX_ATTEMPTS times, it isn't retried
+    failed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("run_at", "id")
+        indexes = [models.Index(
+            fields=["run_at", "id"],
+            condition=models.Q(failed_at__isnull=True), name="shop_task_due")]
+
+    def __str__(self):
+        return f"{self.name}{tuple(self.args)}"
+
+
+class OrderSummary(models.Model):
+    """
+    The order summary of a user, see `shop.summaries`. Every write to the
+    user's orders bumps `version` and clears `summary`, in its transaction.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+        related_name="+")
+    version = models.PositiveBigIntegerField(default=0)
+    # the history page size `summary` was built for
+    page_size = models.PositiveSmallIntegerField(null=True)
+    summary = models.JSONField(null=True)
+
+    def __str__(self):
+        return f"Order summary of user {self.user_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A write request claimed by its `Idempotency-Key`, see
+    `shop.idempotency`. Inserted in the request transaction, an attempt in
+    another worker waits for it and replays `response`.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    fingerprint = models.CharField(max_length=64)
+    # status, data and replayed headers, set once the request has run
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,173 @@
+"""Monthly range partitions of the order tables on PostgreSQL.
+
+`shop_order` is partitioned on `created_at` and `shop_orderitem` on
+`order_created_at`, the created_at of its order, so an order and its items
+always live in the same month. Partitions are named `<table>_pYYYY_MM` and
+each table has a `<table>_default` partition catching rows of months that
+have no partition yet; `create_partition` moves those rows over.
+
+Other databases keep plain tables, every function here is a no-op there.
+"""
+
+from datetime import datetime, timezone
+
+from django.db import connection, transaction
+
+from .models import Order, OrderItem
+
+# table -> partition key column
+PARTITIONED = {
+    Order._meta.db_table: 'created_at',
+    OrderItem._meta.db_table: 'order_created_at',
+}
+
+
+def supported(using=connection):
+    return using.vendor == 'postgresql'
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def default_partition(table):
+    return f'{table}_default'
+
+
+def partitions(table, using=connection):
+    """The month partitions of `table`, as `{month: name}`."""
+    with using.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass', [table])
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{table}_p'
+    return {
+        datetime.strptime(name[len(prefix):], '%Y_%m').replace(
+            tzinfo=timezone.utc): name
+        for name in names if name.startswith(prefix)
+    }
+
+
+def is_partitioned(table, using=connection):
+    with using.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_partitioned_table '
+                       'WHERE partrelid = %s::regclass', [table])
+        return cursor.fetchone() is not None
+
+
+def create_partition(table, month, using=connection):
+    """Create the partition of `table` for `month` unless it exists."""
+    name = partition_name(table, month)
+    if month in partitions(table, using):
+        return False
+    column = PARTITIONED[table]
+    default = default_partition(table)
+    start, end = month, add_months(month, 1)
+    quote = using.ops.quote_name
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} (LIKE {quote(table)} '
+            f'INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        # rows of the month that landed in the default partition meanwhile
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {quote(default)} '
+            f'WHERE {quote(column)} >= %s AND {quote(column)} < %s '
+            f'RETURNING *) INSERT INTO {quote(name)} SELECT * FROM moved',
+            [start, end])
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} '
+            f'FOR VALUES FROM (%s) TO (%s)', [start, end])
+    return True
+
+
+def create_partitions(ahead, now=None, using=connection):
+    """Create partitions of both tables up to `ahead` months from now."""
+    current = month_start(now or datetime.now(timezone.utc))
+    return [
+        partition_name(table, add_months(current, offset))
+        for offset in range(ahead + 1)
+        for table in PARTITIONED
+        if create_partition(table, add_months(current, offset), using)
+    ]
+
+
+def row_count(name, using=connection):
+    with using.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {using.ops.quote_name(name)}')
+        return cursor.fetchone()[0]
+
+
+def detach_partition(table, month, drop=False, using=connection):
+    name = partitions(table, using)[month]
+    quote = using.ops.quote_name
+    with transaction.atomic(using=using.alias), using.cursor() as cursor:
+        cursor.execute(
+            f'ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}')
+        if drop:
+            # deferred foreign key checks of rows deleted earlier in the
+            # transaction would keep the table in use
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute(f'DROP TABLE {quote(name)}')
+    return name
+
+
+def partition_table(schema_editor, table, months):
+    """
+    Turn the plain `table` into a partitioned one with the same name,
+    columns, checks, indexes and foreign keys, plus the partitions of
+    `months` and the default one, and copy its rows over.
+    """
+    column = PARTITIONED[table]
+    old = f'{table}_unpartitioned'
+    quote = schema_editor.quote_name
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s "
+            "AND indexname NOT IN (SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'p')", [table, table])
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('f', 'p')", [table])
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+    execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(old)}')
+    # free the index and constraint names for the new table
+    for name, _ in constraints:
+        execute(f'ALTER TABLE {quote(old)} DROP CONSTRAINT {quote(name)}')
+    for name, _ in indexes:
+        execute(f'DROP INDEX {quote(name)}')
+
+    execute(
+        f'CREATE TABLE {quote(table)} (LIKE {quote(old)} INCLUDING DEFAULTS '
+        f'INCLUDING CONSTRAINTS) PARTITION BY RANGE ({quote(column)})')
+    for name, definition in constraints:
+        if definition.startswith('PRIMARY KEY'):
+            # unique constraints of a partitioned table include its key
+            definition = f'PRIMARY KEY (id, {quote(column)})'
+        execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} '
+                f'{definition}')
+    for _, definition in indexes:
+        execute(definition)
+    execute(f'CREATE TABLE {quote(default_partition(table))} '
+            f'PARTITION OF {quote(table)} DEFAULT')
+    for month in months:
+        create_partition(table, month, schema_editor.connection)
+
+    execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(old)}')
+    execute(f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.id')
+    execute(f'DROP TABLE {quote(old)}')
@@ -1,6 +1,43 @@
 from rest_framework import permissions
 
 
+def owner_id(obj, owner_field):
+    """
+    The id of the user owning `obj`, following the `owner_field` lookup
+    (`"user"`, `"order__user"`, `"pk"` for users themselves). Only the
+    foreign key id is read, the user row is never loaded.
+    """
+    *path, field = owner_field.split("__")
+    for name in path:
+        obj = getattr(obj, name)
+    if field == "pk":
+        return obj.pk
+    return getattr(obj, obj._meta.get_field(field).attname)
+
+
+class OwnedQuerysetMixin:
+    """
+    Limit a viewset's queryset to the objects the user owns, through the
+    `owner_field` lookup to the owning user. Staff see everything, anonymous
+    users nothing. Other users' objects are then simply not found, and the
+    relations on the way to the owner are selected so `IsOwnerOrAdmin` needs
+    no query.
+    """
+    owner_field = "user"
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_staff:
+            return queryset
+        if not user.is_authenticated:
+            return queryset.none()
+        *path, _ = self.owner_field.split("__")
+        if path:
+            queryset = queryset.select_related("__".join(path))
+        return queryset.filter(**{self.owner_field: user.pk})
+
+
 class IsAdminOrReadOnly(permissions.BasePermission):
     """
     Custom permission to only allow admins to have full access.
@@ -32,7 +69,10 @@ class IsOwnerOrAdmin(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Write permissions are only allowed to the owner or admin.
-        return obj.user == request.user or request.user.is_staff
+        if request.user.is_staff:
+            return True
+        owner_field = getattr(view, "owner_field", "user")
+        return owner_id(obj, owner_field) == request.user.pk
 
 
 class IsLoggedInUserOrAdmin(permissions.BasePermission):
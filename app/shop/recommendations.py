@@ -0,0 +1,136 @@
+"""Frequently bought together recommendations.
+
+`ProductPair` is the sparse co-occurrence matrix of the catalog: for every
+two products bought in the same checked-out order, the number of such
+orders. `RelatedProduct` keeps the `RELATED_PRODUCTS_TOP_K` most frequent
+partners of each product, ranked, so a product page reads them in one
+indexed query.
+
+Check-out queues the order in `PendingCoPurchase` in its transaction and
+`update` counts the queued orders in batches: one grouped self-join of their
+items gives the pair counts of a batch, which are added to the matrix, and
+the neighbors of the products involved are ranked again. `rebuild`
+recomputes the matrix from every checked-out order. Neither is meant to run
+concurrently with itself. Archived orders are gone from the order tables, a
+rebuild drops their pairs.
+"""
+
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef
+
+from .conf import shop_settings
+from .models import OrderItem, PendingCoPurchase, ProductPair, RelatedProduct
+
+# rows per INSERT, three parameters each
+UPSERT_BATCH_SIZE = 300
+
+
+def queue_checkout(order):
+    PendingCoPurchase.objects.create(order_id=order.pk)
+
+
+def _pair_counts(items):
+    """Orders per product pair among `items`, as `(product, other, orders)`
+    with `product < other`."""
+    return (
+        items.filter(order__orderitem__product_id__gt=F('product_id'))
+        .order_by()
+        .values_list('product_id', F('order__orderitem__product_id'))
+        .annotate(orders=Count('order_id', distinct=True))
+    )
+
+
+def _rank(product_ids=None):
+    """Rank the neighbors of `product_ids` again, of every product if None."""
+    pairs = ProductPair.objects.order_by('product', '-orders', 'other')
+    neighbors = RelatedProduct.objects.all()
+    if product_ids is not None:
+        pairs = pairs.filter(product_id__in=product_ids)
+        neighbors = neighbors.filter(product_id__in=product_ids)
+    neighbors.delete()
+
+    top_k = shop_settings.RELATED_PRODUCTS_TOP_K
+    ranked = Counter()
+
+    def rows():
+        for product, other, orders in pairs.values_list(
+                'product_id', 'other_id', 'orders').iterator():
+            rank = ranked[product]
+            if rank < top_k:
+                ranked[product] += 1
+                yield RelatedProduct(product_id=product, related_id=other,
+                                     orders=orders, rank=rank)
+
+    RelatedProduct.objects.bulk_create(rows(), batch_size=1000)
+
+
+def _add_pairs(counts):
+    """Add `{(product, other): orders}` to the matrix, both directions."""
+    counts = Counter(counts)
+    counts.update({(other, product): orders
+                   for (product, other), orders in list(counts.items())})
+    rows = [(product, other, orders)
+            for (product, other), orders in counts.items()]
+    quote = connection.ops.quote_name
+    table = quote(ProductPair._meta.db_table)
+    # an upsert, the pairs of a batch are never read back
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            values = ', '.join(['(%s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} (product_id, other_id, orders) '
+                f'VALUES {values} ON CONFLICT (product_id, other_id) '
+                f'DO UPDATE SET orders = {table}.orders + excluded.orders',
+                [value for row in batch for value in row])
+    return {product for product, _ in counts}
+
+
+def update(batch_size=None):
+    """
+    Count the queued orders into the matrix, one transaction per batch.
+    Returns the number of orders counted.
+    """
+    batch_size = batch_size or shop_settings.RELATED_PRODUCTS_BATCH_SIZE
+    counted = 0
+    while True:
+        with transaction.atomic():
+            batch = dict(PendingCoPurchase.objects.order_by('pk').values_list(
+                'pk', 'order_id')[:batch_size])
+            if not batch:
+                return counted
+            counts = {
+                (product, other): orders for product, other, orders in
+                _pair_counts(OrderItem.objects.filter(
+                    order_id__in=set(batch.values())))
+            }
+            if counts:
+                _rank(_add_pairs(counts))
+            PendingCoPurchase.objects.filter(pk__in=batch).delete()
+        counted += len(batch)
+
+
+def rebuild(batch_size=None):
+    """
+    Recompute the matrix and the neighbors from every checked-out order.
+    Returns the number of queued orders counted afterwards.
+    """
+    queued = PendingCoPurchase.objects.filter(order_id=OuterRef('order_id'))
+    items = OrderItem.objects.filter(order__is_checked_out=True).exclude(
+        Exists(queued))
+    with transaction.atomic():
+        ProductPair.objects.all().delete()
+
+        def pairs():
+            # queued orders are left out, `update` counts them next
+            for product, other, orders in _pair_counts(items).iterator():
+                yield ProductPair(product_id=product, other_id=other,
+                                  orders=orders)
+                yield ProductPair(product_id=other, other_id=product,
+                                  orders=orders)
+
+        ProductPair.objects.bulk_create(pairs(), batch_size=1000)
+        _rank()
+    return update(batch_size)
@@ -0,0 +1,149 @@
+"""Daily sales rollups.
+
+`record_checkout` adds a checked-out order to the per-product and
+per-category daily rows, queued by the check-out as a background task;
+`rebuild` recomputes a date range in bulk from the orders, archived ones
+included. Analytics read these tables only.
+"""
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Exists, F, OuterRef, Sum
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+from .models import (
+    ArchivedOrder, DailyCategorySales, DailyProductSales, Order, OrderItem,
+    Product, Task,
+)
+from .tasks import task
+
+
+def _add(model, date, field, value, quantity, revenue):
+    updated = model.objects.filter(date=date, **{field: value}).update(
+        quantity=F('quantity') + quantity, revenue=F('revenue') + revenue)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(date=date, quantity=quantity,
+                                 revenue=revenue, **{field: value})
+    except IntegrityError:
+        # created concurrently by another check-out
+        _add(model, date, field, value, quantity, revenue)
+
+
+def _line_totals(items, *group_by):
+    return (
+        items.order_by()
+        .values(*group_by)
+        .annotate(units=Sum('quantity'),
+                  amount=Sum(F('quantity') * F('unit_price')))
+    )
+
+
+@task
+def record_checkout(order_id):
+    checked_out_at = Order.objects.filter(
+        pk=order_id, is_checked_out=True,
+    ).values_list('checked_out_at', flat=True).first()
+    if checked_out_at is None:
+        # deleted since
+        return
+    date = timezone.localdate(checked_out_at)
+    items = OrderItem.objects.filter(order_id=order_id)
+    for row in _line_totals(items, 'product_id'):
+        _add(DailyProductSales, date, 'product_id', row['product_id'],
+             row['units'], row['amount'])
+    for row in _line_totals(items, 'product__category_id'):
+        _add(DailyCategorySales, date, 'category_id',
+             row['product__category_id'], row['units'], row['amount'])
+
+
+def _date_range(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lte=end)
+    return queryset
+
+
+def _archived_totals(start, end):
+    """Units and amount per `(date, product)` of the archived orders."""
+    orders = _date_range(ArchivedOrder.objects.annotate(date=TruncDate(
+        'checked_out_at', tzinfo=timezone.get_current_timezone())),
+        start, end)
+    totals = defaultdict(lambda: [0, 0])
+    for date, items in orders.order_by().values_list(
+            'date', 'items').iterator():
+        for item in items:
+            line = totals[date, item['product']]
+            line[0] += item['quantity']
+            line[1] += item['quantity'] * item['unit_price']
+    return totals
+
+
+def rebuild(start=None, end=None):
+    """
+    Recompute the rollups of checked-out orders between two dates, archived
+    orders included. The queued `record_checkout` tasks of the orders
+    counted are dropped, due, waiting for a retry or failed alike; orders
+    checked out meanwhile are left to their task.
+    """
+    items = _date_range(
+        OrderItem.objects.filter(order__is_checked_out=True).annotate(
+            date=TruncDate('order__checked_out_at',
+                           tzinfo=timezone.get_current_timezone())),
+        start, end)
+    products = _date_range(DailyProductSales.objects.all(), start, end)
+    categories = _date_range(DailyCategorySales.objects.all(), start, end)
+
+    with transaction.atomic():
+        # locked first, a worker running one of them has committed its rows
+        queued = dict(Task.objects.select_for_update().filter(
+            name=record_checkout.task_name).values_list('pk', 'args'))
+        counted = set(items.filter(
+            order_id__in={args[0] for args in queued.values()},
+        ).values_list('order_id', flat=True))
+        Task.objects.filter(pk__in=[
+            pk for pk, args in queued.items() if args[0] in counted]).delete()
+
+        totals = _archived_totals(start, end)
+        # check-outs committed since the tasks were locked are left to their
+        # task, checked in the same query so they can't be counted by both
+        queued = Task.objects.annotate(order_id=Cast(
+            KeyTextTransform('0', 'args'), CharField())).filter(
+            name=record_checkout.task_name,
+            order_id=Cast(OuterRef('order_id'), CharField()))
+        for row in _line_totals(items.exclude(Exists(queued)),
+                                'date', 'product_id').iterator():
+            line = totals[row['date'], row['product_id']]
+            line[0] += row['units']
+            line[1] += row['amount']
+        # counted in the current category of the product, like check-outs,
+        # archived lines of deleted products are dropped like live ones
+        category_of = dict(Product.objects.filter(
+            pk__in={product for _, product in totals},
+        ).values_list('pk', 'category_id'))
+        category_totals = defaultdict(lambda: [0, 0])
+        for (date, product), (units, amount) in totals.items():
+            if product in category_of:
+                line = category_totals[date, category_of[product]]
+                line[0] += units
+                line[1] += amount
+
+        products.delete()
+        categories.delete()
+        DailyProductSales.objects.bulk_create((
+            DailyProductSales(date=date, product_id=product, quantity=units,
+                              revenue=amount)
+            for (date, product), (units, amount) in totals.items()
+            if product in category_of
+        ), batch_size=1000)
+        DailyCategorySales.objects.bulk_create((
+            DailyCategorySales(date=date, category_id=category,
+                               quantity=units, revenue=amount)
+            for (date, category), (units, amount) in category_totals.items()
+        ), batch_size=1000)
@@ -1,6 +1,17 @@
+from django.db.models import Manager
 from rest_framework import serializers
 
-from .models import Product, Category, Order, OrderItem
+from .inventory import current_stock, load_stock
+from .models import ArchivedOrder, Product, Category, Order, OrderItem
+
+
+class ProductListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        products = list(data.all() if isinstance(data, Manager) else data)
+        # the live stock of the whole page in one query
+        load_stock(products)
+        return super().to_representation(products)
 
 
 class ProductSerializer(serializers.HyperlinkedModelSerializer):
@@ -14,6 +25,12 @@ class ProductSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['url', 'id', 'category', 'name', 'description',
                   'price', 'stock', 'is_available']
         read_only_fields = ['is_available']
+        list_serializer_class = ProductListSerializer
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['stock'] = current_stock(instance)
+        return data
 
 
 class CategorySerializer(serializers.HyperlinkedModelSerializer):
@@ -33,11 +50,37 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'order', 'product', 'quantity']
 
+    def validate_order(self, order):
+        request = self.context.get('request')
+        if request is None:
+            return order
+        # other users' orders don't exist as far as customers know
+        user = request.user
+        if not user.is_staff and order.user_id != user.pk:
+            raise serializers.ValidationError(
+                f'Invalid pk "{order.pk}" - object does not exist.')
+        return order
+
 
 class OrderSerializer(serializers.ModelSerializer):
     order_items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ['id', 'products', 'is_checked_out',
-                  'created_at', 'updated_at', 'order_items']
+        fields = ['id', 'products', 'is_checked_out', 'total_amount',
+                  'item_count', 'created_at', 'updated_at', 'order_items']
+
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """An archived order, in the shape of `OrderSerializer`."""
+    products = serializers.SerializerMethodField()
+    is_checked_out = serializers.ReadOnlyField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'products', 'is_checked_out', 'total_amount',
+                  'item_count', 'created_at', 'updated_at', 'checked_out_at',
+                  'archived_at', 'items']
+
+    def get_products(self, obj):
+        return [item['product'] for item in obj.items]
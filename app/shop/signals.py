@@ -1,19 +1,83 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
-from .models import OrderItem
+from django.db.models import F
+from .autocomplete import index_deleted, index_saved
+from .inventory import move_order_item_stock, return_stock
+from .changes import record_change, record_deletion
+from .models import Category, Order, OrderItem, Product
+from .stream import hub, stock_event
+from .summaries import forget_item_orders, forget_order_summary
 
 
 @receiver(post_save, sender=OrderItem)
-def reduce_product_stock_on_save(instance: OrderItem, *args, **kwargs):
-    with transaction.atomic():
-
-        instance.product.stock -= instance.quantity
-        instance.product.save()  # reduce the product stock
+def reduce_product_stock_on_save(instance: OrderItem, created,
+                                 *args, **kwargs):
+    # an update only moves the difference to the previous quantity
+    previous = None if created else instance._previous_values()
+    move_order_item_stock(instance, previous)
 
 
 @receiver(post_delete, sender=OrderItem)
 def increase_product_stock_on_delete(instance: OrderItem, *args, **kwargs):
-    with transaction.atomic():
-        instance.product.stock += instance.quantity
-        instance.product.save()  # reduce the product stock
+    return_stock(instance.product, instance.quantity, instance)
+
+
+@receiver(post_delete, sender=OrderItem)
+def subtract_order_totals_on_delete(instance: OrderItem, *args, **kwargs):
+    Order.objects.filter(pk=instance.order_id).update(
+        total_amount=F("total_amount") - instance.line_total,
+        item_count=F("item_count") - instance.quantity)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_summary(instance: Order, *args, **kwargs):
+    forget_order_summary(instance.user_id)
+
+
+@receiver(post_save, sender=OrderItem)
+def invalidate_order_summary_on_item_save(instance: OrderItem, created,
+                                          *args, **kwargs):
+    order_ids = {instance.order_id}
+    if not created:
+        # an item moved to another order changes both
+        order_ids.add(instance._previous_values()["order_id"])
+    forget_item_orders(instance, order_ids)
+
+
+@receiver(post_delete, sender=OrderItem)
+def invalidate_order_summary_on_item_delete(instance: OrderItem,
+                                            *args, **kwargs):
+    forget_item_orders(instance, {instance.order_id})
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def stamp_catalog_change(instance, *args, **kwargs):
+    record_change(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def record_catalog_deletion(instance, *args, **kwargs):
+    record_deletion(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def update_autocomplete_on_save(instance, *args, **kwargs):
+    index_saved(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def update_autocomplete_on_delete(instance, *args, **kwargs):
+    index_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+def publish_stock_event(instance: Product, *args, **kwargs):
+    if hub.has_subscribers(instance.pk):
+        event = stock_event(instance)
+        transaction.on_commit(lambda: hub.publish(instance.pk, event))
@@ -0,0 +1,202 @@
+"""Server-sent events stream of product stock changes.
+
+``StockHub`` is an in-process pub/sub hub: each open stream subscribes to one
+product and gets a small bounded queue. Stock events are snapshots, so when a
+slow client's queue is full the queued events are dropped in favour of the
+latest one instead of buffering without bound.
+
+The hub only sees saves made by the same process, which is what the ASGI
+worker serving both the API and the streams does. Streams bypass Django's
+request handling, so they authenticate the bearer token and manage the
+database connection themselves.
+"""
+
+import asyncio
+import json
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.exceptions import AuthenticationFailed
+
+STREAM_PATH = re.compile(r'^/product/(?P<pk>\d+)/stream/$')
+
+# seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+
+
+class Subscription:
+    def __init__(self, product_id, loop, maxsize):
+        self.product_id = product_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        # always runs on the subscriber's loop
+        while self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class StockHub:
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, product_id):
+        subscription = Subscription(
+            product_id, asyncio.get_running_loop(), self.maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(product_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.product_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.product_id]
+
+    def has_subscribers(self, product_id):
+        return product_id in self._subscriptions
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscriptions.values())
+
+    def publish(self, product_id, event):
+        """Fan `event` out to every stream of `product_id`, from any thread."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(product_id, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.offer, event)
+        return len(subscriptions)
+
+
+hub = StockHub()
+
+
+def stock_event(product):
+    from .inventory import current_stock
+
+    return {'id': product.pk, 'stock': current_stock(product),
+            'is_available': product.is_available}
+
+
+def format_event(event):
+    return f'event: stock\ndata: {json.dumps(event)}\n\n'.encode()
+
+
+def _authenticate(scope):
+    """The user of the request's bearer token, None for anonymous requests."""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    header = dict(scope.get('headers', ())).get(b'authorization')
+    if header is None:
+        return None
+    authentication = JWTAuthentication()
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    return authentication.get_user(
+        authentication.get_validated_token(raw_token))
+
+
+@sync_to_async
+def _load_product(scope, pk):
+    from .models import Product
+
+    # what the request signals do for views
+    close_old_connections()
+    try:
+        user = _authenticate(scope)
+        # the products ProductViewSet.get_queryset shows the user
+        if user is not None and (user.is_staff or user.is_superuser):
+            products = Product.objects.all()
+        else:
+            products = Product.available.all()
+        product = products.filter(pk=pk).first()
+        return stock_event(product) if product is not None else None
+    finally:
+        close_old_connections()
+
+
+async def _send_response(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stock_stream(scope, receive, send, pk):
+    if scope['method'] != 'GET':
+        await _send_response(send, 405, b'{"detail": "Method not allowed."}')
+        return
+
+    subscription = hub.subscribe(pk)
+    try:
+        try:
+            snapshot = await _load_product(scope, pk)
+        except AuthenticationFailed as exc:
+            await _send_response(
+                send, 401, json.dumps({'detail': exc.detail}).encode())
+            return
+        if snapshot is None:
+            await _send_response(send, 404, b'{"detail": "Not found."}')
+            return
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        await send({'type': 'http.response.body',
+                    'body': format_event(snapshot), 'more_body': True})
+
+        disconnect = asyncio.ensure_future(receive())
+        event = asyncio.ensure_future(subscription.queue.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {event, disconnect}, timeout=HEARTBEAT_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    if disconnect.result()['type'] == 'http.disconnect':
+                        return
+                    # the (empty) request body, keep waiting for a disconnect
+                    disconnect = asyncio.ensure_future(receive())
+                if event in done:
+                    body = format_event(event.result())
+                    event = asyncio.ensure_future(subscription.queue.get())
+                elif done:
+                    continue
+                else:
+                    body = b': keep-alive\n\n'
+                await send({'type': 'http.response.body', 'body': body,
+                            'more_body': True})
+        finally:
+            disconnect.cancel()
+            event.cancel()
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def with_stock_stream(application):
+    """Wrap an ASGI application so `/product/<id>/stream/` is served here."""
+    async def router(scope, receive, send):
+        if scope['type'] == 'http':
+            match = STREAM_PATH.match(scope['path'])
+            if match:
+                await stock_stream(scope, receive, send, int(match['pk']))
+                return
+        await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,96 @@
+"""Per-user order summaries, stored in `OrderSummary`.
+
+`order_summary` is what the profile page shows: the order count and lifetime
+spend, archived orders included, the newest `ORDER_SUMMARY_RECENT` orders and
+the first page of the order history, both already serialized. It is stored
+in the user's `OrderSummary` row and read back in one query.
+
+Every write to the user's orders or their items calls `forget_order_summary`
+in its transaction, which bumps the row's version and clears the summary. A
+summary is only stored if the version it was built under is still current,
+so one built from data read before a write commits is never kept after it,
+whichever worker built it.
+"""
+
+from django.db.models import Count, F, Max, Q, Sum
+from rest_framework import serializers
+
+from .conf import shop_settings
+from .models import ArchivedOrder, Order, OrderItem, OrderSummary
+from .serializers import OrderSerializer
+
+
+def forget_order_summary(*user_ids):
+    """Clear the summaries of `user_ids`, their orders being written."""
+    user_ids = sorted(set(user_ids))
+    # created first, a summary being built concurrently is then cleared
+    # too, however far it got
+    OrderSummary.objects.bulk_create(
+        [OrderSummary(user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True)
+    OrderSummary.objects.filter(user_id__in=user_ids).update(
+        version=F('version') + 1, page_size=None, summary=None)
+
+
+def forget_item_orders(item, order_ids):
+    """`forget_order_summary` for the owners of `order_ids`, of `item`."""
+    field = OrderItem._meta.get_field('order')
+    if field.is_cached(item) and set(order_ids) == {item.order_id}:
+        user_ids = [item.order.user_id]
+    else:
+        # gone already when the items are deleted along with their order,
+        # the order delete forgot the summary then
+        user_ids = Order.objects.filter(pk__in=order_ids).values_list(
+            'user_id', flat=True)
+    forget_order_summary(*user_ids)
+
+
+def _serialize(orders):
+    return [dict(order) for order in OrderSerializer(orders, many=True).data]
+
+
+def _build(user, page_size):
+    live = Order.objects.filter(user=user).aggregate(
+        count=Count('pk'),
+        spend=Sum('total_amount', filter=Q(is_checked_out=True)),
+        last=Max('created_at'))
+    # archived orders are all checked out
+    archived = ArchivedOrder.objects.filter(user=user).aggregate(
+        count=Count('pk'), spend=Sum('total_amount'), last=Max('created_at'))
+    history = list(user.get_user_order_history()[:page_size])
+    recent_count = shop_settings.ORDER_SUMMARY_RECENT
+    if live['count'] <= len(history):
+        # the first page holds every order
+        recent = history[::-1][:recent_count]
+    else:
+        recent = (Order.objects.filter(user=user)
+                  .prefetch_related('products')
+                  .order_by('-created_at', '-updated_at')[:recent_count])
+    last_order_at = max(
+        (last for last in (live['last'], archived['last']) if last),
+        default=None)
+    return {
+        'order_count': live['count'] + archived['count'],
+        'lifetime_spend': (live['spend'] or 0) + (archived['spend'] or 0),
+        # formatted like the created_at of the orders
+        'last_order_at': serializers.DateTimeField().to_representation(
+            last_order_at) if last_order_at else None,
+        'recent_orders': _serialize(recent),
+        # the first page of user.get_user_order_history()
+        'history': {'count': live['count'], 'results': _serialize(history)},
+    }
+
+
+def order_summary(user, page_size):
+    """
+    The order summary of `user`, with the first `page_size` orders of their
+    order history under `history`.
+    """
+    stored, _ = OrderSummary.objects.get_or_create(user_id=user.pk)
+    if stored.summary is not None and stored.page_size == page_size:
+        return stored.summary
+    summary = _build(user, page_size)
+    OrderSummary.objects.filter(
+        user_id=user.pk, version=stored.version,
+    ).update(page_size=page_size, summary=summary)
+    return summary
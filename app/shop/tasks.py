@@ -0,0 +1,98 @@
+"""A task queue in the database, for side effects that can run later.
+
+Functions decorated with `task` get an `enqueue(*args)` that inserts a
+`Task` row in the current transaction: the task only becomes visible to
+workers once the write it follows commits, and disappears with it on a
+rollback, like a `transaction.on_commit` callback that survives a crash.
+Arguments must be JSON serializable.
+
+`run_pending` claims a batch of due tasks with `SELECT ... FOR UPDATE SKIP
+LOCKED`, so workers run different batches, and runs each task in a savepoint
+of the batch transaction. Done tasks are deleted in that transaction, a
+crashing worker leaves its batch to the next one. A failing task is retried
+after `TASK_RETRY_DELAY` seconds, doubling on every attempt, until it has
+failed `TASK_MAX_ATTEMPTS` times; it is then kept with `failed_at` set.
+SQLite has no row locks, run a single worker there.
+
+Run the workers with the `run_tasks` command.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .conf import shop_settings
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def task(func):
+    """Register `func` as a task, queued with `func.enqueue(*args)`."""
+    func.task_name = f'{func.__module__}.{func.__qualname__}'
+    func.enqueue = lambda *args: Task.objects.create(
+        name=func.task_name, args=list(args))
+    return func
+
+
+def _function(name):
+    func = import_string(name)
+    if getattr(func, 'task_name', None) != name:
+        raise ValueError(f"{name} is not a task.")
+    return func
+
+
+def _failed(queued, exc, now):
+    queued.attempts += 1
+    queued.last_error = f'{type(exc).__name__}: {exc}'
+    if queued.attempts >= shop_settings.TASK_MAX_ATTEMPTS:
+        queued.failed_at = now
+        logger.error("Task %s failed %s times, giving up", queued,
+                     queued.attempts, exc_info=exc)
+    else:
+        queued.run_at = now + timedelta(seconds=(
+            shop_settings.TASK_RETRY_DELAY * 2 ** (queued.attempts - 1)))
+        logger.warning("Task %s failed, retrying at %s", queued,
+                       queued.run_at, exc_info=exc)
+
+
+def run_pending(batch_size=None, names=None):
+    """
+    Run one batch of due tasks, of the task functions in `names` only if
+    given. Returns the number of tasks run.
+    """
+    batch_size = batch_size or shop_settings.TASK_BATCH_SIZE
+    now = timezone.now()
+    due = Task.objects.filter(failed_at__isnull=True, run_at__lte=now)
+    if names is not None:
+        due = due.filter(name__in=[func.task_name for func in names])
+    with transaction.atomic():
+        batch = list(due.select_for_update(skip_locked=True)
+                     .order_by('run_at', 'id')[:batch_size])
+        done, failed = [], []
+        for queued in batch:
+            try:
+                with transaction.atomic():
+                    _function(queued.name)(*queued.args)
+            except Exception as exc:
+                _failed(queued, exc, now)
+                failed.append(queued)
+            else:
+                done.append(queued.pk)
+        Task.objects.filter(pk__in=done).delete()
+        Task.objects.bulk_update(
+            failed, ['attempts', 'last_error', 'run_at', 'failed_at'])
+    return len(batch)
+
+
+def drain(batch_size=None, names=None):
+    """Run due tasks until none is left, returns the number run."""
+    total = 0
+    while True:
+        ran = run_pending(batch_size, names)
+        if not ran:
+            return total
+        total += ran
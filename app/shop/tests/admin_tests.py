@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from shop.admin import EstimatedCountPaginator
+from shop.models import Category, Order, OrderItem, Product
+
+User = get_user_model()
+
+
+class BaseAdminTest(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            email='admin@test.com', password='password123')
+        self.admin_user.save()
+        self.client.force_login(self.admin_user)
+
+    def create_rows(self, count):
+        for i in range(count):
+            category = Category.objects.create(name=f'Category {i}')
+            product = Product.objects.create(
+                name=f'Product {i}', category=category, price=100, stock=10)
+            order = Order.objects.create(user=self.admin_user)
+            OrderItem.objects.create(order=order, product=product, quantity=1)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class ChangelistQueryCountTest(BaseAdminTest):
+    def assert_constant_queries(self, url):
+        self.create_rows(2)
+        few = self.count_queries(url)
+        self.create_rows(20)
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_product_changelist(self):
+        self.assert_constant_queries('/admin/shop/product/')
+
+    def test_order_changelist(self):
+        self.assert_constant_queries('/admin/shop/order/')
+
+    def test_orderitem_changelist(self):
+        self.assert_constant_queries('/admin/shop/orderitem/')
+
+    def test_category_filter_is_limited(self):
+        self.create_rows(60)
+        response = self.client.get('/admin/shop/product/')
+        self.assertNotContains(response, 'Category 59')
+
+        category = Category.objects.get(name='Category 59')
+        response = self.client.get(
+            f'/admin/shop/product/?category__id__exact={category.pk}')
+        self.assertContains(response, 'Category 59')
+
+
+class EstimatedCountPaginatorTest(BaseAdminTest):
+    def test_exact_count_without_estimate(self):
+        self.create_rows(3)
+        paginator = EstimatedCountPaginator(Product.objects.all(), 10)
+        self.assertEqual(paginator.count, 3)
+
+    def test_uses_estimate_for_large_tables(self):
+        self.create_rows(3)
+        paginator = EstimatedCountPaginator(Product.objects.all(), 10)
+        with mock.patch.object(paginator, '_estimated_count',
+                               return_value=2_000_000):
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.count, 2_000_000)
+            self.assertEqual(paginator.num_pages, 200_000)
+
+    def test_filtered_queryset_is_not_estimated(self):
+        paginator = EstimatedCountPaginator(
+            Product.objects.filter(stock__gt=0), 10)
+        self.assertIsNone(paginator._estimated_count())
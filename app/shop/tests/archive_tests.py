@@ -0,0 +1,168 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone as django_timezone
+from rest_framework.test import APIClient
+from shop import partitions
+from shop.admin import EstimatedCountPaginator
+from shop.archive import archive_orders
+from shop.inventory import current_stock
+from shop.models import (
+    ArchivedOrder, Category, Order, OrderItem, Product, StockMovement,
+)
+
+User = get_user_model()
+
+
+class OrderArchiveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Laptop", category=self.category, price=100, stock=10)
+        self.old = self.order(days_ago=400, checked_out=True, quantity=2)
+        self.open = self.order(days_ago=400, checked_out=False, quantity=1)
+        self.recent = self.order(days_ago=10, checked_out=True, quantity=1)
+
+    def order(self, days_ago, checked_out, quantity):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=quantity)
+        if checked_out:
+            order.check_out_order()
+        created_at = django_timezone.now() - timedelta(days=days_ago)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        OrderItem.objects.filter(order=order).update(
+            order_created_at=created_at)
+        return order
+
+    def test_archives_old_checked_out_orders(self):
+        item = OrderItem.objects.get(order=self.old)
+        call_command("archive_orders", stdout=StringIO())
+
+        self.assertEqual(
+            set(Order.objects.values_list("pk", flat=True)),
+            {self.open.pk, self.recent.pk})
+        self.assertFalse(
+            OrderItem.objects.filter(order_id=self.old.pk).exists())
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual(archived.pk, self.old.pk)
+        self.assertEqual((archived.total_amount, archived.item_count),
+                         (200, 2))
+        self.assertEqual(archived.items, [{
+            "id": item.pk, "product": self.product.pk,
+            "quantity": 2, "unit_price": 100}])
+        self.assertIsNotNone(archived.checked_out_at)
+
+    def test_archived_orders_keep_their_stock(self):
+        archive_orders(django_timezone.now() - timedelta(days=365))
+        self.assertEqual(
+            current_stock(Product.objects.get(pk=self.product.pk)), 6)
+        self.assertFalse(StockMovement.objects.filter(
+            reason=StockMovement.RETURN).exists())
+
+    def test_archive_in_batches(self):
+        self.order(days_ago=500, checked_out=True, quantity=1)
+        self.assertEqual(archive_orders(
+            django_timezone.now() - timedelta(days=365), batch_size=1), 2)
+        self.assertEqual(ArchivedOrder.objects.count(), 2)
+
+    def test_history_reads_the_archive(self):
+        archive_orders(django_timezone.now() - timedelta(days=365))
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get("/user/order-history/")
+        self.assertEqual([order["id"] for order in response.data["results"]],
+                         [self.open.pk, self.recent.pk])
+        response = client.get("/user/order-history/?archived=true")
+        order = response.data["results"][0]
+        self.assertEqual(
+            (order["id"], order["products"], order["is_checked_out"],
+             order["total_amount"]),
+            (self.old.pk, [self.product.pk], True, 200))
+
+
+@unittest.skipUnless(connection.vendor == "postgresql",
+                     "order partitions need PostgreSQL")
+class OrderPartitionTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Laptop", category=self.category, price=100, stock=10)
+
+    def partition_of(self, model, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT tableoid::regclass::text FROM {model._meta.db_table} "
+                f"WHERE id = %s", [pk])
+            return cursor.fetchone()[0]
+
+    def test_tables_are_partitioned(self):
+        for table in partitions.PARTITIONED:
+            self.assertTrue(partitions.is_partitioned(table))
+        month = partitions.month_start(datetime.now(timezone.utc))
+        self.assertIn(month, partitions.partitions("shop_order"))
+
+        order = Order.objects.create(user=self.user)
+        item = OrderItem.objects.create(
+            order=order, product=self.product, quantity=1)
+        self.assertEqual(self.partition_of(Order, order.pk),
+                         partitions.partition_name("shop_order", month))
+        self.assertEqual(self.partition_of(OrderItem, item.pk),
+                         partitions.partition_name("shop_orderitem", month))
+
+    def test_admin_estimate_adds_up_the_partitions(self):
+        for _ in range(3):
+            Order.objects.create(user=self.user)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE shop_order")
+        paginator = EstimatedCountPaginator(Order.objects.all(), 10)
+        self.assertEqual(paginator._estimated_count(), 3)
+
+    def test_create_moves_rows_from_the_default_partition(self):
+        month = datetime(2100, 1, 1, tzinfo=timezone.utc)
+        order = Order.objects.create(user=self.user)
+        Order.objects.filter(pk=order.pk).update(created_at=month)
+        self.assertEqual(self.partition_of(Order, order.pk),
+                         "shop_order_default")
+
+        partitions.create_partition("shop_order", month)
+        self.assertEqual(self.partition_of(Order, order.pk),
+                         "shop_order_p2100_01")
+        self.assertFalse(partitions.create_partition("shop_order", month))
+
+    def test_create_command_is_idempotent(self):
+        call_command("order_partitions", "create", ahead=5, stdout=StringIO())
+        out = StringIO()
+        call_command("order_partitions", "create", ahead=5, stdout=out)
+        self.assertIn("Created 0 partitions.", out.getvalue())
+
+    def test_detach_skips_partitions_with_orders(self):
+        month = datetime(2001, 1, 1, tzinfo=timezone.utc)
+        for table in partitions.PARTITIONED:
+            partitions.create_partition(table, month)
+        order = Order.objects.create(user=self.user)
+        Order.objects.filter(pk=order.pk).update(created_at=month)
+
+        err = StringIO()
+        call_command("order_partitions", "detach", "--before=2001-02",
+                     stdout=StringIO(), stderr=err)
+        self.assertIn("Skipped 2001-01: 1 rows not archived.", err.getvalue())
+        Order.objects.filter(pk=order.pk).delete()
+        call_command("order_partitions", "detach", "--before=2001-02",
+                     drop=True, stdout=StringIO())
+        self.assertNotIn(month, partitions.partitions("shop_order"))
+        self.assertNotIn(month, partitions.partitions("shop_orderitem"))
+
+    def test_detach_needs_a_month(self):
+        with self.assertRaises(CommandError):
+            call_command("order_partitions", "detach", stdout=StringIO())
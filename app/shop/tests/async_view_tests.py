@@ -0,0 +1,56 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from shop.models import Category, Product
+
+User = get_user_model()
+
+
+class AsyncCatalogViewTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category')
+        for i in range(12):
+            Product.objects.create(
+                name=f'Product {i:02}', category=self.category,
+                price=100 + i, stock=i % 4)
+        self.admin_user = User.objects.create_superuser(
+            email='admin@test.com', password='password123')
+        self.admin_user.save()
+
+    def assert_same(self, path, **headers):
+        sync_response = self.client.get(path, **headers)
+        async_response = self.client.get(f'/async{path}', **headers)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        data = async_response.json()
+        for link in ('next', 'previous'):
+            if data.get(link):
+                data[link] = data[link].replace('/async/', '/')
+        self.assertEqual(data, sync_response.json())
+        return data
+
+    def test_product_list_matches_sync(self):
+        data = self.assert_same('/product/')
+        self.assertEqual(data['count'], 9)
+        self.assert_same('/product/?page=2')
+        self.assert_same('/product/?search=Product 1&page_size=2')
+        self.assert_same('/product/?min_price=105&max_price=110')
+
+    def test_staff_sees_unavailable_products(self):
+        token = self.admin_user.tokens()['access']
+        data = self.assert_same(
+            '/product/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(data['count'], 12)
+
+    def test_product_retrieve_matches_sync(self):
+        available = Product.available.first()
+        self.assert_same(f'/product/{available.pk}/')
+        unavailable = Product.objects.filter(is_available=False).first()
+        response = self.client.get(f'/async/product/{unavailable.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_category_list_and_retrieve_match_sync(self):
+        self.assert_same('/category/')
+        self.assert_same(f'/category/{self.category.pk}/')
+
+    def test_read_only(self):
+        response = self.client.post('/async/product/', {})
+        self.assertEqual(response.status_code, 405)
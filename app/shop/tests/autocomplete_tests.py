@@ -0,0 +1,150 @@
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from shop.autocomplete import PrefixIndex, autocomplete
+from shop.changes import record_change
+from shop.models import Category, Product
+
+
+class PrefixIndexTest(TestCase):
+    def setUp(self):
+        self.index = PrefixIndex(max_entries=100, key_length=8)
+        self.index.load([
+            ("product", 1, "MacBook Pro"),
+            ("product", 2, "Mac  mini"),
+            ("category", 1, "Laptops"),
+        ])
+
+    def names(self, prefix, limit=10):
+        return [name for _, _, name in self.index.lookup(prefix, limit)]
+
+    def test_matches_the_start_of_any_word(self):
+        self.assertEqual(self.names("mac"), ["Mac  mini", "MacBook Pro"])
+        self.assertEqual(self.names("PRO"), ["MacBook Pro"])
+        self.assertEqual(self.names("mac m"), ["Mac  mini"])
+        self.assertEqual(self.names("lap"), ["Laptops"])
+        self.assertEqual(self.names("book"), [])
+        self.assertEqual(self.names(" "), [])
+
+    def test_an_object_is_returned_once(self):
+        self.index.add("product", 3, "Pro Pro Max")
+        self.assertEqual(self.names("pro"), ["MacBook Pro", "Pro Pro Max"])
+        self.assertEqual(self.names("pro", limit=1), ["MacBook Pro"])
+
+    def test_add_replaces_and_remove_drops(self):
+        self.index.add("product", 1, "iPad")
+        self.assertEqual(self.names("mac"), ["Mac  mini"])
+        self.assertEqual(self.names("ipad"), ["iPad"])
+        self.index.remove("product", 2)
+        self.index.remove("product", 42)
+        self.assertEqual(self.names("m"), [])
+        self.assertEqual(len(self.index), 2)
+
+    def test_keys_are_truncated(self):
+        self.index.add("product", 3, "Supercalifragilistic")
+        self.assertEqual(self.names("supercalifornia"),
+                         ["Supercalifragilistic"])
+
+    def test_stops_growing_at_the_bound(self):
+        index = PrefixIndex(max_entries=3, key_length=8)
+        index.load([("product", 1, "Mac mini"), ("product", 2, "Magic Mouse")])
+        self.assertFalse(index.complete)
+        self.assertEqual(len(index), 2)
+        index = PrefixIndex(max_entries=3, key_length=8)
+        index.add("product", 1, "Mac mini")
+        index.add("product", 2, "Magic Mouse")
+        self.assertFalse(index.complete)
+        self.assertEqual(len(index), 2)
+
+
+class AutocompleteFixtures:
+    def setUp(self):
+        autocomplete.reset()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Electronics")
+        self.laptop = Product.objects.create(
+            name="Gaming Laptop", category=self.category, price=1000,
+            stock=10)
+        Product.objects.create(
+            name="Game Console", category=self.category, price=400, stock=0)
+
+    def tearDown(self):
+        autocomplete.reset()
+
+    def complete(self, q, **params):
+        response = self.client.get(
+            "/product/autocomplete/", {"q": q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(entry["type"], entry["name"]) for entry in response.data]
+
+
+@override_settings(SHOP={"AUTOCOMPLETE_SYNC_INTERVAL": 0})
+class CatalogAutocompleteTest(AutocompleteFixtures, TestCase):
+    def test_returns_available_products_and_categories(self):
+        self.assertEqual(self.complete("ga"), [("product", "Gaming Laptop")])
+        self.assertEqual(self.complete("lap"), [("product", "Gaming Laptop")])
+        self.assertEqual(self.complete("elec"), [("category", "Electronics")])
+        self.assertEqual(self.complete(""), [])
+
+    def test_lookups_do_not_query_once_built(self):
+        self.complete("ga")
+        with override_settings(
+                SHOP={"AUTOCOMPLETE_SYNC_INTERVAL": 60}):
+            autocomplete.reset()
+            self.complete("ga")
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.complete("gam"),
+                                 [("product", "Gaming Laptop")])
+        self.assertFalse([q for q in context.captured_queries
+                          if "shop_" in q["sql"]])
+
+    def test_saves_and_deletes_update_the_index(self):
+        self.complete("ga")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name="Gamepad", category=self.category, price=50, stock=3)
+            self.laptop.name = "Workstation"
+            self.laptop.save()
+            Category.objects.create(name="Games")
+        self.assertEqual(self.complete("ga"), [
+            ("product", "Gamepad"), ("category", "Games")])
+        self.assertEqual(self.complete("work"), [("product", "Workstation")])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.laptop.delete()
+        self.assertEqual(self.complete("work"), [])
+
+    def test_limit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                Product.objects.create(
+                    name=f"Gadget {i}", category=self.category, price=5,
+                    stock=1)
+        self.assertEqual(len(self.complete("ga", limit=2)), 2)
+        self.assertEqual(len(self.complete("ga", limit=0)), 1)
+        response = self.client.get("/product/autocomplete/", {"limit": "x"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_falls_back_to_the_database_over_the_bound(self):
+        with override_settings(
+                SHOP={"AUTOCOMPLETE_MAX_ENTRIES": 1}):
+            self.assertEqual(self.complete("lap"),
+                             [("product", "Gaming Laptop")])
+            self.assertFalse(autocomplete.index.complete)
+            self.assertEqual(self.complete("ELEC"),
+                             [("category", "Electronics")])
+            self.assertEqual(self.complete("aming"), [])
+
+
+# the change feed only reports committed changes on PostgreSQL
+@override_settings(SHOP={"AUTOCOMPLETE_SYNC_INTERVAL": 0})
+class AutocompleteCatchUpTest(AutocompleteFixtures, TransactionTestCase):
+    def test_catches_up_with_other_processes(self):
+        self.complete("ga")
+        # a sell-out written by another worker, only seen in the change feed
+        with transaction.atomic():
+            Product.objects.filter(pk=self.laptop.pk).update(
+                is_available=False)
+            record_change(self.laptop)
+        self.assertEqual(self.complete("ga"), [])
@@ -0,0 +1,148 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from shop.exceptions import (
+    EmptyOrderException, OrderCheckedOutException, OutOfStocksException,
+)
+from shop.inventory import current_stock
+from shop.models import Category, Order, OrderItem, Product
+
+User = get_user_model()
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.category = Category.objects.create(name="Electronics")
+        self.laptop = Product.objects.create(
+            name="Laptop", category=self.category, price=1000, stock=10)
+        self.phone = Product.objects.create(
+            name="Phone", category=self.category, price=300, stock=10)
+        self.order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=1)
+        OrderItem.objects.create(
+            order=self.order, product=self.phone, quantity=2)
+
+    def checkout_queries(self, order):
+        with CaptureQueriesContext(connection) as context:
+            result = order.check_out_order()
+        self.assertTrue(result.checked_out)
+        # lock order, items, lock products, aggregate, update order and
+        # queueing the rollup task and the order for the related products
+        return [q['sql'] for q in context.captured_queries
+                if 'sales' not in q['sql'] and 'SAVEPOINT' not in q['sql']]
+
+    def test_check_out_queries_do_not_grow_with_items(self):
+        # two of them clear the order summary
+        self.assertEqual(len(self.checkout_queries(self.order)), 9)
+
+        order = Order.objects.create(user=self.user)
+        for i in range(10):
+            product = Product.objects.create(
+                name=f"Cable {i}", category=self.category, price=10, stock=5)
+            OrderItem.objects.create(order=order, product=product, quantity=1)
+        self.assertEqual(len(self.checkout_queries(order)), 9)
+
+    def test_check_out(self):
+        result = self.order.check_out_order()
+        self.assertTrue(result.checked_out)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.is_checked_out)
+        self.assertEqual((self.order.total_amount, self.order.item_count),
+                         (1600, 3))
+
+    def test_changed_prices_are_reported_and_repriced(self):
+        self.phone.price = 350
+        self.phone.save()
+
+        result = self.order.check_out_order()
+        self.assertFalse(result.checked_out)
+        self.assertEqual(
+            [(c['old_price'], c['new_price']) for c in result.changed_prices],
+            [(300, 350)])
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_checked_out)
+        self.assertEqual(self.order.total_amount, 1700)
+
+        self.assertTrue(self.order.check_out_order().checked_out)
+
+    def test_already_checked_out(self):
+        self.order.check_out_order()
+        with self.assertRaises(OrderCheckedOutException):
+            Order.objects.get(pk=self.order.pk).check_out_order()
+
+    def test_empty_order(self):
+        with self.assertRaises(EmptyOrderException):
+            Order.objects.create(user=self.user).check_out_order()
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentCheckoutTest(TransactionTestCase):
+    workers = 12
+
+    def setUp(self):
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Laptop", category=self.category, price=1000, stock=5)
+        self.users = [
+            User.objects.create_user(email=f"user{i}@email.com",
+                                     password="testpass")
+            for i in range(self.workers)]
+
+    def run_in_parallel(self, target, count):
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def run(index):
+            try:
+                barrier.wait()
+                results[index] = target(index)
+            except Exception as exc:
+                results[index] = exc
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,))
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_parallel_checkouts_for_the_last_units(self):
+        def buy(index):
+            order = Order.objects.create(user=self.users[index])
+            OrderItem.objects.create(
+                order=order, product=self.product, quantity=1)
+            return order.check_out_order()
+
+        results = self.run_in_parallel(buy, self.workers)
+
+        checked_out = [r for r in results if not isinstance(r, Exception)]
+        self.assertEqual(len(checked_out), 5)
+        self.assertTrue(all(
+            isinstance(r, OutOfStocksException)
+            for r in results if isinstance(r, Exception)), results)
+        self.product.refresh_from_db()
+        self.assertEqual(current_stock(self.product), 0)
+        self.assertEqual(Order.objects.filter(is_checked_out=True).count(), 5)
+        self.assertEqual(OrderItem.objects.count(), 5)
+
+    def test_parallel_checkouts_of_one_order(self):
+        order = Order.objects.create(user=self.users[0])
+        OrderItem.objects.create(order=order, product=self.product, quantity=2)
+
+        results = self.run_in_parallel(
+            lambda index: Order.objects.get(pk=order.pk).check_out_order(), 4)
+
+        self.assertEqual(
+            len([r for r in results if not isinstance(r, Exception)]), 1)
+        self.assertEqual(
+            len([r for r in results
+                 if isinstance(r, OrderCheckedOutException)]), 3)
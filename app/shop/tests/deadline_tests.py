@@ -0,0 +1,84 @@
+import time
+from unittest import mock
+
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+from shop.deadlines import Deadline
+from shop.exceptions import DeadlineExceeded
+from shop.models import Category, Product
+
+SLOW_QUERY = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c "
+              "WHERE x < %s) SELECT count(*) FROM c")
+
+
+def count_to(n):
+    with connection.cursor() as cursor:
+        cursor.execute(SLOW_QUERY, [n])
+        return cursor.fetchone()[0]
+
+
+def deadlines(**budgets):
+    return override_settings(
+        SHOP={"DEADLINES": {"DEFAULT": 10, **budgets}})
+
+
+class DeadlineTest(TestCase):
+    def test_aborts_a_running_statement(self):
+        started = time.monotonic()
+        with self.assertRaises(OperationalError), transaction.atomic():
+            with Deadline(0.05) as deadline:
+                count_to(10 ** 9)
+        self.assertTrue(deadline.expired)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_refuses_queries_once_spent(self):
+        with self.assertRaises(DeadlineExceeded), Deadline(0.01):
+            time.sleep(0.02)
+            count_to(1)
+
+    def test_queries_after_the_block_are_not_limited(self):
+        with Deadline(0.01):
+            count_to(10)
+        time.sleep(0.02)
+        self.assertEqual(count_to(10 ** 5), 10 ** 5)
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SHOW statement_timeout")
+                self.assertEqual(cursor.fetchone()[0], "0")
+
+
+class EndpointDeadlineTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Electronics")
+        Product.objects.create(
+            name="Laptop", category=category, price=1000, stock=10)
+
+    def test_reports_the_time_spent(self):
+        response = self.client.get("/product/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(response["Server-Timing"],
+                         r"^app;dur=[\d.]+, budget;dur=3000$")
+
+    @deadlines(**{"product-facets": 0.05})
+    def test_slow_query_returns_504(self):
+        with mock.patch("shop.views.compute_facets",
+                        side_effect=lambda *args: count_to(10 ** 9)), \
+                self.assertLogs("shop.deadlines", level="WARNING") as logs:
+            response = self.client.get("/product/facets/")
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertEqual(response.data["endpoint"], "product-facets")
+        self.assertEqual(response.data["budget_ms"], 50)
+        self.assertGreaterEqual(response.data["elapsed_ms"], 50)
+        self.assertIn("product-facets over its 0.050s budget", logs.output[0])
+        # the connection is usable again
+        self.assertEqual(self.client.get("/product/").status_code,
+                         status.HTTP_200_OK)
+
+    @deadlines(**{"product-list": None})
+    def test_endpoints_without_a_budget(self):
+        response = self.client.get("/product/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.has_header("Server-Timing"))
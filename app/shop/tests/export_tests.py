@@ -0,0 +1,128 @@
+import csv
+import json
+import tracemalloc
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from shop.export import WRITERS, order_records
+from shop.models import Category, Order, OrderItem, Product
+
+User = get_user_model()
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.other = User.objects.create_user(
+            email="other@email.com", password="testpass")
+        self.staff = User.objects.create_superuser(
+            email="admin@email.com", password="testpass")
+        self.staff.is_staff = True
+        self.staff.save()
+        category = Category.objects.create(name="Electronics")
+        self.laptop = Product.objects.create(
+            name="Laptop", category=category, price=100, stock=10)
+        self.phone = Product.objects.create(
+            name="Phone", category=category, price=30, stock=10)
+        self.order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=2)
+        OrderItem.objects.create(
+            order=self.order, product=self.phone, quantity=1)
+        self.empty = Order.objects.create(user=self.other)
+        self.client = APIClient()
+
+    def get(self, user, path):
+        self.client.force_authenticate(user)
+        response = self.client.get(path)
+        content = b"".join(response.streaming_content).decode() \
+            if response.streaming else None
+        return response, content
+
+    def test_csv_has_a_row_per_item(self):
+        response, content = self.get(self.staff, "/order/export/")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="orders.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(content)))
+        order, empty = str(self.order.pk), str(self.empty.pk)
+        self.assertEqual(
+            [(row["id"], row["email"], row["item_product"],
+              row["item_quantity"]) for row in rows],
+            [(order, "testuser@email.com", str(self.laptop.pk), "2"),
+             (order, "testuser@email.com", str(self.phone.pk), "1"),
+             (empty, "other@email.com", "", "")])
+        self.assertEqual(rows[0]["total_amount"], "230")
+
+    def test_jsonl_has_a_line_per_order(self):
+        response, content = self.get(self.staff, "/order/export/?type=jsonl")
+        self.assertEqual(response["Content-Type"], "application/jsonl")
+        orders = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([order["id"] for order in orders],
+                         [self.order.pk, self.empty.pk])
+        self.assertEqual(orders[0]["items"][1], {
+            "id": OrderItem.objects.get(product=self.phone).pk,
+            "product": self.phone.pk, "quantity": 1, "unit_price": 30})
+
+    def test_export_is_for_staff(self):
+        response, _ = self.get(self.user, "/order/export/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unknown_type_is_refused(self):
+        response, _ = self.get(self.staff, "/order/export/?type=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_history_export_has_the_users_orders(self):
+        response, content = self.get(
+            self.user, "/user/order-history/export/?type=jsonl")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [json.loads(line)["id"] for line in content.splitlines()],
+            [self.order.pk])
+
+
+class ExportMemoryTest(TestCase):
+    orders = 4000
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        category = Category.objects.create(name="Electronics")
+        product = Product.objects.create(
+            name="Laptop", category=category, price=100, stock=10)
+        now = timezone.now()
+        orders = Order.objects.bulk_create(
+            [Order(user=user, total_amount=200, item_count=2)
+             for _ in range(cls.orders)], batch_size=1000)
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=order, product=product, quantity=2,
+                       unit_price=100,
+                       order_created_at=order.created_at or now)
+             for order in orders], batch_size=1000)
+
+    def peak_memory(self, count):
+        orders = Order.objects.order_by("pk")
+        last = orders.values_list("pk", flat=True)[count - 1]
+        tracemalloc.start()
+        try:
+            written = 0
+            for chunk in WRITERS["jsonl"](order_records(
+                    orders.filter(pk__lte=last), chunk_size=200)):
+                written += len(chunk)
+            return tracemalloc.get_traced_memory()[1], written
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_stays_flat(self):
+        # the first run also pays for caches filled once per process
+        self.peak_memory(self.orders // 8)
+        small_peak, small_size = self.peak_memory(self.orders // 4)
+        peak, size = self.peak_memory(self.orders)
+        # four times the orders exported with about the same memory
+        self.assertGreater(size, small_size * 3.5)
+        self.assertLess(peak, small_peak * 1.25)
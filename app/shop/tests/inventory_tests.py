@@ -0,0 +1,213 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from shop.exceptions import OutOfStocksException
+from shop.inventory import compact, current_stock
+from shop.models import (
+    Category, Order, OrderItem, Product, StockMovement, StockShard,
+)
+
+User = get_user_model()
+
+
+class StockLedgerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.category = Category.objects.create(name="Electronics")
+        self.laptop = Product.objects.create(
+            name="Laptop", category=self.category, price=1000, stock=10)
+        self.phone = Product.objects.create(
+            name="Phone", category=self.category, price=300, stock=10)
+        self.order = Order.objects.create(user=self.user)
+
+    def movements(self, product):
+        return list(StockMovement.objects.filter(product=product)
+                    .values_list("delta", "reason", "applied"))
+
+    def stock(self, product):
+        return current_stock(Product.objects.get(pk=product.pk))
+
+    def test_order_appends_to_the_ledger(self):
+        with CaptureQueriesContext(connection) as context:
+            OrderItem.objects.create(
+                order=self.order, product=self.laptop, quantity=3)
+        # the stock isn't written, only the change feed stamp
+        updates = [q["sql"] for q in context.captured_queries
+                   if q["sql"].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(updates[0].startswith(
+            'UPDATE "shop_product" SET "change_seq" = '))
+        self.assertNotIn('"stock"', updates[0])
+        self.assertEqual(self.movements(self.laptop), [
+            (10, StockMovement.ADJUSTMENT, True),
+            (-3, StockMovement.ORDER, False),
+        ])
+        self.assertEqual(Product.objects.get(pk=self.laptop.pk).stock, 10)
+        self.assertEqual(self.stock(self.laptop), 7)
+
+    def test_updated_item_only_moves_the_difference(self):
+        item = OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=2)
+        item = OrderItem.objects.get(pk=item.pk)
+        item.quantity = 5
+        item.save()
+        self.assertEqual(self.stock(self.laptop), 5)
+        item.quantity = 1
+        item.save()
+        self.assertEqual(self.stock(self.laptop), 9)
+
+        item.product = self.phone
+        item.quantity = 4
+        item.save()
+        self.assertEqual(self.stock(self.laptop), 10)
+        self.assertEqual(self.stock(self.phone), 6)
+
+    def test_selling_out_marks_the_product_unavailable(self):
+        OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=10)
+        self.assertFalse(Product.objects.get(pk=self.laptop.pk).is_available)
+        with self.assertRaises(OutOfStocksException):
+            OrderItem.objects.create(
+                order=self.order, product=self.phone, quantity=11)
+
+    def test_compaction_applies_pending_movements(self):
+        item = OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=3)
+        OrderItem.objects.create(
+            order=self.order, product=self.phone, quantity=1)
+        item.delete()
+        OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=4)
+
+        call_command("compact_stock_ledger", stdout=StringIO())
+        self.assertEqual(
+            list(Product.objects.order_by("name").values_list(
+                "stock", flat=True)),
+            [6, 9])
+        self.assertFalse(StockMovement.objects.filter(applied=False).exists())
+        self.assertEqual(compact(), 0)
+
+    def test_editing_the_stock_is_recorded(self):
+        OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=3)
+        product = Product.objects.get(pk=self.laptop.pk)
+        product.stock = 20
+        product.save()
+        self.assertEqual(self.movements(self.laptop)[-1],
+                         (13, StockMovement.ADJUSTMENT, True))
+        self.assertEqual(self.stock(self.laptop), 20)
+
+    def test_reconcile_command(self):
+        OrderItem.objects.create(
+            order=self.order, product=self.laptop, quantity=3)
+        call_command("reconcile_stock_ledger", stdout=StringIO())
+
+        Product.objects.filter(pk=self.laptop.pk).update(stock=8)
+        err = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("reconcile_stock_ledger", stdout=StringIO(),
+                         stderr=err)
+        self.assertIn("snapshot is 8, the applied movements add up to 10",
+                      err.getvalue())
+
+
+class ShardedStockTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.staff = User.objects.create_superuser(
+            email="admin@email.com", password="testpass")
+        self.staff.is_staff = True
+        self.staff.save()
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Phone", category=self.category, price=300, stock=10,
+            stock_shards=4)
+        self.order = Order.objects.create(user=self.user)
+
+    def shard_stocks(self):
+        return list(StockShard.objects.filter(product=self.product)
+                    .values_list("stock", flat=True))
+
+    def live_stock(self):
+        cache.clear()
+        client = APIClient()
+        # staff also see unavailable products
+        client.force_authenticate(self.staff)
+        response = client.get(
+            reverse("product-detail", args=[self.product.pk]))
+        return response.data["stock"], response.data["is_available"]
+
+    def test_stock_is_spread_over_the_shards(self):
+        self.assertEqual(self.shard_stocks(), [3, 3, 2, 2])
+        self.assertTrue(self.product.is_available)
+
+    def test_order_takes_from_one_shard(self):
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2)
+        taken = [before - after for before, after
+                 in zip([3, 3, 2, 2], self.shard_stocks())]
+        self.assertEqual(sorted(taken), [0, 0, 0, 2])
+        self.assertEqual(self.live_stock(), (8, True))
+        # the product row is not written
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 10)
+
+    def test_order_larger_than_any_shard_takes_from_several(self):
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=7)
+        self.assertEqual(sum(self.shard_stocks()), 3)
+
+    def test_selling_out_marks_the_product_unavailable(self):
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=10)
+        self.assertEqual(self.live_stock(), (0, False))
+        self.assertFalse(Product.available.filter(pk=self.product.pk).exists())
+
+    def test_order_over_the_stock_is_refused(self):
+        with self.assertRaises(OutOfStocksException):
+            OrderItem.objects.create(
+                order=self.order, product=self.product, quantity=11)
+        self.assertEqual(sum(self.shard_stocks()), 10)
+
+    def test_deleted_item_returns_its_stock(self):
+        item = OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=10)
+        item.delete()
+        self.assertEqual(self.live_stock(), (10, True))
+
+    def test_editing_other_fields_keeps_the_live_stock(self):
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=3)
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = 350
+        product.save()
+        self.assertEqual(product.stock, 7)
+        self.assertEqual(self.shard_stocks(), [2, 2, 2, 1])
+
+    def test_editing_the_stock_sets_the_total(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 21
+        product.save()
+        self.assertEqual(self.shard_stocks(), [6, 5, 5, 5])
+
+    def test_rebalance_command(self):
+        StockShard.objects.filter(
+            product=self.product, index=0).update(stock=0)
+        call_command("rebalance_stock_shards", stdout=StringIO())
+        self.assertEqual(self.shard_stocks(), [2, 2, 2, 1])
+
+        call_command("rebalance_stock_shards", product=[self.product.pk],
+                     shards=0, stdout=StringIO())
+        self.assertEqual(self.shard_stocks(), [])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.stock_shards),
+                         (7, 0))
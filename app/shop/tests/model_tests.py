@@ -1,6 +1,19 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from shop import rollups
+from shop.archive import archive_orders
 from shop.exceptions import OutOfStocksException
-from shop.models import Category, Product, OrderItem, Order
+from shop.inventory import current_stock
+from shop.models import (
+    Category, DailyCategorySales, DailyProductSales, Product, OrderItem, Order,
+    Task,
+)
+from shop.tasks import drain
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -71,7 +84,7 @@ class OrderItemModelTest(TestCase):
                                quantity=5, order=self.order)
         order_item.save()
         self.product.refresh_from_db()
-        self.assertEqual(self.product.stock, 5)
+        self.assertEqual(current_stock(self.product), 5)
 
         with self.assertRaises(OutOfStocksException):
             order_item = OrderItem(product=self.product,
@@ -81,10 +94,10 @@ class OrderItemModelTest(TestCase):
     def test_delete_method(self):
         order_item = OrderItem.objects.create(
             product=self.product, quantity=5, order=self.order)
-        initial_stock = self.product.stock
+        initial_stock = current_stock(self.product)
         order_item.delete()
         self.product.refresh_from_db()
-        self.assertEqual(self.product.stock, initial_stock + 5)
+        self.assertEqual(current_stock(self.product), initial_stock + 5)
 
 
 class OrderModelTest(TestCase):
@@ -105,8 +118,163 @@ class OrderModelTest(TestCase):
     def test_string_representation(self):
         self.assertEqual(str(self.order), f"Order by {self.user.name}")
 
+    def test_totals_follow_item_writes(self):
+        item = OrderItem.objects.create(
+            product=self.product, quantity=2, order=self.order)
+        self.assertEqual(item.unit_price, 150000)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.total_amount, self.order.item_count),
+                         (300000, 2))
+
+        item.quantity = 3
+        item.save()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.total_amount, self.order.item_count),
+                         (450000, 3))
+
+        item.delete()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.total_amount, self.order.item_count),
+                         (0, 0))
+
+    def test_unit_price_is_a_snapshot(self):
+        item = OrderItem.objects.create(
+            product=self.product, quantity=1, order=self.order)
+        self.product.price = 200000
+        self.product.save()
+
+        item = OrderItem.objects.get(pk=item.pk)
+        item.quantity = 2
+        item.save()
+        self.assertEqual(item.unit_price, 150000)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, 300000)
+
+    def test_moving_item_between_orders(self):
+        other_order = Order.objects.create(user=self.user)
+        item = OrderItem.objects.create(
+            product=self.product, quantity=2, order=self.order)
+        item.order = other_order
+        item.save()
+        self.order.refresh_from_db()
+        other_order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, 0)
+        self.assertEqual(other_order.total_amount, 300000)
+
     def test_order_item_relationship(self):
         order_item = OrderItem.objects.create(
             product=self.product, quantity=2, order=self.order)
         self.order.products.add(self.product, through_defaults={'quantity': 2})
         self.assertIn(order_item, self.order.orderitem_set.all())
+
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.category = Category.objects.create(name="Electronics")
+        self.laptop = Product.objects.create(
+            name="Laptop", category=self.category, price=1000, stock=10)
+        self.phone = Product.objects.create(
+            name="Phone", category=self.category, price=300, stock=10)
+
+    def check_out(self, *lines):
+        order = Order.objects.create(user=self.user)
+        for product, quantity in lines:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=quantity)
+        order.check_out_order()
+        # the rollups are updated by a queued task
+        drain()
+        return order
+
+    def rollups(self):
+        return (
+            list(DailyProductSales.objects.order_by('product__name')
+                 .values_list('product__name', 'quantity', 'revenue')),
+            list(DailyCategorySales.objects.values_list(
+                'category__name', 'quantity', 'revenue')),
+        )
+
+    def test_check_out_updates_rollups(self):
+        order = self.check_out((self.laptop, 1), (self.phone, 2))
+        self.assertIsNotNone(order.checked_out_at)
+        self.check_out((self.laptop, 2))
+        products, categories = self.rollups()
+        self.assertEqual(products, [('Laptop', 3, 3000), ('Phone', 2, 600)])
+        self.assertEqual(categories, [('Electronics', 5, 3600)])
+
+    def test_open_orders_are_not_counted(self):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.laptop, quantity=1)
+        self.assertEqual(self.rollups(), ([], []))
+
+    def test_rebuild_matches_incremental(self):
+        self.check_out((self.laptop, 1), (self.phone, 2))
+        self.check_out((self.phone, 1))
+        incremental = self.rollups()
+        DailyProductSales.objects.update(quantity=0, revenue=0)
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_rebuild_drops_the_queued_tasks_it_counts(self):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.laptop, quantity=1)
+        order.check_out_order()
+        # waiting out a retry delay
+        Task.objects.update(run_at=timezone.now() + timedelta(hours=1))
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(self.rollups(), ([('Laptop', 1, 1000)],
+                                          [('Electronics', 1, 1000)]))
+
+    def test_rebuild_keeps_the_tasks_of_other_days(self):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.laptop, quantity=1)
+        order.check_out_order()
+
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        call_command('rebuild_sales_rollups', '--start', str(tomorrow),
+                     stdout=StringIO())
+        self.assertEqual(Task.objects.count(), 1)
+        drain()
+        self.assertEqual(self.rollups(), ([('Laptop', 1, 1000)],
+                                          [('Electronics', 1, 1000)]))
+
+    def test_rebuild_counts_archived_orders(self):
+        self.check_out((self.laptop, 1), (self.phone, 2))
+        archive_orders(timezone.now() + timedelta(days=1))
+        self.check_out((self.phone, 1))
+        incremental = self.rollups()
+        self.assertEqual(incremental, (
+            [('Laptop', 1, 1000), ('Phone', 3, 900)],
+            [('Electronics', 4, 1900)]))
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+        today = str(timezone.localdate())
+        call_command('rebuild_sales_rollups', '--start', today, '--end', today,
+                     stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_rebuild_leaves_concurrent_check_outs_to_their_task(self):
+        self.check_out((self.laptop, 1))
+        archived_totals = rollups._archived_totals
+
+        def check_out_meanwhile(start, end):
+            # committed after the rebuild locked the queued tasks
+            order = Order.objects.create(user=self.user)
+            OrderItem.objects.create(
+                order=order, product=self.phone, quantity=1)
+            order.check_out_order()
+            return archived_totals(start, end)
+
+        with mock.patch.object(rollups, '_archived_totals',
+                               check_out_meanwhile):
+            rollups.rebuild()
+        drain()
+        self.assertEqual(self.rollups(), (
+            [('Laptop', 1, 1000), ('Phone', 1, 300)],
+            [('Electronics', 2, 1300)]))
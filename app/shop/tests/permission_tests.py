@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from shop.models import Category, Order, OrderItem, Product
+from shop.permissions import owner_id
+
+User = get_user_model()
+
+
+class OwnershipTest(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="owner@test.com", password="password123")
+        self.other = User.objects.create_user(
+            email="other@test.com", password="password123")
+        self.staff = User.objects.create_superuser(
+            email="admin@test.com", password="password123")
+        self.staff.save()
+        category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Laptop", category=category, price=100, stock=10)
+        self.order = Order.objects.create(user=self.owner)
+        self.item = OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=1)
+        self.other_order = Order.objects.create(user=self.other)
+        self.client = APIClient()
+
+    def get(self, user, path):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        selects = [q["sql"] for q in context.captured_queries
+                   if q["sql"].startswith("SELECT")]
+        return response, selects
+
+    def test_owner_id_reads_foreign_key_ids(self):
+        item = OrderItem.objects.select_related("order").get(pk=self.item.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(owner_id(item, "order__user"), self.owner.pk)
+            self.assertEqual(owner_id(item.order, "user"), self.owner.pk)
+            self.assertEqual(owner_id(self.owner, "pk"), self.owner.pk)
+
+    def test_order_retrieve_doesnt_load_the_user(self):
+        response, queries = self.get(self.owner, f"/order/{self.order.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([q for q in queries if '"shop_order"' in q
+                              and '"shop_orderitem"' not in q]), 1)
+        self.assertFalse([q for q in queries if '"core_user"' in q])
+
+    def test_item_retrieve_is_one_query(self):
+        response, queries = self.get(self.owner, f"/orderitem/{self.item.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"shop_order"', queries[0])
+
+    def test_other_users_objects_are_not_found(self):
+        response, _ = self.get(self.other, f"/order/{self.order.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response, _ = self.get(self.other, f"/orderitem/{self.item.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response, _ = self.get(self.other, "/orderitem/")
+        self.assertEqual(response.data["results"], [])
+
+        response = self.client.patch(
+            f"/orderitem/{self.item.pk}/", {"quantity": 5})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_items_only_go_into_own_orders(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.post("/orderitem/", {
+            "order": self.other_order.pk, "product": self.product.pk,
+            "quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("order", response.data)
+
+    def test_staff_see_everything(self):
+        response, _ = self.get(self.staff, f"/orderitem/{self.item.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response, _ = self.get(self.staff, "/order/")
+        self.assertEqual(response.data["count"], 2)
+
+    def test_users_only_see_themselves(self):
+        response, _ = self.get(self.owner, "/user/")
+        self.assertEqual([user["id"] for user in response.data["results"]],
+                         [self.owner.pk])
+        response, queries = self.get(self.owner, f"/user/{self.owner.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+        response, _ = self.get(self.owner, f"/user/{self.other.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_anonymous_users_get_nothing(self):
+        response, _ = self.get(None, "/order/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,140 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from shop import recommendations
+from shop.models import (
+    Category, Order, OrderItem, PendingCoPurchase, Product, ProductPair,
+    RelatedProduct,
+)
+
+User = get_user_model()
+
+
+class RelatedProductsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.category = Category.objects.create(name="Electronics")
+        self.laptop, self.mouse, self.bag, self.cable = (
+            Product.objects.create(name=name, category=self.category,
+                                   price=10, stock=100)
+            for name in ("Laptop", "Mouse", "Bag", "Cable"))
+
+    def order(self, *products, checked_out=True):
+        order = Order.objects.create(user=self.user)
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1)
+        if checked_out:
+            order.check_out_order()
+        return order
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(product=product)
+                    .values_list("related__name", "orders"))
+
+    def pairs(self):
+        return sorted(ProductPair.objects.values_list(
+            "product__name", "other__name", "orders"))
+
+    def test_update_counts_queued_orders(self):
+        self.order(self.laptop, self.mouse, self.bag)
+        self.order(self.laptop, self.mouse, self.mouse)
+        self.order(self.cable)
+        self.order(self.laptop, self.cable, checked_out=False)
+        self.assertEqual(PendingCoPurchase.objects.count(), 3)
+
+        self.assertEqual(recommendations.update(batch_size=2), 3)
+        self.assertFalse(PendingCoPurchase.objects.exists())
+        self.assertEqual(self.related(self.laptop), [("Mouse", 2), ("Bag", 1)])
+        self.assertEqual(self.related(self.bag), [("Laptop", 1), ("Mouse", 1)])
+        self.assertEqual(self.related(self.cable), [])
+
+        # incrementally
+        self.order(self.laptop, self.bag)
+        self.order(self.laptop, self.bag)
+        self.assertEqual(recommendations.update(), 2)
+        self.assertEqual(self.related(self.laptop), [("Bag", 3), ("Mouse", 2)])
+        self.assertEqual(self.related(self.mouse), [("Laptop", 2), ("Bag", 1)])
+        self.assertEqual(recommendations.update(), 0)
+
+    def test_keeps_the_top_k(self):
+        self.order(self.laptop, self.mouse, self.bag, self.cable)
+        self.order(self.laptop, self.cable)
+        with self.settings(SHOP={"RELATED_PRODUCTS_TOP_K": 1}):
+            recommendations.update()
+        self.assertEqual(self.related(self.laptop), [("Cable", 2)])
+        self.assertEqual(self.related(self.mouse), [("Bag", 1)])
+        self.assertEqual(ProductPair.objects.filter(
+            product=self.laptop).count(), 3)
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.order(self.laptop, self.mouse, self.bag)
+        self.order(self.laptop, self.mouse)
+        recommendations.update()
+        self.order(self.mouse, self.bag)
+        recommendations.update()
+        incremental = self.pairs()
+        self.assertEqual(incremental, [
+            ("Bag", "Laptop", 1), ("Bag", "Mouse", 2),
+            ("Laptop", "Bag", 1), ("Laptop", "Mouse", 2),
+            ("Mouse", "Bag", 2), ("Mouse", "Laptop", 2),
+        ])
+
+        # orders still queued are left to the update following the rebuild
+        self.order(self.laptop, self.cable)
+        out = StringIO()
+        call_command("update_related_products", "--rebuild", stdout=out)
+        self.assertIn("Counted 1 orders", out.getvalue())
+        self.assertEqual(self.pairs(), sorted(
+            incremental + [("Cable", "Laptop", 1), ("Laptop", "Cable", 1)]))
+        self.assertEqual(self.related(self.laptop),
+                         [("Mouse", 2), ("Bag", 1), ("Cable", 1)])
+
+    def test_update_never_reads_the_matrix(self):
+        self.order(self.laptop, self.mouse)
+        self.order(self.bag, self.cable)
+        recommendations.update()
+        self.order(self.laptop, self.mouse, self.cable)
+        with CaptureQueriesContext(connection) as context:
+            recommendations.update()
+        self.assertEqual([q["sql"] for q in context.captured_queries
+                          if q["sql"].startswith("SELECT")
+                          and "shop_productpair" in q["sql"]
+                          and "ORDER BY" not in q["sql"]], [])
+        self.assertEqual(self.pairs(), [
+            ("Bag", "Cable", 1), ("Cable", "Bag", 1),
+            ("Cable", "Laptop", 1), ("Cable", "Mouse", 1),
+            ("Laptop", "Cable", 1), ("Laptop", "Mouse", 2),
+            ("Mouse", "Cable", 1), ("Mouse", "Laptop", 2),
+        ])
+
+    def test_related_endpoint(self):
+        self.order(self.laptop, self.mouse, self.bag)
+        self.order(self.laptop, self.mouse)
+        recommendations.update()
+        Product.objects.filter(pk=self.mouse.pk).update(is_available=False)
+        staff = User.objects.create_superuser(
+            email="admin@email.com", password="testpass")
+        staff.is_staff = True
+        staff.save()
+
+        client = APIClient()
+        url = f"/product/{self.laptop.pk}/related/"
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["name"] for p in response.data], ["Bag"])
+        self.assertEqual(len([q for q in context.captured_queries
+                              if "shop_relatedproduct" in q["sql"]]), 1)
+
+        client.force_authenticate(staff)
+        response = client.get(url)
+        self.assertEqual([p["name"] for p in response.data], ["Mouse", "Bag"])
+        response = client.get(f"/product/{self.cable.pk}/related/")
+        self.assertEqual(response.data, [])
@@ -50,7 +50,14 @@ class TestOrderSerializer(BaseTest):
         serializer = OrderSerializer(self.order)
         data = serializer.data
         self.assertEqual(set(data.keys()), {
-                         'id', 'products', 'is_checked_out', 'created_at', 'updated_at'})
+                         'id', 'products', 'is_checked_out', 'total_amount',
+                         'item_count', 'created_at', 'updated_at'})
+
+    def test_serialize_totals(self):
+        self.order.refresh_from_db()
+        data = OrderSerializer(self.order).data
+        self.assertEqual(data['total_amount'], 100)
+        self.assertEqual(data['item_count'], 1)
 
 
 class TestProductSerializer(TestCase):
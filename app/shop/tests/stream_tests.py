@@ -0,0 +1,147 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from shop.models import Category, Product
+from shop.stream import StockHub, hub, with_stock_stream
+
+User = get_user_model()
+
+
+class StockHubTest(TestCase):
+    def test_fan_out_per_product(self):
+        async def run():
+            hub = StockHub()
+            first = hub.subscribe(1)
+            second = hub.subscribe(1)
+            other = hub.subscribe(2)
+            self.assertEqual(hub.publish(1, {'stock': 3}), 2)
+            await asyncio.sleep(0)
+            return [s.queue.qsize() for s in (first, second, other)]
+
+        self.assertEqual(async_to_sync(run)(), [1, 1, 0])
+
+    def test_slow_subscriber_keeps_latest_events(self):
+        async def run():
+            hub = StockHub(maxsize=2)
+            subscription = hub.subscribe(1)
+            for stock in range(5):
+                hub.publish(1, {'stock': stock})
+            await asyncio.sleep(0)
+            events = [subscription.queue.get_nowait() for _ in range(2)]
+            return events, subscription.dropped
+
+        events, dropped = async_to_sync(run)()
+        self.assertEqual(events, [{'stock': 3}, {'stock': 4}])
+        self.assertEqual(dropped, 3)
+
+    def test_unsubscribe(self):
+        async def run():
+            hub = StockHub()
+            subscription = hub.subscribe(1)
+            hub.unsubscribe(subscription)
+            return hub.has_subscribers(1), hub.publish(1, {})
+
+        self.assertEqual(async_to_sync(run)(), (False, 0))
+
+
+class StockStreamTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category')
+        self.product = Product.objects.create(
+            name='Test Product', category=self.category, price=100, stock=10)
+        # closing would break the test transaction, the test client keeps
+        # request connections open the same way
+        patcher = mock.patch('shop.stream.close_old_connections')
+        self.close_old_connections = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream(self, path, on_body, headers=()):
+        messages = []
+
+        async def app(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': []})
+            await send({'type': 'http.response.body', 'body': b'django'})
+
+        async def run():
+            disconnected = asyncio.Event()
+            requests = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if requests:
+                    return requests.pop()
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if message['type'] == 'http.response.body':
+                    bodies = [m for m in messages
+                              if m['type'] == 'http.response.body']
+                    if not await sync_to_async(on_body)(len(bodies)):
+                        disconnected.set()
+
+            scope = {'type': 'http', 'method': 'GET', 'path': path,
+                     'headers': list(headers)}
+            await asyncio.wait_for(
+                with_stock_stream(app)(scope, receive, send), timeout=5)
+
+        async_to_sync(run)()
+        return messages
+
+    def test_streams_snapshot_and_stock_changes(self):
+        def on_body(count):
+            if count == 1:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.product.stock = 0
+                    self.product.save()
+            return count < 2
+
+        messages = self.stream(f'/product/{self.product.pk}/stream/', on_body)
+        self.assertEqual(dict(messages[0]['headers'])[b'content-type'],
+                         b'text/event-stream')
+        events = [json.loads(m['body'].decode().split('data: ')[1])
+                  for m in messages[1:]]
+        self.assertEqual(events, [
+            {'id': self.product.pk, 'stock': 10, 'is_available': True},
+            {'id': self.product.pk, 'stock': 0, 'is_available': False},
+        ])
+        self.assertFalse(hub.has_subscribers(self.product.pk))
+
+    def test_unknown_product(self):
+        messages = self.stream('/product/0/stream/', lambda count: False)
+        self.assertEqual(messages[0]['status'], 404)
+
+    def test_other_paths_reach_django(self):
+        messages = self.stream('/product/', lambda count: False)
+        self.assertEqual(messages[1]['body'], b'django')
+
+    def test_unavailable_products_are_hidden_from_customers(self):
+        self.product.stock = 0
+        self.product.save()
+        path = f'/product/{self.product.pk}/stream/'
+        messages = self.stream(path, lambda count: False)
+        self.assertEqual(messages[0]['status'], 404)
+
+        staff = User.objects.create_superuser(
+            email='admin@test.com', password='password123')
+        staff.is_staff = True
+        staff.save()
+        token = staff.tokens()['access']
+        messages = self.stream(path, lambda count: False, headers=[
+            (b'authorization', f'Bearer {token}'.encode())])
+        self.assertEqual(messages[0]['status'], 200)
+
+    def test_invalid_token(self):
+        messages = self.stream(
+            f'/product/{self.product.pk}/stream/', lambda count: False,
+            headers=[(b'authorization', b'Bearer invalid')])
+        self.assertEqual(messages[0]['status'], 401)
+
+    def test_connections_are_closed_around_the_load(self):
+        self.stream('/product/0/stream/', lambda count: False)
+        self.assertEqual(self.close_old_connections.call_count, 2)
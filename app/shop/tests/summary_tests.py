@@ -0,0 +1,152 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from shop.archive import archive_orders
+from shop import summaries
+from shop.models import (
+    ArchivedOrder, Category, Order, OrderItem, OrderSummary, Product,
+)
+from shop.serializers import ArchivedOrderSerializer, OrderSerializer
+from shop.summaries import forget_order_summary, order_summary
+
+User = get_user_model()
+
+
+class OrderSummaryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@email.com", password="testpass")
+        self.category = Category.objects.create(name="Electronics")
+        self.laptop = Product.objects.create(
+            name="Laptop", category=self.category, price=100, stock=100)
+        self.phone = Product.objects.create(
+            name="Phone", category=self.category, price=30, stock=100)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self, quantity=1, checked_out=True, days_ago=0):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(
+            order=order, product=self.laptop, quantity=quantity)
+        if checked_out:
+            order.check_out_order()
+        if days_ago:
+            created_at = timezone.now() - timedelta(days=days_ago)
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+            OrderItem.objects.filter(order=order).update(
+                order_created_at=created_at)
+        return order
+
+    def order_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, [q["sql"] for q in context.captured_queries
+                          if "shop_" in q["sql"]]
+
+    def test_summary(self):
+        self.order(quantity=3, days_ago=400)
+        archive_orders(timezone.now() - timedelta(days=365))
+        self.order(quantity=2)
+        open_order = self.order(quantity=1, checked_out=False)
+        last = self.order(quantity=1)
+
+        with override_settings(SHOP={"ORDER_SUMMARY_RECENT": 2}):
+            response = self.client.get("/user/order-summary/")
+        self.assertEqual(response.data["order_count"], 4)
+        # the open order is not spent yet, the archived one is
+        self.assertEqual(response.data["lifetime_spend"], 600)
+        recent = response.data["recent_orders"]
+        self.assertEqual([order["id"] for order in recent],
+                         [last.pk, open_order.pk])
+        self.assertEqual(response.data["last_order_at"],
+                         recent[0]["created_at"])
+
+    def test_first_history_page_is_served_from_the_summary(self):
+        orders = [self.order() for _ in range(12)]
+        self.order_queries("/user/order-history/")
+
+        response, queries = self.order_queries("/user/order-history/")
+        self.assertEqual(len(queries), 1)
+        self.assertIn("shop_ordersummary", queries[0])
+        self.assertEqual(response.data["count"], 12)
+        self.assertEqual(response.data["results"],
+                         OrderSerializer(orders[:10], many=True).data)
+        self.assertEqual(response.data["next"],
+                         "http://testserver/user/order-history/?page=2")
+        self.assertIsNone(response.data["previous"])
+
+        response, queries = self.order_queries(response.data["next"])
+        self.assertEqual([order["id"] for order in response.data["results"]],
+                         [order.pk for order in orders[10:]])
+        self.assertTrue(queries)
+
+    def test_summary_endpoint_shares_the_cached_summary(self):
+        self.order()
+        self.order_queries("/user/order-history/")
+        response, queries = self.order_queries("/user/order-summary/")
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data["order_count"], 1)
+
+    def test_item_writes_replace_the_summary(self):
+        order = self.order(checked_out=False)
+        self.assertEqual(order_summary(self.user, 10)["lifetime_spend"], 0)
+
+        item = OrderItem.objects.create(
+            order=order, product=self.phone, quantity=2)
+        history = order_summary(self.user, 10)["history"]
+        self.assertEqual(history["results"][0]["total_amount"], 160)
+        self.assertEqual(history["results"][0]["products"],
+                         [self.laptop.pk, self.phone.pk])
+
+        item.delete()
+        history = order_summary(self.user, 10)["history"]
+        self.assertEqual(history["results"][0]["total_amount"], 100)
+
+        order.check_out_order()
+        self.assertEqual(order_summary(self.user, 10)["lifetime_spend"], 100)
+
+        order.delete()
+        self.assertEqual(order_summary(self.user, 10)["order_count"], 0)
+
+    def test_summary_built_before_a_write_is_not_stored(self):
+        self.order()
+        build = summaries._build
+
+        def build_during_a_write(user, page_size):
+            summary = build(user, page_size)
+            # another worker writing the orders, committed meanwhile
+            forget_order_summary(user.pk)
+            return summary
+
+        with mock.patch.object(summaries, "_build", build_during_a_write):
+            order_summary(self.user, 10)
+        self.assertIsNone(OrderSummary.objects.get(user=self.user).summary)
+        order_summary(self.user, 10)
+        self.assertIsNotNone(OrderSummary.objects.get(user=self.user).summary)
+
+    def test_last_order_of_an_archived_history(self):
+        self.order(days_ago=400)
+        archive_orders(timezone.now() - timedelta(days=365))
+        response = self.client.get("/user/order-summary/")
+        self.assertEqual(response.data["order_count"], 1)
+        self.assertEqual(response.data["recent_orders"], [])
+        self.assertEqual(
+            response.data["last_order_at"],
+            ArchivedOrderSerializer(ArchivedOrder.objects.get()).data[
+                "created_at"])
+
+    def test_summaries_are_per_user(self):
+        self.order()
+        other = User.objects.create_user(
+            email="other@email.com", password="testpass")
+        self.client.force_authenticate(other)
+        response = self.client.get("/user/order-history/")
+        self.assertEqual((response.data["count"], response.data["results"]),
+                         (0, []))
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from shop.models import Task
+from shop.tasks import drain, run_pending, task
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task
+def explode(value):
+    calls.append(value)
+    Task.objects.create(name="written by a failing task")
+    raise RuntimeError(f"no {value}")
+
+
+def not_a_task():
+    pass
+
+
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_queued_tasks_in_order(self):
+        record.enqueue(1)
+        record.enqueue("two")
+        self.assertEqual(list(Task.objects.values_list("name", "args")), [
+            (record.task_name, [1]),
+            (record.task_name, ["two"]),
+        ])
+        self.assertEqual(calls, [])
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(calls, [1, "two"])
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(run_pending(), 0)
+
+    def test_rolled_back_writes_queue_nothing(self):
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            record.enqueue(1)
+            1 / 0
+        self.assertEqual(drain(), 0)
+
+    def test_batches(self):
+        for i in range(5):
+            record.enqueue(i)
+        self.assertEqual(run_pending(batch_size=2), 2)
+        self.assertEqual(drain(batch_size=2), 3)
+        self.assertEqual(calls, list(range(5)))
+
+    def test_only_named_tasks(self):
+        record.enqueue(1)
+        explode.enqueue(2)
+        self.assertEqual(drain(names=[record]), 1)
+        self.assertEqual(Task.objects.get().name, explode.task_name)
+
+    @override_settings(SHOP={"TASK_MAX_ATTEMPTS": 2,
+                             "TASK_RETRY_DELAY": 10})
+    def test_failures_are_retried_with_backoff(self):
+        explode.enqueue("luck")
+        record.enqueue(1)
+        with self.assertLogs("shop.tasks", level="WARNING"):
+            self.assertEqual(run_pending(), 2)
+        self.assertEqual(calls, ["luck", 1])
+        queued = Task.objects.get()
+        # its writes were rolled back, the other task's were kept
+        self.assertEqual(queued.name, explode.task_name)
+        self.assertEqual((queued.attempts, queued.last_error),
+                         (1, "RuntimeError: no luck"))
+        self.assertGreater(queued.run_at,
+                           timezone.now() + timedelta(seconds=9))
+        self.assertEqual(run_pending(), 0)
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs("shop.tasks", level="ERROR"):
+            self.assertEqual(run_pending(), 1)
+        queued.refresh_from_db()
+        self.assertEqual(queued.attempts, 2)
+        self.assertIsNotNone(queued.failed_at)
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 0)
+
+    def test_only_decorated_functions_run(self):
+        Task.objects.create(name=f"{__name__}.not_a_task")
+        with self.assertLogs("shop.tasks", level="WARNING"):
+            run_pending()
+        self.assertEqual(Task.objects.get().last_error,
+                         f"ValueError: {__name__}.not_a_task is not a task.")
+
+    def test_command(self):
+        record.enqueue(1)
+        out = StringIO()
+        call_command("run_tasks", "--once", stdout=out)
+        self.assertEqual(calls, [1])
+        self.assertIn("Ran 1 tasks.", out.getvalue())
@@ -1,12 +1,24 @@
-from rest_framework.test import APITestCase, APIClient
+import unittest
+from datetime import timedelta
+from io import StringIO
+
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from shop.models import Product, Category, Order, OrderItem
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from shop import changes
+from shop.inventory import compact, current_stock
+from shop.models import IdempotencyKey, Product, Category, Order, OrderItem
+from shop.tasks import drain
 
 User = get_user_model()
 
 
-class BaseViewSetTest(APITestCase):
+class ViewSetFixtures:
     def setUp(self):
         self.client = APIClient()
         self.admin_user = User.objects.create_superuser(
@@ -33,6 +45,10 @@ class BaseViewSetTest(APITestCase):
         self.client.force_authenticate(user=user)
 
 
+class BaseViewSetTest(ViewSetFixtures, APITestCase):
+    pass
+
+
 class ProductViewSetTest(BaseViewSetTest):
     def test_list_products(self):
         response = self.client.get('/product/')
@@ -95,6 +111,247 @@ class ProductViewSetTest(BaseViewSetTest):
         self.assertFalse(Product.objects.filter(id=self.product.id).exists())
 
 
+class ProductFilterFacetsTest(BaseViewSetTest):
+    def setUp(self):
+        super().setUp()
+        # catalog versions repeat once a test rolls back
+        cache.clear()
+        self.other_category = Category.objects.create(name='Other Category')
+        for price in (150, 400, 1000):
+            Product.objects.create(
+                name=f'Other {price}', category=self.other_category,
+                price=price, stock=3)
+        Product.objects.create(
+            name='Sold out', category=self.other_category, price=5000,
+            stock=0)
+
+    def test_filter_by_category_and_price(self):
+        response = self.client.get('/product/', {
+            'category': self.other_category.id,
+            'min_price': 200, 'max_price': 1000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [p['name'] for p in response.data['results']],
+            ['Other 1000', 'Other 400'])
+
+    def test_invalid_price_filter(self):
+        response = self.client.get('/product/', {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facets(self):
+        response = self.client.get('/product/facets/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(response.data['price'], {'min': 100, 'max': 1000})
+        self.assertEqual(
+            [(c['name'], c['count']) for c in response.data['categories']],
+            [('Other Category', 3), ('Test Category', 1)])
+        buckets = response.data['price_buckets']
+        self.assertEqual(sum(b['count'] for b in buckets), 4)
+        self.assertEqual(buckets[0]['min'], 100)
+        self.assertEqual(buckets[-1]['max'], 1000)
+
+    def test_facets_staff_see_unavailable(self):
+        self.authenticate(self.admin_user)
+        response = self.client.get('/product/facets/')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['in_stock'], 4)
+
+    def test_facets_follow_search(self):
+        response = self.client.get('/product/facets/', {'search': 'Other'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['categories']), 1)
+
+    def test_facets_cached_and_invalidated(self):
+        self.client.get('/product/facets/')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/product/facets/')
+        # only the catalog version is read
+        self.assertFalse([q for q in context.captured_queries
+                          if 'shop_product' in q['sql']
+                          and 'change_seq' not in q['sql']])
+
+        self.product.stock = 0
+        self.product.save()
+        response = self.client.get('/product/facets/')
+        self.assertEqual(response.data['count'], 3)
+
+    def test_facets_follow_changes_of_other_workers(self):
+        self.client.get('/product/facets/')
+        # a write that leaves this worker's cache alone
+        Product.objects.filter(pk=self.product.pk).update(price=20)
+        changes.record_change(self.product)
+        response = self.client.get('/product/facets/')
+        self.assertEqual(response.data['price']['min'], 20)
+
+
+class ProductBulkTest(BaseViewSetTest):
+    def setUp(self):
+        super().setUp()
+        self.other = Product.objects.create(
+            name='Other Product', category=self.category, price=50, stock=5)
+        self.sold_out = Product.objects.create(
+            name='Sold Out', category=self.category, price=20, stock=0)
+
+    def bulk(self, *ids):
+        response = self.client.get(
+            '/product/bulk/', {'ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['id'] for product in response.data]
+
+    def test_keeps_the_requested_order(self):
+        self.assertEqual(self.bulk(self.other.pk, 0, self.product.pk,
+                                   self.other.pk),
+                         [self.other.pk, self.product.pk])
+
+    def test_hides_unavailable_products_from_customers(self):
+        ids = (self.sold_out.pk, self.product.pk)
+        self.assertEqual(self.bulk(*ids), [self.product.pk])
+        self.authenticate(self.admin_user)
+        self.assertEqual(self.bulk(*ids), list(ids))
+
+    def test_one_query_with_the_live_stock(self):
+        self.other.stock_shards = 2
+        self.other.save()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/product/bulk/', {
+                'ids': f'{self.product.pk},{self.other.pk}'})
+        self.assertEqual(len([q for q in context.captured_queries
+                              if 'shop_' in q['sql']]), 1)
+        self.assertEqual([product['stock'] for product in response.data],
+                         [9, 5])
+
+    def test_stock_is_live(self):
+        self.bulk(self.product.pk)
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2)
+        compact()
+        response = self.client.get('/product/bulk/', {'ids': self.product.pk})
+        self.assertEqual(response.data[0]['stock'], 7)
+
+    def test_saved_product_is_refetched(self):
+        self.bulk(self.product.pk)
+        self.product.name = 'Renamed'
+        self.product.save()
+        response = self.client.get('/product/bulk/', {'ids': self.product.pk})
+        self.assertEqual(response.data[0]['name'], 'Renamed')
+
+    def test_invalid_ids(self):
+        response = self.client.get('/product/bulk/', {'ids': '1,a'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            '/product/bulk/', {'ids': ','.join(map(str, range(1, 102)))})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# the feed only reports committed changes on PostgreSQL
+class ProductChangeFeedTest(ViewSetFixtures, APITransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # the rows created by setUp are in the feed already
+        self.start = self.changes(0)['next']
+
+    def changes(self, since=None, **params):
+        if since is None:
+            since = self.start
+        response = self.client.get(
+            '/product/changes/', {'since': since, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_save_and_stock_signals_are_recorded(self):
+        self.product.name = 'Renamed'
+        self.product.save()
+        first = self.changes()
+        self.assertEqual([e['data']['name'] for e in first['results']],
+                         ['Renamed'])
+
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=2)
+        second = self.changes(first['next'])
+        self.assertEqual(len(second['results']), 1)
+        self.assertEqual(second['results'][0]['data']['stock'], 7)
+        self.assertGreater(int(second['next']), int(first['next']))
+        # compacting leaves the live stock as it was
+        compact()
+        self.assertEqual(self.changes(second['next'])['results'], [])
+
+    def test_sharded_stock_changes_are_recorded(self):
+        sharded = Product.objects.create(
+            name='Sharded', category=self.category, price=10, stock=10,
+            stock_shards=4)
+        start = self.changes()['next']
+
+        OrderItem.objects.create(order=self.order, product=sharded, quantity=2)
+        first = self.changes(start)
+        self.assertEqual([(e['data']['id'], e['data']['stock'])
+                          for e in first['results']], [(sharded.pk, 8)])
+
+        # more than any shard holds, taken from several
+        OrderItem.objects.create(order=self.order, product=sharded, quantity=4)
+        second = self.changes(first['next'])
+        self.assertEqual([e['data']['stock'] for e in second['results']], [4])
+        compact()
+        self.assertEqual(self.changes(second['next'])['results'], [])
+
+    def test_deletions_leave_tombstones(self):
+        product_id = self.product.id
+        self.product.delete()
+        results = self.changes()['results']
+        self.assertEqual(
+            results, [{'seq': results[0]['seq'], 'type': 'product',
+                       'action': 'delete', 'id': product_id}])
+
+    def test_paginated_by_sequence(self):
+        category = Category.objects.create(name='Feed Category')
+        for i in range(3):
+            Product.objects.create(
+                name=f'Feed {i}', category=category, price=10, stock=1)
+        page = self.changes(limit=2)
+        self.assertTrue(page['has_more'])
+        self.assertEqual([e['type'] for e in page['results']],
+                         ['category', 'product'])
+        rest = self.changes(page['next'], limit=2)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([e['data']['name'] for e in rest['results']],
+                         ['Feed 1', 'Feed 2'])
+
+    def test_unavailable_products_hidden_from_customers(self):
+        self.product.stock = 0
+        self.product.save()
+        self.assertEqual(self.changes()['results'][0]['action'], 'delete')
+        self.authenticate(self.admin_user)
+        self.assertEqual(self.changes()['results'][0]['action'], 'upsert')
+
+    def test_invalid_token(self):
+        response = self.client.get('/product/changes/', {'since': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_changes_are_stamped_in_the_writing_transaction(self):
+        before = Product.objects.get(pk=self.product.pk).change_seq
+        self.product.name = 'Renamed'
+        self.product.save()
+        # no commit needed
+        self.assertGreater(
+            Product.objects.get(pk=self.product.pk).change_seq, before)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql',
+                         'transaction ids are PostgreSQL only')
+    def test_running_transactions_hold_the_feed_back(self):
+        other = connection.get_new_connection(
+            connection.get_connection_params())
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('SELECT txid_current()')
+                first = cursor.fetchone()[0] << changes.COUNTER_BITS
+            # what the other transaction may still commit isn't reported
+            self.assertLessEqual(changes._horizon(), first)
+            other.commit()
+            self.assertGreater(changes._horizon(), first)
+        finally:
+            other.close()
+
+
 class CategoryViewSetTest(BaseViewSetTest):
     def test_list_categories(self):
         response = self.client.get('/category/')
@@ -184,6 +441,25 @@ class OrderViewSetTest(BaseViewSetTest):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 1)
 
+    def test_check_out_with_changed_prices(self):
+        self.authenticate(self.normal_user)
+        self.product.price = 120
+        self.product.save()
+        path = f'/order/{self.order.id}/check-outorder-history/'
+        response = self.client.post(path)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['total_amount'], 120)
+        self.assertEqual(self.client.post(path).status_code,
+                         status.HTTP_200_OK)
+
+    def test_order_history_returns_totals(self):
+        self.authenticate(self.normal_user)
+        response = self.client.get('/user/order-history/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order = response.data['results'][0]
+        self.assertEqual((order['total_amount'], order['item_count']),
+                         (100, 1))
+
     def test_create_order(self):
         self.authenticate(self.normal_user)
         data = {
@@ -223,3 +499,130 @@ class OrderViewSetTest(BaseViewSetTest):
         self.authenticate(other_user)
         response = self.client.delete(f'/order/{self.order.id}/')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SalesAnalyticsViewSetTest(BaseViewSetTest):
+    def setUp(self):
+        super().setUp()
+        self.order.check_out_order()
+        drain()
+
+    def test_staff_only(self):
+        self.authenticate(self.normal_user)
+        response = self.client.get('/analytics/top-products/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_top_products(self):
+        self.authenticate(self.admin_user)
+        response = self.client.get('/analytics/top-products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{
+            'product': self.product.id, 'name': 'Test Product',
+            'quantity': 1, 'revenue': 100}])
+
+    def test_category_revenue_reads_rollups_only(self):
+        self.authenticate(self.admin_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/analytics/category-revenue/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['revenue'], 100)
+        self.assertFalse([q for q in context.captured_queries
+                          if 'shop_orderitem' in q['sql']])
+
+    def test_invalid_date(self):
+        self.authenticate(self.admin_user)
+        response = self.client.get(
+            '/analytics/category-revenue/', {'start': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IdempotencyKeyTest(BaseViewSetTest):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.authenticate(self.normal_user)
+        self.data = {'order': self.order.id, 'product': self.product.id,
+                     'quantity': 2}
+
+    def post(self, path, data=None, key='retry-1'):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(path, data or {}, format='json', **headers)
+
+    def test_retried_create_is_replayed(self):
+        first = self.post('/orderitem/', self.data)
+        second = self.post('/orderitem/', self.data)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(OrderItem.objects.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(current_stock(self.product), 7)
+
+    def test_different_keys_are_separate_requests(self):
+        self.post('/orderitem/', self.data, key='a')
+        self.post('/orderitem/', self.data, key='b')
+        self.assertEqual(OrderItem.objects.count(), 3)
+
+    def test_key_reused_with_other_payload(self):
+        self.post('/orderitem/', self.data)
+        response = self.post('/orderitem/', {**self.data, 'quantity': 1})
+        self.assertEqual(response.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_concurrent_attempt_conflicts(self):
+        # without a commit the first attempt still holds the key
+        self.client.post('/order/', {}, HTTP_IDEMPOTENCY_KEY='retry-1')
+        response = self.client.post(
+            '/order/', {}, HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_retried_check_out_is_replayed(self):
+        path = f'/order/{self.order.id}/check-outorder-history/'
+        self.assertEqual(self.post(path).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.post(path).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.post(path, key=None).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_first_attempt_only_claims_the_key(self):
+        with CaptureQueriesContext(connection) as without_key:
+            self.post('/order/', key=None)
+        with CaptureQueriesContext(connection) as with_key:
+            self.post('/order/')
+        claims = [q['sql'].split()[0] for q in with_key
+                  if 'shop_idempotencykey' in q['sql']]
+        self.assertEqual(claims, ['INSERT', 'UPDATE'])
+        self.assertEqual(
+            len([q for q in with_key if 'SAVEPOINT' not in q['sql']]),
+            len([q for q in without_key if 'SAVEPOINT' not in q['sql']])
+            + len(claims))
+
+    def test_retry_in_another_worker_is_replayed(self):
+        first = self.post('/orderitem/', self.data)
+        # the cache of another worker
+        cache.clear()
+        second = self.post('/orderitem/', self.data)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(OrderItem.objects.count(), 2)
+        cache.clear()
+        response = self.post('/orderitem/', {**self.data, 'quantity': 1})
+        self.assertEqual(response.status_code,
+                         status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_expired_keys_run_again(self):
+        self.post('/orderitem/', self.data)
+        cache.clear()
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.post('/orderitem/', self.data).status_code,
+                         status.HTTP_201_CREATED)
+        self.assertEqual(OrderItem.objects.count(), 3)
+        self.post('/orderitem/', self.data, key='retry-2')
+        IdempotencyKey.objects.update(
+            created_at=timezone.now() - timedelta(days=2))
+        call_command('prune_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
@@ -1,4 +1,12 @@
 from django.urls import path
+from shop.async_views import category_view, product_view
 from shop.views import ApiRoot, router
 
 urlpatterns = router.urls
+urlpatterns += [
+    path('async/product/', product_view, name='async-product-list'),
+    path('async/product/<int:pk>/', product_view, name='async-product-detail'),
+    path('async/category/', category_view, name='async-category-list'),
+    path('async/category/<int:pk>/', category_view,
+         name='async-category-detail'),
+]
@@ -3,9 +3,19 @@ from rest_framework import viewsets, pagination, filters, routers, generics, dec
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-
-
-from .models import Order, OrderItem, Product, Category
+from rest_framework.exceptions import ValidationError
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+
+from app.profiling import ProfilingMixin
+
+from .models import (
+    CatalogTombstone, Order, OrderItem, Product, Category,
+    DailyCategorySales, DailyProductSales,
+)
 from .serializers import (
     OrderItemSerializer,
     OrderSerializer,
@@ -13,7 +23,17 @@ from .serializers import (
     CategorySerializer,
 )
 
-from .permissions import IsOwnerOrAdmin
+from .autocomplete import autocomplete as autocomplete_index
+from .cache import catalog_key
+from .changes import changes_since
+from .conf import shop_settings
+from .deadlines import DeadlineMixin
+from .export import export_response, requested_format
+from .facets import compute_facets
+from .filters import ProductFilter
+from .idempotency import IdempotentCreateMixin, idempotent
+from .inventory import load_stock, with_live_stock
+from .permissions import IsOwnerOrAdmin, OwnedQuerysetMixin
 
 # Create your views here.
 
@@ -24,12 +44,14 @@ class StandardResultsSetPagination(pagination.PageNumberPagination):
     max_page_size = 100
 
 
-class ExtraUtilityMixin:
+class ExtraUtilityMixin(ProfilingMixin, DeadlineMixin):
     filter_backends = [filters.SearchFilter]
     pagination_class = StandardResultsSetPagination
+    # read-only actions anyone may call
+    public_actions = ["list", "retrieve"]
 
     def get_permissions(self):
-        if self.action in ["list", "retrieve"]:
+        if self.action in self.public_actions:
             self.permission_classes = [AllowAny]
         elif self.action in ["update", "partial_update", "destroy", "create"]:
             self.permission_classes = [IsAuthenticated, IsAdminUser]
@@ -40,6 +62,9 @@ class ExtraUtilityMixin:
 
 class ProductViewSet(ExtraUtilityMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
+    filter_backends = [filters.SearchFilter, ProductFilter]
+    public_actions = ["list", "retrieve", "facets", "changes", "bulk",
+                      "autocomplete", "related"]
 
     search_fields = ["name", "category__name"]
 
@@ -50,6 +75,113 @@ class ProductViewSet(ExtraUtilityMixin, viewsets.ModelViewSet):
         # normal users can only view products in stock
         return Product.available.all()
 
+    @decorators.action(detail=False, methods=["GET"])
+    def facets(self, request):
+        """Category counts and price ranges for the current search/filters."""
+        is_staff = request.user.is_staff or request.user.is_superuser
+        key = catalog_key(
+            'facets', is_staff, sorted(request.query_params.lists()))
+        data = cache.get(key)
+        if data is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            data = compute_facets(
+                queryset, shop_settings.FACETS_PRICE_BUCKETS)
+            cache.set(key, data, shop_settings.FACETS_CACHE_TIMEOUT)
+        return response.Response(data)
+
+    @decorators.action(detail=False, methods=["GET"])
+    def bulk(self, request):
+        """
+        Products by `?ids=3,1,2`, in that order. Ids that don't exist or are
+        hidden from the user are left out.
+        """
+        raw_ids = request.query_params.get("ids", "").split(",")
+        try:
+            ids = list(dict.fromkeys(
+                int(pk) for pk in raw_ids if pk.strip()))
+        except ValueError:
+            raise ValidationError({"ids": "Expected comma separated ids."})
+        if len(ids) > shop_settings.PRODUCT_BULK_MAX_IDS:
+            raise ValidationError({"ids": (
+                f"At most {shop_settings.PRODUCT_BULK_MAX_IDS} ids at once.")})
+
+        # the products and their live stock in one query
+        found = {product.pk: product for product in with_live_stock(
+            self.get_queryset().filter(pk__in=ids))}
+        products = [found[pk] for pk in ids if pk in found]
+        return response.Response(
+            self.get_serializer(products, many=True).data)
+
+    @decorators.action(detail=False, methods=["GET"])
+    def autocomplete(self, request):
+        """
+        Available products and categories with a word of their name starting
+        with `?q=`, served from the in-process prefix index.
+        """
+        try:
+            limit = int(request.query_params.get(
+                "limit", shop_settings.AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            raise ValidationError({"limit": "Expected a number."})
+        limit = max(1, min(limit, shop_settings.AUTOCOMPLETE_MAX_LIMIT))
+        matches = autocomplete_index.lookup(
+            request.query_params.get("q", ""), limit)
+        return response.Response([
+            {"type": kind, "id": pk, "name": name}
+            for kind, pk, name in matches
+        ])
+
+    @decorators.action(detail=True, methods=["GET"])
+    def related(self, request, pk=None):
+        """Products most often bought together with this one."""
+        # the precomputed neighbors only, the product itself isn't loaded
+        products = (self.get_queryset().filter(neighbor_of__product_id=pk)
+                    .order_by("neighbor_of__rank"))
+        return response.Response(
+            self.get_serializer(products, many=True).data)
+
+    @decorators.action(detail=False, methods=["GET"])
+    def changes(self, request):
+        """Products and categories changed after the `?since=` token."""
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = int(request.query_params.get(
+                "limit", shop_settings.CHANGES_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({"since": "Invalid change token."})
+        limit = max(1, min(limit, shop_settings.CHANGES_MAX_PAGE_SIZE))
+        is_staff = request.user.is_staff or request.user.is_superuser
+
+        # the live stock read with the rows, not from the shard cache
+        changes, has_more = changes_since(
+            since, limit, with_live_stock(Product.objects.all()),
+            Category.objects.prefetch_related("products"))
+
+        context = self.get_serializer_context()
+        load_stock([obj for _, _, obj in changes if isinstance(obj, Product)])
+        results = []
+        for seq, kind, obj in changes:
+            entry = {"seq": seq, "type": kind}
+            if isinstance(obj, CatalogTombstone) or (
+                    isinstance(obj, Product)
+                    and not (obj.is_available or is_staff)):
+                # hidden from customers like in /product/
+                entry.update(action="delete", id=getattr(
+                    obj, "object_id", obj.pk))
+            elif isinstance(obj, Product):
+                entry.update(action="upsert", data=ProductSerializer(
+                    obj, context=context).data)
+            else:
+                entry.update(action="upsert", data=CategorySerializer(
+                    obj, context=context).data)
+            results.append(entry)
+
+        return response.Response({
+            "next": str(changes[-1][0] if changes else since),
+            "has_more": has_more,
+            "results": results,
+        })
+
 
 class CategoryViewSet(ExtraUtilityMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
@@ -58,34 +190,53 @@ class CategoryViewSet(ExtraUtilityMixin, viewsets.ModelViewSet):
     search_fields = ["name"]
 
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+class OrderItemViewSet(ProfilingMixin, DeadlineMixin, OwnedQuerysetMixin,
+                       IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    owner_field = "order__user"
 
     def perform_create(self, serializer):
 
         return super().perform_create(serializer)
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ProfilingMixin, DeadlineMixin, OwnedQuerysetMixin,
+                   IdempotentCreateMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
 
     @decorators.action(detail=True, methods=["POST"], url_path='check-outorder-history')
+    @idempotent
     def check_out(self, request, *args, **kwargs):
         order = self.get_object()
 
         if not order.is_checked_out:
-            order.check_out_order()
+            result = order.check_out_order()
+            if result.changed_prices:
+                return response.Response({
+                    "detail": ("Prices changed, review the order and check "
+                               "out again."),
+                    "items": result.changed_prices,
+                    "total_amount": order.total_amount,
+                }, status=status.HTTP_409_CONFLICT)
             return response.Response(status=status.HTTP_200_OK)
         return response.Response({"detail": "Order is already checked out."}, status=status.HTTP_400_BAD_REQUEST)
 
+    @decorators.action(detail=False, methods=["GET"])
+    def export(self, request):
+        """Stream all orders with their items, `?type=csv` or `?type=jsonl`."""
+        return export_response(
+            self.get_queryset(), requested_format(request), "orders")
+
     def get_permissions(self):
         if self.action in ["create"]:
             self.permission_classes = [IsAuthenticated]
-        elif self.action in ["update", "partial_update", "destroy"]:
-            self.permission_classes = [IsOwnerOrAdmin]
-        elif self.action == "retrieve":
+        elif self.action == "export":
+            self.permission_classes = [IsAuthenticated, IsAdminUser]
+        elif self.action in ["update", "partial_update", "destroy",
+                             "retrieve"]:
             self.permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
         else:
             self.permission_classes = [IsAuthenticated]
@@ -94,11 +245,79 @@ class OrderViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-    def get_queryset(self):
-        if self.request.user.is_staff:
-            return Order.objects.all()
-        if self.request.user.is_authenticated:
-            return Order.objects.filter(user=self.request.user)
+
+class SalesAnalyticsViewSet(ProfilingMixin, DeadlineMixin, viewsets.ViewSet):
+    """
+    Staff sales analytics, read from the daily rollup tables only.
+    Both actions take `?start=` and `?end=` dates (YYYY-MM-DD).
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    default_days = 30
+    max_top_products = 500
+
+    def get_date_range(self, request, default_days):
+        end = self._parse_date(request, "end") or timezone.localdate()
+        start = self._parse_date(request, "start") or (
+            end - timedelta(days=default_days - 1))
+        return start, end
+
+    def _parse_date(self, request, name):
+        value = request.query_params.get(name)
+        if not value:
+            return None
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError({name: "Expected a date as YYYY-MM-DD."})
+        return date
+
+    @decorators.action(detail=False, methods=["GET"],
+                       url_path="category-revenue")
+    def category_revenue(self, request):
+        """Quantity and revenue per category per day."""
+        start, end = self.get_date_range(request, self.default_days)
+        rows = (
+            DailyCategorySales.objects
+            .filter(date__range=(start, end))
+            .order_by("date", "category__name")
+            .values("date", "category_id", "category__name",
+                    "quantity", "revenue")
+        )
+        return response.Response({
+            "start": start,
+            "end": end,
+            "results": [
+                {"date": row["date"], "category": row["category_id"],
+                 "name": row["category__name"], "quantity": row["quantity"],
+                 "revenue": row["revenue"]}
+                for row in rows
+            ],
+        })
+
+    @decorators.action(detail=False, methods=["GET"], url_path="top-products")
+    def top_products(self, request):
+        """Best selling products by revenue, this week by default."""
+        start, end = self.get_date_range(request, 7)
+        try:
+            limit = int(request.query_params.get("limit", 50))
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required."})
+        limit = max(1, min(limit, self.max_top_products))
+        rows = (
+            DailyProductSales.objects
+            .filter(date__range=(start, end))
+            .values("product_id", "product__name")
+            .annotate(quantity=Sum("quantity"), revenue=Sum("revenue"))
+            .order_by("-revenue", "product_id")[:limit]
+        )
+        return response.Response({
+            "start": start,
+            "end": end,
+            "results": [
+                {"product": row["product_id"], "name": row["product__name"],
+                 "quantity": row["quantity"], "revenue": row["revenue"]}
+                for row in rows
+            ],
+        })
 
 
 router = routers.DefaultRouter()
@@ -106,6 +325,7 @@ router.register(r"category", CategoryViewSet, basename="category")
 router.register(r"product", ProductViewSet, basename="product")
 router.register(r"orderitem", OrderItemViewSet, basename="orderitem")
 router.register(r"order", OrderViewSet, basename="order")
+router.register(r"analytics", SalesAnalyticsViewSet, basename="analytics")
 
 
 class ApiRoot(generics.GenericAPIView):